@@ -0,0 +1,191 @@
+"""
+Stand-in for Supabase storage, for benchmarks.
+
+FakeStorageClient answers the same calls SupabaseStorage makes on the
+Supabase client (list, download, create_signed_url), from objects held in memory.
+Signed URLs point at a local HTTP server that honours Range requests, so
+the real httpx streaming path is exercised. An optional delay before the
+first byte of every download plays the part of a distant storage region.
+
+Faults can be switched on to test how the server copes with a flaky
+storage endpoint, each with its own probability per call (see parse_faults):
+"error" answers 503, "stall" hangs for STALL_SECONDS, "cut" drops the
+connection halfway through a body and "jitter" adds up to that many
+seconds of extra delay.
+"""
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+_RANGE = re.compile(r"bytes=(\d+)-(\d*)")
+
+# How long a "stall" fault hangs: longer than any sane client deadline
+STALL_SECONDS = 60
+
+
+def parse_faults(text):
+    """"error=0.1,stall=0.02" -> {"error": 0.1, "stall": 0.02}."""
+    faults = {}
+    for part in (text or "").split(","):
+        if part.strip():
+            kind, _, value = part.partition("=")
+            faults[kind.strip()] = float(value)
+    return faults
+
+
+class Faults:
+    """Draws which fault, if any, hits a call; seeded so a run can be repeated."""
+
+    def __init__(self, faults=None, seed=0):
+        self.faults = dict(faults or {})
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def draw(self):
+        """(fault or None, extra delay in seconds) for one call."""
+        with self.lock:
+            delay = self.rng.uniform(0, self.faults.get("jitter", 0))
+            roll = self.rng.random()
+        for kind in ("error", "stall", "cut"):
+            chance = self.faults.get(kind, 0)
+            if roll < chance:
+                return kind, delay
+            roll -= chance
+        return None, delay
+
+    def before_call(self):
+        """Fault for a non-streaming call: raise, hang or just delay."""
+        fault, delay = self.draw()
+        time.sleep(delay)
+        if fault == "stall":
+            time.sleep(STALL_SECONDS)
+        if fault in ("error", "cut"):
+            raise ConnectionError("503 Service Unavailable (injected)")
+
+
+def make_objects(sizes, seed=0):
+    """{name: bytes} with one object per size; the content depends only on the seed."""
+    rng = random.Random(seed)
+    block = rng.randbytes(1024 * 1024)
+    objects = {}
+    for index, size in enumerate(sizes):
+        repeats, rest = divmod(size, len(block))
+        objects[f"bench_{index}_{size}.mp4"] = block * repeats + block[:rest]
+    return objects
+
+
+# ---------- HTTP side ----------
+class _ObjectHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        bucket_name, _, file_name = unquote(self.path.lstrip("/")).partition("/")
+        data = self.server.buckets.get(bucket_name, {}).get(file_name)
+        if data is None:
+            self.send_error(404)
+            return
+        fault, delay = self.server.faults.draw()
+        if self.server.latency or delay:
+            time.sleep(self.server.latency + delay)
+        if fault == "error":
+            self.send_error(503)
+            return
+        if fault == "stall":
+            time.sleep(STALL_SECONDS)
+
+        start, end = 0, len(data)
+        match = _RANGE.fullmatch(self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(len(data), int(match.group(2)) + 1) if match.group(2) else len(data)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+
+        view = memoryview(data)
+        if fault == "cut":
+            end = start + (end - start) // 2
+            self.close_connection = True
+        try:
+            for offset in range(start, end, 256 * 1024):
+                self.wfile.write(view[offset:min(end, offset + 256 * 1024)])
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up, e.g. on a stalled or hedged request
+
+    def log_message(self, format, *args):
+        pass
+
+
+# ---------- Supabase-shaped client ----------
+class _Bucket:
+    def __init__(self, client, bucket_name):
+        self.client = client
+        self.bucket_name = bucket_name
+
+    def _objects(self):
+        return self.client.buckets.get(self.bucket_name, {})
+
+    def list(self, path="", options=None):
+        self.client.faults.before_call()
+        options = options or {}
+        search = options.get("search", "")
+        names = sorted(name for name in self._objects() if search in name)
+        offset = options.get("offset", 0)
+        limit = options.get("limit", 100)
+        return [
+            {
+                "name": name,
+                "updated_at": "2024-01-01T00:00:00Z",
+                "metadata": {"size": len(self._objects()[name]), "eTag": f'"{name}"'},
+            }
+            for name in names[offset:offset + limit]
+        ]
+
+    def download(self, file_name):
+        self.client.faults.before_call()
+        return self._objects()[file_name]
+
+    def create_signed_url(self, file_name, expires_in):
+        url = f"{self.client.base_url}/{quote(self.bucket_name)}/{quote(file_name)}"
+        return {"signedURL": url}
+
+
+class _Storage:
+    def __init__(self, client):
+        self.client = client
+
+    def from_(self, bucket_name):
+        return _Bucket(self.client, bucket_name)
+
+
+class FakeStorageClient:
+    """Drop-in for the Supabase client as used by SupabaseStorage."""
+
+    def __init__(self, buckets, latency=0.0, host="127.0.0.1", faults=None, seed=0):
+        self.buckets = buckets  # bucket -> {file name: bytes}
+        self.storage = _Storage(self)
+        self.faults = Faults(faults, seed)  # change .faults.faults to turn faults on and off
+
+        self.http = ThreadingHTTPServer((host, 0), _ObjectHandler)
+        self.http.daemon_threads = True
+        self.http.buckets = buckets
+        self.http.latency = latency
+        self.http.faults = self.faults
+        self.base_url = f"http://{host}:{self.http.server_address[1]}"
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.http.shutdown()
+        self.http.server_close()
@@ -0,0 +1,143 @@
+"""
+Load test for the video server.
+
+Start the server in the mode you want to measure, e.g.
+
+    VIDEO_SERVER_MODE=threaded python Server.py
+    VIDEO_SERVER_MODE=async python Server.py
+
+then run the same load against each one and compare the reports:
+
+    python -m Benchmarks.Load_test --bucket movies --file clip.mp4 --clients 200 --idle 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+
+# ---------- Clients ----------
+async def idle_client(host, port, hold_seconds, results):
+    """Connect and say nothing, like a viewer on a stalled network."""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), 10)
+    except Exception:
+        results["idle_refused"] += 1
+        return
+    results["idle_connected"] += 1
+    try:
+        # A server that gives up on us early closes the socket before hold_seconds
+        data = await asyncio.wait_for(reader.read(1), hold_seconds)
+        if not data:
+            results["idle_dropped"] += 1
+    except asyncio.TimeoutError:
+        results["idle_held"] += 1
+    except Exception:
+        results["idle_dropped"] += 1
+    finally:
+        writer.close()
+
+
+async def download_client(host, port, bucket, file_name, results):
+    """Fetch one video and record time-to-first-byte and bytes received."""
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), 10)
+    except Exception:
+        results["failed"] += 1
+        return
+    try:
+        writer.write(f"GET {bucket} {file_name}".encode())
+        await writer.drain()
+
+        header = await reader.readexactly(16)
+        results["ttfb"].append(time.perf_counter() - start)
+        try:
+            size = int(header.decode().strip())
+        except ValueError:
+            results["failed"] += 1
+            return
+
+        received = 0
+        while received < size:
+            data = await reader.read(65536)
+            if not data:
+                break
+            received += len(data)
+        results["bytes"] += received
+        if received == size:
+            results["completed"] += 1
+        else:
+            results["failed"] += 1
+    except Exception:
+        results["failed"] += 1
+    finally:
+        writer.close()
+
+
+# ---------- Run ----------
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_load(args):
+    results = {
+        "idle_connected": 0, "idle_refused": 0, "idle_held": 0, "idle_dropped": 0,
+        "completed": 0, "failed": 0, "bytes": 0, "ttfb": [],
+    }
+
+    idle = [
+        asyncio.create_task(idle_client(args.host, args.port, args.hold, results))
+        for _ in range(args.idle)
+    ]
+    await asyncio.sleep(0.5)  # let the idle clients pile up first
+
+    start = time.perf_counter()
+    downloads = [
+        download_client(args.host, args.port, args.bucket, args.file, results)
+        for _ in range(args.clients)
+    ]
+    await asyncio.gather(*downloads)
+    elapsed = time.perf_counter() - start
+    await asyncio.gather(*idle)
+
+    results["elapsed"] = elapsed
+    return results
+
+
+def print_report(results):
+    ttfb = results["ttfb"]
+    mb = results["bytes"] / (1024 * 1024)
+    print("---------- Load test ----------")
+    print(f"Idle clients connected: {results['idle_connected']} "
+          f"(held {results['idle_held']}, dropped {results['idle_dropped']}, "
+          f"refused {results['idle_refused']})")
+    print(f"Downloads completed:    {results['completed']} (failed {results['failed']})")
+    print(f"Data received:          {mb:.1f} MB in {results['elapsed']:.2f}s "
+          f"({mb / max(results['elapsed'], 1e-9):.1f} MB/s)")
+    if ttfb:
+        print(f"Time to first byte:     p50 {percentile(ttfb, 50) * 1000:.1f} ms, "
+              f"p99 {percentile(ttfb, 99) * 1000:.1f} ms, "
+              f"mean {statistics.mean(ttfb) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a running video server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--file", required=True)
+    parser.add_argument("--clients", type=int, default=50, help="concurrent downloads")
+    parser.add_argument("--idle", type=int, default=500, help="idle connections held open")
+    parser.add_argument("--hold", type=float, default=5.0, help="seconds idle clients stay")
+    args = parser.parse_args()
+
+    print_report(asyncio.run(run_load(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+CPU cost of the server's send paths, measured in CPU seconds per GB sent over loopback.
+
+    python -m Benchmarks.Send_bench --size-mb 1024
+
+"slice" is the original loop (4 KB bytes slices and unchecked send()),
+"chunked" reads the file and uses sendall(), and "sendfile" is the path
+used for files served from the disk cache.
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+import Config
+
+
+# ---------- Receiver ----------
+def drain(port, ready):
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    srv.bind(("127.0.0.1", port))
+    srv.listen(1)
+    ready.set()
+    conn, _ = srv.accept()
+    while conn.recv(1024 * 1024):
+        pass
+    conn.close()
+    srv.close()
+
+
+# ---------- Send paths ----------
+def send_slices(sock, path):
+    with open(path, "rb") as f:
+        data = f.read()
+    for i in range(0, len(data), 4096):
+        sock.send(data[i:i + 4096])
+
+
+def send_chunked(sock, path):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(Config.STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            sock.sendall(chunk)
+
+
+def send_sendfile(sock, path):
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        sent = 0
+        while sent < size:
+            sent += sock.sendfile(f, sent, min(Config.SENDFILE_BLOCK, size - sent))
+
+
+METHODS = {"slice": send_slices, "chunked": send_chunked, "sendfile": send_sendfile}
+
+
+def measure(method, path, port):
+    ready = multiprocessing.Event()
+    receiver = multiprocessing.Process(target=drain, args=(port, ready))
+    receiver.start()
+    ready.wait()
+
+    sock = socket.create_connection(("127.0.0.1", port))
+    if Config.SEND_BUFFER_BYTES:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, Config.SEND_BUFFER_BYTES)
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    METHODS[method](sock, path)
+    sock.close()
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    receiver.join()
+    return cpu, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CPU per GB of the send paths.")
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--port", type=int, default=9998)
+    parser.add_argument("--methods", nargs="+", default=list(METHODS), choices=list(METHODS))
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(args.size_mb):
+            f.write(block)
+        path = f.name
+
+    try:
+        gb = args.size_mb / 1024
+        print("---------- Send paths ----------")
+        for method in args.methods:
+            cpu, wall = measure(method, path, args.port)
+            print(f"{method:>9}: {cpu / gb:6.2f} CPU s/GB, {args.size_mb / wall:8.1f} MB/s")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
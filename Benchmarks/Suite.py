@@ -0,0 +1,305 @@
+"""
+Reproducible end-to-end benchmark: the real server against fake storage.
+
+    python -m Benchmarks.Suite --mode async --clients 32 --requests 8
+    python -m Benchmarks.Suite --mode threaded --compare Benchmarks/results/<earlier>.json
+
+Server.start_server runs in a child process with a fresh disk cache. By
+default it reads from Benchmarks.Fake_storage through the Supabase backend,
+so the signed URL and HTTP download path is measured, behind the same
+deadlines, retries and circuit breaker as in production; --storage-faults
+makes that storage flaky on purpose. --backend memory or local serves the
+same objects from a MemoryStorage or from files in a temp directory
+through LocalStorage. N client threads each make persistent framed connections and download videos picked from a fixed mix
+of sizes with a seeded RNG, so every run requests the same sequence.
+
+Reported: throughput, p50/p99 time to first byte as the client sees it,
+the server's peak RSS (which includes the fake objects, held in the same
+process) and its CPU seconds per GB sent. Each run is saved
+as JSON under Benchmarks/results/ together with the commit it ran on.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from Benchmarks.Load_test import percentile
+
+BUCKET = "bench"
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Default size mix: mostly short clips, some episodes, the odd long video
+DEFAULT_SIZES = "256K:4,4M:3,32M:1"
+
+
+def parse_sizes(text):
+    """"256K:4,4M:1" -> [(262144, 4), (4194304, 1)]: size and relative weight."""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    mix = []
+    for part in text.split(","):
+        size, _, weight = part.strip().partition(":")
+        scale = units.get(size[-1].upper(), 1)
+        number = size[:-1] if scale != 1 else size
+        mix.append((int(float(number) * scale), int(weight or 1)))
+    return mix
+
+
+def _peak_rss_bytes(usage):
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+# ---------- Server process ----------
+def _server_main(host, port, mode, backend, sizes, seed, latency, faults, ready, stop, report):
+    from Benchmarks.Fake_storage import FakeStorageClient, make_objects, parse_faults
+    from Storage.Backend import set_backend
+    import Server
+
+    objects = make_objects(sizes, seed)
+    root = None
+    if backend == "memory":
+        from Storage.Memory_storage import MemoryStorage
+        set_backend(MemoryStorage({BUCKET: objects}))
+    elif backend == "local":
+        from Storage.Local_storage import LocalStorage
+        root = tempfile.mkdtemp(prefix="bench_storage_")
+        os.makedirs(os.path.join(root, BUCKET))
+        for name, data in objects.items():
+            with open(os.path.join(root, BUCKET, name), "wb") as f:
+                f.write(data)
+        objects = None
+        set_backend(LocalStorage(root))
+    else:
+        from Storage.Resilient import ResilientStorage
+        from Storage.Supabase_storage import SupabaseStorage
+        client = FakeStorageClient({BUCKET: objects}, latency, faults=parse_faults(faults), seed=seed)
+        set_backend(ResilientStorage(SupabaseStorage(client=client)))
+
+    threading.Thread(target=Server.start_server, args=(host, port, mode), daemon=True).start()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), 0.2).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+
+    # Measure the serving only, not the object generation above
+    base = resource.getrusage(resource.RUSAGE_SELF)
+    ready.set()
+    stop.wait()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    report.send({
+        "cpu_seconds": (usage.ru_utime - base.ru_utime) + (usage.ru_stime - base.ru_stime),
+        "peak_rss_bytes": _peak_rss_bytes(usage),
+    })
+    report.close()
+    if root:
+        shutil.rmtree(root, ignore_errors=True)
+    os._exit(0)  # the server thread has no clean stop
+
+
+# ---------- Clients ----------
+def client_worker(host, port, plan, results, lock):
+    """Download every file in plan, reusing one persistent connection like the player."""
+    from Ui.Connection_pool import ConnectionPool
+
+    pool = ConnectionPool(host, port, max_idle=1)
+    ttfb, received, completed, failed = [], 0, 0, 0
+    for file_name, size in plan:
+        start = time.perf_counter()
+        try:
+            header, body = pool.request(f"GET {BUCKET} {file_name}")
+            if body is None:
+                failed += 1
+                continue
+            got = len(body.recv(65536))
+            ttfb.append(time.perf_counter() - start)
+            while True:
+                data = body.recv(1024 * 1024)
+                if not data:
+                    break
+                got += len(data)
+            body.close()
+            received += got
+            if got == size:
+                completed += 1
+            else:
+                failed += 1
+        except (OSError, ConnectionError):
+            failed += 1
+    pool.close()
+
+    with lock:
+        results["ttfb"].extend(ttfb)
+        results["bytes"] += received
+        results["failed"] += failed
+        results["completed"] += completed
+
+
+def make_plan(files, clients, requests, seed):
+    """Per client, the (file, size) downloads it will make; same for every run with a seed."""
+    rng = random.Random(seed)
+    names = [name for name, _, _ in files]
+    weights = [weight for _, _, weight in files]
+    sizes = {name: size for name, size, _ in files}
+    return [
+        [(name, sizes[name]) for name in rng.choices(names, weights, k=requests)]
+        for _ in range(clients)
+    ]
+
+
+# ---------- Run ----------
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(args):
+    mix = parse_sizes(args.sizes)
+    sizes = [size for size, _ in mix]
+    files = [(f"bench_{i}_{size}.mp4", size, weight) for i, (size, weight) in enumerate(mix)]
+    plan = make_plan(files, args.clients, args.requests, args.seed)
+
+    cache_dir = tempfile.mkdtemp(prefix="bench_cache_")
+    os.environ["VIDEO_CACHE_DIR"] = cache_dir
+    os.environ.setdefault("VIDEO_LOG_LEVEL", "WARNING")
+
+    ctx = multiprocessing.get_context("spawn")
+    ready, stop = ctx.Event(), ctx.Event()
+    report_recv, report_send = ctx.Pipe(duplex=False)
+    server = ctx.Process(
+        target=_server_main,
+        args=(args.host, args.port, args.mode, args.backend, sizes, args.seed,
+              args.storage_latency_ms / 1000, args.storage_faults, ready, stop, report_send),
+    )
+    server.start()
+    if not ready.wait(30):
+        server.kill()
+        raise RuntimeError("server did not start")
+
+    results = {"completed": 0, "failed": 0, "bytes": 0, "ttfb": []}
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=client_worker, args=(args.host, args.port, p, results, lock))
+        for p in plan
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    server_usage = report_recv.recv() if report_recv.poll(10) else {}
+    server.join(5)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    gigabytes = results["bytes"] / 1024 ** 3
+    ttfb = results["ttfb"]
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "mode": args.mode, "backend": args.backend,
+            "clients": args.clients, "requests": args.requests,
+            "sizes": args.sizes, "seed": args.seed,
+            "storage_latency_ms": args.storage_latency_ms,
+            "storage_faults": args.storage_faults,
+        },
+        "completed": results["completed"],
+        "failed": results["failed"],
+        "bytes": results["bytes"],
+        "elapsed_seconds": elapsed,
+        "throughput_mb_s": results["bytes"] / 1024 ** 2 / max(elapsed, 1e-9),
+        "ttfb_p50_ms": percentile(ttfb, 50) * 1000,
+        "ttfb_p99_ms": percentile(ttfb, 99) * 1000,
+        "server_peak_rss_mb": server_usage.get("peak_rss_bytes", 0) / 1024 ** 2,
+        "server_cpu_seconds": server_usage.get("cpu_seconds", 0.0),
+        "server_cpu_s_per_gb": server_usage.get("cpu_seconds", 0.0) / gigabytes if gigabytes else 0.0,
+    }
+
+
+# ---------- Report ----------
+# (key, label, format, True when bigger is better)
+FIELDS = [
+    ("throughput_mb_s", "Throughput", "{:.1f} MB/s", True),
+    ("ttfb_p50_ms", "TTFB p50", "{:.2f} ms", False),
+    ("ttfb_p99_ms", "TTFB p99", "{:.2f} ms", False),
+    ("server_peak_rss_mb", "Server peak RSS", "{:.1f} MB", False),
+    ("server_cpu_s_per_gb", "Server CPU per GB", "{:.3f} s", False),
+]
+
+
+def print_report(result, baseline=None):
+    config = result["config"]
+    print("---------- Benchmark ----------")
+    print(f"Commit {result['commit']}, mode {config['mode']}, "
+          f"backend {config.get('backend', 'supabase')}, {config['clients']} clients "
+          f"x {config['requests']} requests, sizes {config['sizes']}")
+    print(f"Downloads completed:  {result['completed']} (failed {result['failed']}), "
+          f"{result['bytes'] / 1024 ** 2:.1f} MB in {result['elapsed_seconds']:.2f}s")
+    for key, label, fmt, higher_better in FIELDS:
+        line = f"{label + ':':<21} {fmt.format(result[key])}"
+        if baseline and baseline.get(key):
+            change = (result[key] - baseline[key]) / baseline[key] * 100
+            better = (change > 0) == higher_better
+            line += f"  ({change:+.1f}% vs {baseline.get('commit')}{'' if better else ' ⚠️'})"
+        print(line)
+
+
+def save_result(result, path=None):
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = result["timestamp"].replace(":", "")
+        config = result["config"]
+        name = f"{stamp}_{result['commit'] or 'nogit'}_{config['mode']}_{config['backend']}.json"
+        path = os.path.join(RESULTS_DIR, name)
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the server against fake storage.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=19999)
+    parser.add_argument("--mode", default="async", choices=["async", "threaded"])
+    parser.add_argument("--backend", default="supabase", choices=["supabase", "memory", "local"],
+                        help="storage the server reads from; supabase means the fake HTTP one")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=8, help="downloads per client")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="size:weight list, e.g. 256K:4,4M:1")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--storage-latency-ms", type=float, default=0.0,
+                        help="delay before the first byte of every storage download")
+    parser.add_argument("--storage-faults", default="",
+                        help="fault chances of the fake storage, e.g. error=0.05,stall=0.01,cut=0.02")
+    parser.add_argument("--output", help="where to save the JSON result")
+    parser.add_argument("--compare", help="earlier JSON result to compare against")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    print(f"Saved to {save_result(result, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import base64
+import bisect
+import threading
+import time
+
+
+def encode_cursor(name):
+    return base64.urlsafe_b64encode(name.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return base64.urlsafe_b64decode(padded.encode()).decode()
+
+
+# ---------- Bucket Index ----------
+class BucketIndex:
+    """
+    In-memory listing of every object in a bucket (name, size, mtime, version),
+    sorted by name so a page is a bisect plus a slice. Listings older than ttl
+    are still served while a background thread fetches a fresh one.
+    """
+
+    def __init__(self, lister, ttl):
+        self.lister = lister  # bucket -> list of {"name", "size", "mtime", "version"}
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.buckets = {}     # bucket -> {"names", "entries", "fetched_at"}
+        self.refreshing = set()
+        self.loading = {}     # bucket -> Event while the first listing is in flight
+
+    def _load(self, bucket_name):
+        items = self.lister(bucket_name)
+        if items is None:
+            return None
+        entries = {item["name"]: item for item in items}
+        snapshot = {
+            "names": sorted(entries),
+            "entries": entries,
+            "fetched_at": time.monotonic(),
+        }
+        with self.lock:
+            self.buckets[bucket_name] = snapshot
+        return snapshot
+
+    def _refresh(self, bucket_name):
+        try:
+            self._load(bucket_name)
+        finally:
+            with self.lock:
+                self.refreshing.discard(bucket_name)
+
+    def snapshot(self, bucket_name):
+        """Return the bucket's listing, fetching it only on first use."""
+        with self.lock:
+            snap = self.buckets.get(bucket_name)
+            if snap is not None:
+                stale = time.monotonic() - snap["fetched_at"] > self.ttl
+                if stale and bucket_name not in self.refreshing:
+                    self.refreshing.add(bucket_name)
+                    threading.Thread(
+                        target=self._refresh, args=(bucket_name,), daemon=True
+                    ).start()
+                return snap
+
+            # Cold bucket: one caller lists it, the rest wait for that result
+            event = self.loading.get(bucket_name)
+            leader = event is None
+            if leader:
+                event = self.loading[bucket_name] = threading.Event()
+
+        if not leader:
+            event.wait()
+            with self.lock:
+                return self.buckets.get(bucket_name)
+        try:
+            return self._load(bucket_name)
+        finally:
+            with self.lock:
+                self.loading.pop(bucket_name, None)
+            event.set()
+
+    def peek(self, bucket_name, name):
+        """Entry for one object if the bucket is already indexed, without any listing."""
+        with self.lock:
+            snap = self.buckets.get(bucket_name)
+        if snap is None:
+            return None
+        return snap["entries"].get(name)
+
+    def invalidate(self, bucket_name):
+        with self.lock:
+            self.buckets.pop(bucket_name, None)
+
+    def page(self, bucket_name, cursor=None, limit=100):
+        """
+        Return (items, next_cursor, total) for up to limit objects after cursor,
+        or None if the bucket can't be listed.
+        """
+        snap = self.snapshot(bucket_name)
+        if snap is None:
+            return None
+        names = snap["names"]
+        start = bisect.bisect_right(names, decode_cursor(cursor)) if cursor else 0
+        chosen = names[start:start + limit]
+        items = [snap["entries"][name] for name in chosen]
+        more = start + limit < len(names)
+        next_cursor = encode_cursor(chosen[-1]) if more and chosen else None
+        return items, next_cursor, len(names)
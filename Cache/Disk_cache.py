@@ -0,0 +1,337 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from Log import get_logger
+
+log = get_logger("cache")
+
+
+def make_key(bucket_name, file_name, version):
+    """Build the cache key for one version of a stored object."""
+    raw = f"{bucket_name}\0{file_name}\0{version}".encode()
+    return hashlib.sha256(raw).hexdigest()
+
+
+def head_key(key):
+    """Cache key for just the first bytes of an object, as stored by prefetching."""
+    return key + ".head"
+
+
+def sums_key(key, segment_size):
+    """Cache key for the checksums of an object cut into segment_size pieces."""
+    return f"{key}.sums{segment_size}"
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by someone else
+    return True
+
+
+# ---------- Disk Cache ----------
+class DiskCache:
+    """
+    Keeps downloaded videos on local disk, evicting least recently used files.
+
+    With shared=True several processes can use the same root: each picks up
+    files the others finished, partial downloads are named per process, and
+    eviction works from a directory scan under a file lock, so the size limit
+    holds for all of them together.
+    """
+
+    def __init__(self, root, max_bytes, shared=False):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> size, least recently used first
+        self.total_bytes = 0
+        self.pending = {}             # key -> _Fill for downloads in flight
+
+        os.makedirs(root, exist_ok=True)
+        self._load_existing()
+
+    def path_for(self, key):
+        return os.path.join(self.root, key + ".bin")
+
+    def _load_existing(self):
+        """Pick up files left by a previous run, oldest access first."""
+        found = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".part"):
+                # <key>.bin.<pid>[.<thread>].part, where the key itself may hold dots
+                # (".head", ".sums<N>"): leave other live processes' downloads alone
+                pid = entry.name[:-5].rpartition(".bin.")[2].split(".")[0]
+                if pid.isdigit() and int(pid) != os.getpid() and pid_alive(int(pid)):
+                    continue
+                # Interrupted download from a previous run
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+            elif entry.name.endswith(".bin"):
+                stat = entry.stat()
+                found.append((stat.st_atime, entry.name[:-4], stat.st_size))
+
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+        if self.shared:
+            self._evict_shared()
+        else:
+            self._evict()
+
+    def _evict(self, keep=None):
+        while self.total_bytes > self.max_bytes and self.entries:
+            key = next(iter(self.entries))
+            if key == keep:
+                if len(self.entries) == 1:
+                    break
+                self.entries.move_to_end(key)
+                continue
+            size = self.entries.pop(key)
+            self.total_bytes -= size
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+
+    def _evict_shared(self, keep=None):
+        """
+        Evict by what is really on disk, oldest access first, holding a lock
+        file so two processes don't both delete to make the same room. Then
+        adopt the scan as this process's view.
+        """
+        import fcntl
+
+        with open(os.path.join(self.root, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            found = []
+            for entry in os.scandir(self.root):
+                if entry.name.endswith(".bin"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    found.append((stat.st_atime, entry.name[:-4], stat.st_size))
+            found.sort()
+
+            total = sum(size for _, _, size in found)
+            kept = []
+            for atime, key, size in found:
+                if total > self.max_bytes and key != keep:
+                    try:
+                        os.remove(self.path_for(key))
+                    except OSError:
+                        pass
+                    total -= size
+                else:
+                    kept.append((key, size))
+
+        with self.lock:
+            self.entries = OrderedDict(kept)
+            self.total_bytes = total
+
+    def get(self, key):
+        """Return the cached file path for key, or None on a miss."""
+        with self.lock:
+            known = key in self.entries
+            if known:
+                self.entries.move_to_end(key)
+        path = self.path_for(key)
+        if not known:
+            if not self.shared:
+                return None
+            # Another process may have finished this download
+            try:
+                size = os.stat(path).st_size
+            except OSError:
+                return None
+            with self.lock:
+                if key not in self.entries:
+                    self.entries[key] = size
+                    self.total_bytes += size
+        try:
+            os.utime(path)  # keep LRU order across restarts
+        except OSError:
+            pass
+        return path
+
+    def stream(self, key, size, open_upstream, chunk_size=64 * 1024):
+        """
+        Yield the object's bytes, from disk on a hit. On a miss, open_upstream()
+        is called once to fill the cache in the background, and every concurrent
+        reader tails the partially written file instead of downloading again.
+        """
+        path = self.get(key)
+        if path:
+            try:
+                return FileRange(path, 0, size, chunk_size)
+            except OSError:
+                pass  # evicted since get(); fetch it again
+
+        with self.lock:
+            fill = self.pending.get(key)
+            if fill is None:
+                fill = _Fill(self.path_for(key), size)
+                self.pending[key] = fill
+                threading.Thread(
+                    target=self._fill, args=(key, fill, open_upstream), daemon=True
+                ).start()
+        return _tail(fill, chunk_size)
+
+    def read_range(self, key, offset, length, chunk_size=64 * 1024):
+        """
+        Yield length bytes starting at offset if they are already on disk: in
+        a finished file, the covered part of a running fill, or a prefetched
+        head. Returns None when the range has to come from storage.
+        """
+        path = self.get(key)
+        if path:
+            try:
+                return FileRange(path, offset, length, chunk_size)
+            except OSError:
+                pass
+
+        with self.lock:
+            fill = self.pending.get(key)
+        if fill is not None and fill.written >= offset + length:
+            return _tail(fill, chunk_size, offset, length)
+
+        # A prefetched head covers ranges near the start
+        path = self.get(head_key(key))
+        if path:
+            try:
+                if os.path.getsize(path) >= offset + length:
+                    return FileRange(path, offset, length, chunk_size)
+            except OSError:
+                pass
+        return None
+
+    def _fill(self, key, fill, open_upstream):
+        try:
+            with open(fill.part, "wb") as f:
+                for chunk in open_upstream():
+                    f.write(chunk)
+                    f.flush()
+                    with fill.cond:
+                        fill.written += len(chunk)
+                        fill.cond.notify_all()
+            if fill.written != fill.size:
+                raise IOError(f"expected {fill.size} bytes, got {fill.written}")
+
+            with fill.cond:
+                os.replace(fill.part, fill.path)
+                fill.done = True
+                fill.cond.notify_all()
+            self._add(key, fill.size)
+        except Exception as err:
+            log.error("❌ Cache fill failed for %s: %s", key[:12], err)
+            with fill.cond:
+                fill.failed = True
+                fill.cond.notify_all()
+            try:
+                os.remove(fill.part)
+            except OSError:
+                pass
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def _add(self, key, size):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old
+            self.entries[key] = size
+            self.total_bytes += size
+            if not self.shared:
+                self._evict(keep=key)
+        if self.shared:
+            self._evict_shared(keep=key)
+
+    def put(self, key, data):
+        """Store data under key and return its file path."""
+        path = self.path_for(key)
+        part = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(part, "wb") as f:
+            f.write(data)
+        os.replace(part, path)
+        self._add(key, len(data))
+        return path
+
+
+# ---------- Readers ----------
+class _Fill:
+    """State of one object being downloaded into the cache."""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.part = f"{path}.{os.getpid()}.part"
+        self.size = size
+        self.written = 0
+        self.done = False
+        self.failed = False
+        self.cond = threading.Condition()
+
+
+class FileRange:
+    """
+    A byte range of a finished cache file. Iterating yields chunks; senders
+    that can hand the open file to sendfile() use file/offset/length instead.
+    The file is opened up front so a later eviction can't pull it away.
+    """
+
+    def __init__(self, path, offset, length, chunk_size=64 * 1024):
+        self.file = open(path, "rb")
+        self.offset = offset
+        self.length = length
+        self.chunk_size = chunk_size
+        self.remaining = length
+        self.file.seek(offset)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.remaining <= 0:
+            raise StopIteration
+        chunk = self.file.read(min(self.chunk_size, self.remaining))
+        if not chunk:
+            raise StopIteration
+        self.remaining -= len(chunk)
+        return chunk
+
+    def close(self):
+        self.file.close()
+
+
+def _tail(fill, chunk_size, offset=0, length=None):
+    """Follow a file that is still being written by a cache fill."""
+    with fill.cond:
+        while not os.path.exists(fill.part) and not fill.done and not fill.failed:
+            fill.cond.wait(0.05)
+        if fill.failed:
+            raise IOError("upstream download failed")
+        f = open(fill.path if fill.done else fill.part, "rb")
+
+    end = fill.size if length is None else offset + length
+    with f:
+        f.seek(offset)
+        while offset < end:
+            with fill.cond:
+                while fill.written <= offset and not fill.done and not fill.failed:
+                    fill.cond.wait()
+                if fill.written <= offset:
+                    raise IOError("upstream download failed")
+                available = fill.written - offset
+            chunk = f.read(min(chunk_size, available, end - offset))
+            if not chunk:
+                raise IOError("cache file truncated")
+            offset += len(chunk)
+            yield chunk
@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from Log import get_logger
+from Throttle import TokenBucket
+
+log = get_logger("prefetch")
+
+
+# ---------- Prefetcher ----------
+class Prefetcher:
+    """
+    Warms the cache with the start of videos clients are likely to play next.
+
+    One background thread works through the queue, newest request first,
+    reading from storage at no more than rate bytes per second. It waits
+    while any client is waiting on storage itself (see foreground), so
+    prefetching never competes with a real stream.
+    """
+
+    def __init__(self, warm, rate, max_queued=256):
+        self.warm = warm  # (bucket, file, throttle) -> None; throttle(n) before using n bytes
+        self.limiter = TokenBucket(rate)
+        self.max_queued = max_queued
+        self.queue = OrderedDict()  # (bucket, file) -> None, oldest first
+        self.busy = 0               # client reads from storage in flight
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def enqueue(self, bucket_name, file_name):
+        with self.cond:
+            key = (bucket_name, file_name)
+            self.queue.pop(key, None)
+            self.queue[key] = None
+            while len(self.queue) > self.max_queued:
+                self.queue.popitem(last=False)  # the oldest requests are least likely to matter
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+                self.thread.start()
+            self.cond.notify_all()
+
+    @contextmanager
+    def foreground(self):
+        """Held around each read a client request makes from storage; prefetching pauses meanwhile."""
+        with self.cond:
+            self.busy += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.busy -= 1
+                self.cond.notify_all()
+
+    def _wait_idle(self):
+        with self.cond:
+            while self.busy:
+                self.cond.wait()
+
+    def throttle(self, amount):
+        self._wait_idle()
+        self.limiter.take(amount)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                (bucket_name, file_name), _ = self.queue.popitem(last=True)
+            try:
+                self.warm(bucket_name, file_name, self.throttle)
+            except Exception as err:
+                log.warning("⚠️ Prefetch of '%s' failed: %s", file_name, err)
@@ -2,10 +2,8 @@ import sys
 from PyQt5.QtWidgets import QApplication
 from Ui.Login import AuthWindow
 from Ui.Dashboard import DashboardWindow
-from Database.Sqlite_db import create_table
 
 if __name__ == "__main__":
-    create_table()
     app = QApplication(sys.argv)
 
     login_window = AuthWindow()
@@ -0,0 +1,274 @@
+import os
+
+# ---------- Server-side video cache ----------
+# Directory where downloaded videos are kept between requests
+CACHE_DIR = os.environ.get("VIDEO_CACHE_DIR", "video_cache")
+
+# Total bytes the cache may use before least recently used videos are evicted
+CACHE_MAX_BYTES = int(os.environ.get("VIDEO_CACHE_MAX_BYTES", 10 * 1024 ** 3))
+
+# Seconds an object's ETag / updated_at is trusted before asking storage again
+CACHE_INFO_TTL = float(os.environ.get("VIDEO_CACHE_INFO_TTL", 30))
+
+# Set when several server processes share CACHE_DIR; the multi mode sets it for its workers
+CACHE_SHARED = os.environ.get("VIDEO_CACHE_SHARED", "0") == "1"
+
+# Threads working out CHECKSUMS of videos in the background
+CHECKSUM_WORKERS = int(os.environ.get("VIDEO_CHECKSUM_WORKERS", 2))
+
+# ---------- Streaming ----------
+# Size of each chunk read from storage and written to the client
+STREAM_CHUNK_SIZE = int(os.environ.get("VIDEO_STREAM_CHUNK_SIZE", 64 * 1024))
+
+# Chunks buffered between storage and a slow client before storage reads pause
+STREAM_QUEUE_CHUNKS = int(os.environ.get("VIDEO_STREAM_QUEUE_CHUNKS", 16))
+
+# Lifetime of the signed URL used to stream an object out of storage
+SIGNED_URL_EXPIRES = int(os.environ.get("VIDEO_SIGNED_URL_EXPIRES", 300))
+
+# ---------- Server engine ----------
+# "threaded" starts one thread per client, "async" serves every client from one event loop,
+# "multi" runs several async worker processes sharing the port (Linux/BSD SO_REUSEPORT)
+SERVER_MODE = os.environ.get("VIDEO_SERVER_MODE", "async")
+
+# Pending connections the OS queues before accept()
+LISTEN_BACKLOG = int(os.environ.get("VIDEO_LISTEN_BACKLOG", 1024))
+
+# Clients served at once (async mode); extra clients get a busy error
+MAX_CONNECTIONS = int(os.environ.get("VIDEO_MAX_CONNECTIONS", 10000))
+
+# Seconds a client may take to send its request line
+REQUEST_TIMEOUT = float(os.environ.get("VIDEO_REQUEST_TIMEOUT", 15))
+
+# Seconds a client may stall while we wait for its socket to accept more data
+WRITE_TIMEOUT = float(os.environ.get("VIDEO_WRITE_TIMEOUT", 60))
+
+# Seconds active transfers get to finish after shutdown is requested
+SHUTDOWN_GRACE = float(os.environ.get("VIDEO_SHUTDOWN_GRACE", 10))
+
+# Threads used for blocking storage and disk reads in async mode
+ASYNC_IO_THREADS = int(os.environ.get("VIDEO_ASYNC_IO_THREADS", 64))
+
+# Worker processes in "multi" mode, each an async server on the same port; 0 means one per CPU
+WORKERS = int(os.environ.get("VIDEO_WORKERS", 0))
+
+# ---------- Client playback ----------
+# Bytes fetched before VLC starts, roughly a few seconds of typical video
+PREBUFFER_BYTES = int(os.environ.get("VIDEO_PREBUFFER_BYTES", 2 * 1024 * 1024))
+
+# Milliseconds of media VLC buffers from the local proxy before it starts playing
+PLAYER_NETWORK_CACHING_MS = int(os.environ.get("VIDEO_PLAYER_NETWORK_CACHING_MS", 1500))
+
+# Catalog rows the Dashboard loads per page as the list is scrolled
+CATALOG_PAGE_SIZE = int(os.environ.get("VIDEO_CATALOG_PAGE_SIZE", 200))
+
+# Milliseconds between the Dashboard's checks for catalog changes made elsewhere
+CATALOG_REFRESH_MS = int(os.environ.get("VIDEO_CATALOG_REFRESH_MS", 10000))
+
+# ---------- Send path ----------
+# Kernel send buffer per client socket (SO_SNDBUF); 0 keeps the OS default
+SEND_BUFFER_BYTES = int(os.environ.get("VIDEO_SEND_BUFFER_BYTES", 1024 * 1024))
+
+# Bytes handed to one sendfile() call when serving cached files
+SENDFILE_BLOCK = int(os.environ.get("VIDEO_SENDFILE_BLOCK", 8 * 1024 * 1024))
+
+# ---------- Client cache ----------
+# Where the client keeps bytes of videos it has already received
+CLIENT_CACHE_DIR = os.environ.get(
+    "VIDEO_CLIENT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".a_server_cache")
+)
+
+# Total bytes the client cache may use before least recently used videos are evicted
+CLIENT_CACHE_MAX_BYTES = int(os.environ.get("VIDEO_CLIENT_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+
+# Videos are cached and verified in segments of this many bytes
+CLIENT_SEGMENT_SIZE = int(os.environ.get("VIDEO_CLIENT_SEGMENT_SIZE", 1024 * 1024))
+
+# Times a whole-video download reconnects after the connection drops without progress
+CLIENT_DOWNLOAD_RETRIES = int(os.environ.get("VIDEO_CLIENT_DOWNLOAD_RETRIES", 5))
+
+# Seconds a download waits, once its bytes are in, for checksums the server is still working out
+CLIENT_CHECKSUM_WAIT = float(os.environ.get("VIDEO_CLIENT_CHECKSUM_WAIT", 300))
+
+# ---------- Persistent connections ----------
+# Seconds a framed connection may sit between requests before the server closes it
+IDLE_TIMEOUT = float(os.environ.get("VIDEO_IDLE_TIMEOUT", 300))
+
+# Idle connections each client keeps open to the server
+CLIENT_POOL_SIZE = int(os.environ.get("VIDEO_CLIENT_POOL_SIZE", 4))
+
+# Seconds the client waits on a silent server before giving up on a connection
+CLIENT_TIMEOUT = float(os.environ.get("VIDEO_CLIENT_TIMEOUT", 30))
+
+# ---------- Bucket listings ----------
+# Seconds a bucket listing is served before it is refreshed in the background
+LIST_INDEX_TTL = float(os.environ.get("VIDEO_LIST_INDEX_TTL", 60))
+
+# Objects fetched per storage list() call while building a listing
+LIST_FETCH_BATCH = int(os.environ.get("VIDEO_LIST_FETCH_BATCH", 1000))
+
+# Default and largest page a LIST request can ask for
+LIST_PAGE_SIZE = int(os.environ.get("VIDEO_LIST_PAGE_SIZE", 100))
+LIST_MAX_PAGE_SIZE = int(os.environ.get("VIDEO_LIST_MAX_PAGE_SIZE", 1000))
+
+# ---------- Database ----------
+# SQLite file holding users and the video catalog
+DB_PATH = os.environ.get("VIDEO_DB_PATH", "users.db")
+
+# Catalog answers (pages, searches, lookups) the server keeps in memory
+CATALOG_CACHE_ENTRIES = int(os.environ.get("VIDEO_CATALOG_CACHE_ENTRIES", 4096))
+
+# Seconds between checks for catalog writes from other processes; the cache is dropped on any
+CATALOG_VERSION_CHECK = float(os.environ.get("VIDEO_CATALOG_VERSION_CHECK", 1.0))
+
+# Catalog changes kept for clients catching up; one further behind reloads the bucket
+CATALOG_CHANGES_KEPT = int(os.environ.get("VIDEO_CATALOG_CHANGES_KEPT", 100000))
+
+# ---------- Observability ----------
+# DEBUG logs every request; INFO, WARNING, ERROR or OFF keep the hot path quiet
+LOG_LEVEL = os.environ.get("VIDEO_LOG_LEVEL", "INFO")
+
+# Local port serving Prometheus text at /metrics; 0 leaves only the STATS command
+METRICS_HOST = os.environ.get("VIDEO_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("VIDEO_METRICS_PORT", 0))
+
+# ---------- Storage ----------
+# Where videos are read from: "supabase", "local" (a directory per bucket) or "memory"
+STORAGE_BACKEND = os.environ.get("VIDEO_STORAGE_BACKEND", "supabase")
+
+# Root of the local backend; bucket "movies" is the directory <root>/movies
+STORAGE_ROOT = os.environ.get("VIDEO_STORAGE_ROOT", "storage")
+
+# ---------- Upstream resilience ----------
+# Seconds a remote storage call (stat, listing, first byte of a read) may take before it is given up
+STORAGE_TIMEOUT = float(os.environ.get("VIDEO_STORAGE_TIMEOUT", 10))
+
+# Seconds a read may go without delivering its next chunk
+STORAGE_STALL_TIMEOUT = float(os.environ.get("VIDEO_STORAGE_STALL_TIMEOUT", 15))
+
+# Times a failed call is tried again, after a random wait of up to STORAGE_RETRY_BASE * 2^n seconds
+STORAGE_RETRIES = int(os.environ.get("VIDEO_STORAGE_RETRIES", 3))
+STORAGE_RETRY_BASE = float(os.environ.get("VIDEO_STORAGE_RETRY_BASE", 0.1))
+
+# Seconds before a duplicate request for a slow stat or first byte, until recent latencies
+# are known (then their 95th percentile); 0 never sends duplicates
+STORAGE_HEDGE_AFTER = float(os.environ.get("VIDEO_STORAGE_HEDGE_AFTER", 0.5))
+
+# Failures in a row that make the server stop calling storage, and for how many seconds
+STORAGE_BREAKER_FAILURES = int(os.environ.get("VIDEO_STORAGE_BREAKER_FAILURES", 5))
+STORAGE_BREAKER_COOLDOWN = float(os.environ.get("VIDEO_STORAGE_BREAKER_COOLDOWN", 10))
+
+# Threads running storage calls; a call that outlives its deadline keeps one until it returns
+STORAGE_CALL_THREADS = int(os.environ.get("VIDEO_STORAGE_CALL_THREADS", 64))
+
+# ---------- Adaptive bitrate ----------
+# Directory holding the HLS renditions cut from each stored video
+RENDITION_DIR = os.environ.get("VIDEO_RENDITION_DIR", "renditions")
+
+# Rendition ladder as height:video kbit/s; rungs taller than the source are skipped
+RENDITION_LADDER = os.environ.get("VIDEO_RENDITION_LADDER", "1080:5000,720:2800,480:1400,360:800")
+
+# Seconds per segment; the player can switch rendition at every segment boundary
+SEGMENT_SECONDS = int(os.environ.get("VIDEO_SEGMENT_SECONDS", 4))
+
+# ffmpeg binary used for packaging; without it videos are only served as uploaded
+FFMPEG_PATH = os.environ.get("VIDEO_FFMPEG_PATH", "ffmpeg")
+
+# Videos packaged at once per server process
+PACKAGE_WORKERS = int(os.environ.get("VIDEO_PACKAGE_WORKERS", 1))
+
+# Seconds before a packaging marker is taken over even though its owner process looks alive
+PACKAGE_MARKER_TTL = float(os.environ.get("VIDEO_PACKAGE_MARKER_TTL", 3600))
+
+# Share of the measured throughput a rendition's bitrate may use before the player steps down
+ABR_SAFETY = float(os.environ.get("VIDEO_ABR_SAFETY", 0.8))
+
+# ---------- Uploads ----------
+# Directory where uploads are staged until every part has arrived; on the storage root's
+# filesystem, the local backend moves a finished upload into place without copying it
+UPLOAD_DIR = os.environ.get("VIDEO_UPLOAD_DIR", "uploads")
+
+# Bytes per upload part: the unit that is hashed, retried and resumed
+UPLOAD_PART_SIZE = int(os.environ.get("VIDEO_UPLOAD_PART_SIZE", 8 * 1024 * 1024))
+
+# Seconds an unfinished upload is kept for its client to come back and resume it
+UPLOAD_TTL = float(os.environ.get("VIDEO_UPLOAD_TTL", 24 * 3600))
+
+# Parts a client sends at once, each on its own pooled connection
+UPLOAD_PARALLEL = int(os.environ.get("VIDEO_UPLOAD_PARALLEL", 4))
+
+# ---------- Prefetch ----------
+# Titles at the top of a bucket or search the server warms when a client asks
+PREFETCH_TOP_N = int(os.environ.get("VIDEO_PREFETCH_TOP_N", 5))
+
+# Bytes from the start of each title the server keeps warm; a few seconds of video
+PREFETCH_HEAD_BYTES = int(os.environ.get("VIDEO_PREFETCH_HEAD_BYTES", 4 * 1024 * 1024))
+
+# Bytes per second prefetching may read from storage; 0 means no cap
+PREFETCH_RATE = int(os.environ.get("VIDEO_PREFETCH_RATE", 8 * 1024 * 1024))
+
+# Videos on each side of the playing one whose first seconds the client fetches ahead
+CLIENT_PREFETCH_NEIGHBOURS = int(os.environ.get("VIDEO_CLIENT_PREFETCH_NEIGHBOURS", 1))
+
+# Bytes per second the client spends on those speculative fetches; 0 means no cap
+CLIENT_PREFETCH_RATE = int(os.environ.get("VIDEO_CLIENT_PREFETCH_RATE", 2 * 1024 * 1024))
+
+# ---------- Bandwidth shaping ----------
+# Bytes per second the whole server, each connection and each user (client address) may
+# send; 0 means no limit. Changes to SHAPE_LIMITS_FILE apply while the server runs.
+SHAPE_GLOBAL_RATE = int(os.environ.get("VIDEO_SHAPE_GLOBAL_RATE", 0))
+SHAPE_CONNECTION_RATE = int(os.environ.get("VIDEO_SHAPE_CONNECTION_RATE", 0))
+SHAPE_USER_RATE = int(os.environ.get("VIDEO_SHAPE_USER_RATE", 0))
+
+# Videos are sent at this multiple of their bitrate once the first seconds are out; 0 sends flat out
+SHAPE_PACE_FACTOR = float(os.environ.get("VIDEO_SHAPE_PACE_FACTOR", 0))
+
+# Seconds of video sent unpaced at the start of each response, so playback starts at once
+SHAPE_PACE_BURST_SECONDS = float(os.environ.get("VIDEO_SHAPE_PACE_BURST_SECONDS", 10))
+
+# Bytes a stream sends per turn while limits apply; smaller is fairer, larger is cheaper
+SHAPE_QUANTUM = int(os.environ.get("VIDEO_SHAPE_QUANTUM", 256 * 1024))
+
+# JSON file overriding the limits above at runtime, e.g. {"global_rate": 100000000}
+SHAPE_LIMITS_FILE = os.environ.get("VIDEO_SHAPE_LIMITS_FILE", "shaping.json")
+
+# ---------- Accounts ----------
+# scrypt cost (a power of two): each doubling doubles the time and memory of a login
+PASSWORD_SCRYPT_N = int(os.environ.get("VIDEO_PASSWORD_SCRYPT_N", 2 ** 14))
+
+# PBKDF2-SHA256 rounds, used only where Python's OpenSSL lacks scrypt
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get("VIDEO_PASSWORD_PBKDF2_ITERATIONS", 600000))
+
+# Threads hashing passwords at once; bounds the CPU a burst of logins can take
+AUTH_WORKERS = int(os.environ.get("VIDEO_AUTH_WORKERS", 2))
+
+# Seconds a session token stays valid after login
+SESSION_TTL = float(os.environ.get("VIDEO_SESSION_TTL", 12 * 3600))
+
+# Key signing session tokens; empty picks a random one per start (multi mode shares its own)
+SESSION_SECRET = os.environ.get("VIDEO_SESSION_SECRET", "")
+
+# Refuse video requests on connections that haven't sent AUTH <token>
+REQUIRE_AUTH = os.environ.get("VIDEO_REQUIRE_AUTH", "0") == "1"
+
+# ---------- Previews ----------
+# Processes probing videos and cutting posters; each runs one ffmpeg at a time
+PREVIEW_WORKERS = int(os.environ.get("VIDEO_PREVIEW_WORKERS", 2))
+
+# Videos claimed from a bucket per round, so work is spread over server processes
+PREVIEW_BATCH = int(os.environ.get("VIDEO_PREVIEW_BATCH", 16))
+
+# Seconds between sweeps of the catalog for videos without a preview
+PREVIEW_SCAN_INTERVAL = float(os.environ.get("VIDEO_PREVIEW_SCAN_INTERVAL", 60))
+
+# Seconds before a preview another process claimed but never finished is taken over
+PREVIEW_CLAIM_TTL = float(os.environ.get("VIDEO_PREVIEW_CLAIM_TTL", 600))
+
+# Poster height in pixels; width follows the video's aspect ratio
+POSTER_HEIGHT = int(os.environ.get("VIDEO_POSTER_HEIGHT", 90))
+
+# Bytes of finished previews (posters included) kept in memory for PREVIEW and POSTER
+PREVIEW_CACHE_BYTES = int(os.environ.get("VIDEO_PREVIEW_CACHE_BYTES", 16 * 1024 * 1024))
+
+# Previews (details and poster icon) the Dashboard list keeps, least recently shown dropped first
+LIST_PREVIEWS = int(os.environ.get("VIDEO_LIST_PREVIEWS", 2000))
@@ -0,0 +1,96 @@
+"""
+The video catalog as the server serves it to every client.
+
+Answers (bucket pages, searches, title lookups, change lists) are kept in
+memory, keyed by what was asked. They are all read at one catalog version
+and dropped together as soon as the version moves: at once for writes made
+through this process, within CATALOG_VERSION_CHECK seconds for writes from
+other processes sharing the database.
+"""
+import threading
+import time
+from collections import OrderedDict
+import Config
+from Database.Search_index import search_videos
+from Database.Sqlite_db import (
+    get_catalog_changes, get_catalog_version, get_supabase_name, get_videos_page,
+    on_video_added, trim_catalog_changes,
+)
+from Metrics import metrics
+
+
+class Catalog:
+    def __init__(self, max_cached=Config.CATALOG_CACHE_ENTRIES,
+                 check_interval=Config.CATALOG_VERSION_CHECK, keep=Config.CATALOG_CHANGES_KEPT):
+        self.max_cached = max_cached
+        self.check_interval = check_interval
+        self.keep = keep
+        self.version = None
+        self.checked_at = 0.0
+        self.trimmed = 0            # changes up to here have been deleted
+        self.cache = OrderedDict()  # question -> answer, both at self.version
+        self.lock = threading.Lock()
+        on_video_added(lambda *_: self.invalidate())
+
+    def current_version(self):
+        """The catalog version, read from the database at most every check_interval."""
+        now = time.monotonic()
+        if self.version is not None and now - self.checked_at < self.check_interval:
+            return self.version
+        version = get_catalog_version()
+        with self.lock:
+            if version != self.version:
+                self.cache.clear()
+                self.version = version
+            self.checked_at = now
+        if version - self.keep > self.trimmed + 1000:  # trim in batches, not on every write
+            self.trimmed = version - self.keep
+            trim_catalog_changes(self.keep)
+        return version
+
+    def invalidate(self):
+        """The catalog was just written; look at the version again on the next read."""
+        with self.lock:
+            self.checked_at = 0.0
+
+    def _cached(self, key, load):
+        version = self.current_version()
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                metrics.inc("catalog_lookups_total", result="hit")
+                return version, self.cache[key]
+        metrics.inc("catalog_lookups_total", result="miss")
+        value = load()
+        with self.lock:
+            if self.version == version:
+                self.cache[key] = value
+                while len(self.cache) > self.max_cached:
+                    self.cache.popitem(last=False)
+        return version, value
+
+    # ---------- Questions ----------
+    def page(self, bucket, after=None, limit=Config.CATALOG_PAGE_SIZE):
+        """(version, [(user_name, name)]) for up to limit titles of a bucket after the key after."""
+        return self._cached(
+            ("page", bucket, after, limit), lambda: get_videos_page(bucket, after, limit)
+        )
+
+    def search(self, query, limit=50):
+        """(version, [(user_name, bucket_name, name)]) best matches across all buckets."""
+        query = query.strip().lower()
+        return self._cached(("search", query, limit), lambda: search_videos(query, limit))
+
+    def resolve(self, bucket, title):
+        """(version, stored file name for a title, or None)."""
+        return self._cached(("resolve", bucket, title), lambda: get_supabase_name(title, bucket))
+
+    def changes(self, bucket, since, limit=1000):
+        """
+        (version, [(version, op, user_name, name)]) changed in a bucket after
+        since, oldest first. The list is None when the client is too far
+        behind and has to reload the bucket; shorter than limit once caught up.
+        """
+        return self._cached(
+            ("changes", bucket, since, limit), lambda: get_catalog_changes(bucket, since, limit)
+        )
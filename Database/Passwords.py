@@ -0,0 +1,65 @@
+"""
+Salted password hashing. Stored hashes carry their scheme and cost, e.g.
+"scrypt$16384$8$1$<salt>$<key>", so the cost can be raised later and old
+hashes still verify (and get upgraded at the next login, see check_user).
+"""
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+import Config
+
+# Hashing is deliberately slow; it runs here so callers never wait on a busy thread of theirs.
+# OpenSSL releases the GIL while it hashes, so these threads really run in parallel.
+hash_pool = ThreadPoolExecutor(max_workers=Config.AUTH_WORKERS, thread_name_prefix="auth")
+
+
+def _scrypt(password, salt, n, r, p):
+    # scrypt needs 128 * r * n bytes; allow that plus headroom over OpenSSL's 32 MB default
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p, dklen=32, maxmem=256 * r * n + 2 ** 20
+    )
+
+
+def hash_password(password):
+    salt = os.urandom(16)
+    if hasattr(hashlib, "scrypt"):
+        n, r, p = Config.PASSWORD_SCRYPT_N, 8, 1
+        key = _scrypt(password, salt, n, r, p)
+        return f"scrypt${n}${r}${p}${salt.hex()}${key.hex()}"
+    # Python built against an OpenSSL without scrypt
+    iterations = Config.PASSWORD_PBKDF2_ITERATIONS
+    key = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${key.hex()}"
+
+
+def is_hashed(stored):
+    return stored.startswith(("scrypt$", "pbkdf2_sha256$"))
+
+
+def verify_password(password, stored):
+    """True if password matches the stored hash; compares in constant time."""
+    try:
+        scheme, *fields = stored.split("$")
+        if scheme == "scrypt":
+            n, r, p, salt, key = fields
+            found = _scrypt(password, bytes.fromhex(salt), int(n), int(r), int(p))
+        elif scheme == "pbkdf2_sha256":
+            iterations, salt, key = fields
+            found = hashlib.pbkdf2_hmac(
+                "sha256", password.encode(), bytes.fromhex(salt), int(iterations)
+            )
+        else:
+            return False
+        expected = bytes.fromhex(key)
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(found, expected)
+
+
+def needs_rehash(stored):
+    """True when the hash was made with a weaker setting than the current one."""
+    scheme, *fields = stored.split("$")
+    if hasattr(hashlib, "scrypt"):
+        return scheme != "scrypt" or int(fields[0]) < Config.PASSWORD_SCRYPT_N
+    return scheme != "pbkdf2_sha256" or int(fields[0]) < Config.PASSWORD_PBKDF2_ITERATIONS
@@ -0,0 +1,68 @@
+import sqlite3
+from Database.Sqlite_db import db
+
+
+def _quote(term):
+    """Quote a term as a single FTS5 string so user input can't inject syntax."""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like_escape(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# ---------- Search ----------
+def search_videos(query, limit=50):
+    """
+    Return up to limit (user_name, bucket_name, name) rows across all buckets,
+    best match first. Titles containing every word of the query are returned
+    when there are any; otherwise titles sharing the most trigrams with it,
+    which tolerates typos.
+    """
+    query = query.strip().lower()
+    if not query:
+        return []
+    conn = db.connection()
+
+    if len(query) < 3:
+        # Too short for trigrams: plain prefix match on titles
+        return conn.execute(
+            "SELECT user_name, bucket_name, name FROM videos "
+            "WHERE user_name LIKE ? ESCAPE '\\' ORDER BY user_name LIMIT ?",
+            (_like_escape(query) + "%", limit)
+        ).fetchall()
+
+    words = [w for w in query.split() if len(w) >= 3] or [query]
+    try:
+        # Every word must appear somewhere in the title, in any order
+        results = conn.execute(
+            "SELECT v.user_name, v.bucket_name, v.name FROM videos_fts "
+            "JOIN videos v ON v.rowid = videos_fts.rowid "
+            "WHERE videos_fts MATCH ? ORDER BY bm25(videos_fts) LIMIT ?",
+            (" ".join(_quote(w) for w in words), limit)
+        ).fetchall()
+        if results:
+            return results
+
+        # Nothing contains the query, so it is probably misspelled: match on
+        # any shared trigram and let bm25 favour titles that share the most
+        fuzzy = " OR ".join(_quote(t) for t in sorted(_trigrams(query)))
+        return conn.execute(
+            "SELECT v.user_name, v.bucket_name, v.name FROM videos_fts "
+            "JOIN videos v ON v.rowid = videos_fts.rowid "
+            "WHERE videos_fts MATCH ? ORDER BY bm25(videos_fts) LIMIT ?",
+            (fuzzy, limit)
+        ).fetchall()
+
+    except sqlite3.OperationalError:
+        # No FTS5 in this SQLite build
+        like = "%" + _like_escape(query) + "%"
+        return conn.execute(
+            "SELECT user_name, bucket_name, name FROM videos "
+            "WHERE user_name LIKE ? ESCAPE '\\' ORDER BY user_name LIMIT ?",
+            (like, limit)
+        ).fetchall()
@@ -1,11 +1,17 @@
 import sqlite3
+import threading
+import Config
+from Database.Passwords import hash_password, is_hashed, needs_rehash, verify_password
+from Log import get_logger
 
-# ---------- Create Database and Table ----------
-def create_table():
-    conn = sqlite3.connect("users.db")  # creates users.db file
-    cursor = conn.cursor()
+log = get_logger("database")
+
+# Bump when adding a step to MIGRATIONS
+SCHEMA_VERSION = 6
 
-    # Create table if not exists
+
+# ---------- Schema migrations ----------
+def _migrate_1(cursor):
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -14,7 +20,7 @@ def create_table():
         )
     """)
 
- # Create videos table
+    # Create videos table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS videos (
             name TEXT PRIMARY KEY,          -- Supabase video file name
@@ -22,80 +28,389 @@ def create_table():
         )
     """)
 
-    conn.commit()
-    conn.close()
+
+def _migrate_2(cursor):
+    # Older databases never had bucket_name even though add_video writes it
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(videos)")]
+    if "bucket_name" not in columns:
+        cursor.execute("ALTER TABLE videos ADD COLUMN bucket_name TEXT")
+
+    # Covers both catalog lookups without touching the table itself
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_videos_bucket_user
+        ON videos (bucket_name, user_name, name)
+    """)
+
+
+def _migrate_3(cursor):
+    # Trigram full-text index over titles, kept in sync by triggers so every
+    # add_video is searchable immediately
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5 (
+                user_name, bucket_name UNINDEXED,
+                content = 'videos', content_rowid = 'rowid', tokenize = 'trigram'
+            )
+        """)
+    except sqlite3.OperationalError as err:
+        # SQLite older than 3.34 or built without FTS5; search falls back to LIKE
+        log.warning("⚠️ Full-text search unavailable: %s", err)
+        return
+
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS videos_fts_insert AFTER INSERT ON videos BEGIN
+            INSERT INTO videos_fts (rowid, user_name, bucket_name)
+            VALUES (new.rowid, new.user_name, new.bucket_name);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS videos_fts_delete AFTER DELETE ON videos BEGIN
+            INSERT INTO videos_fts (videos_fts, rowid, user_name, bucket_name)
+            VALUES ('delete', old.rowid, old.user_name, old.bucket_name);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS videos_fts_update AFTER UPDATE ON videos BEGIN
+            INSERT INTO videos_fts (videos_fts, rowid, user_name, bucket_name)
+            VALUES ('delete', old.rowid, old.user_name, old.bucket_name);
+            INSERT INTO videos_fts (rowid, user_name, bucket_name)
+            VALUES (new.rowid, new.user_name, new.bucket_name);
+        END
+    """)
+    cursor.execute("INSERT INTO videos_fts (videos_fts) VALUES ('rebuild')")
+
+
+def _migrate_4(cursor):
+    # Passwords used to be stored as typed; replace each with a salted hash
+    rows = cursor.execute("SELECT id, password FROM users").fetchall()
+    for user_id, password in rows:
+        if not is_hashed(password):
+            cursor.execute(
+                "UPDATE users SET password = ? WHERE id = ?", (hash_password(password), user_id)
+            )
+
+
+def _migrate_5(cursor):
+    # Every change to the catalog gets a version, so clients can catch up with
+    # "changes since N" instead of reloading whole buckets
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_changes (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            op TEXT NOT NULL,               -- 'add' or 'remove'
+            bucket_name TEXT,
+            user_name TEXT NOT NULL,
+            name TEXT NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_catalog_changes_bucket
+        ON catalog_changes (bucket_name, version)
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS catalog_changes_insert AFTER INSERT ON videos BEGIN
+            INSERT INTO catalog_changes (op, bucket_name, user_name, name)
+            VALUES ('add', new.bucket_name, new.user_name, new.name);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS catalog_changes_delete AFTER DELETE ON videos BEGIN
+            INSERT INTO catalog_changes (op, bucket_name, user_name, name)
+            VALUES ('remove', old.bucket_name, old.user_name, old.name);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS catalog_changes_update AFTER UPDATE ON videos BEGIN
+            INSERT INTO catalog_changes (op, bucket_name, user_name, name)
+            VALUES ('remove', old.bucket_name, old.user_name, old.name);
+            INSERT INTO catalog_changes (op, bucket_name, user_name, name)
+            VALUES ('add', new.bucket_name, new.user_name, new.name);
+        END
+    """)
+
+
+def _migrate_6(cursor):
+    # What the preview pipeline learned about each video, next to its catalog row.
+    # status is 'running' while a server process works on it, then 'ready' or 'failed'
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS video_previews (
+            name TEXT PRIMARY KEY,          -- videos.name
+            status TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            duration REAL,                  -- seconds
+            width INTEGER,
+            height INTEGER,
+            bitrate INTEGER,                -- bits per second, all streams
+            poster BLOB                     -- small JPEG
+        )
+    """)
+
+
+MIGRATIONS = [_migrate_1, _migrate_2, _migrate_3, _migrate_4, _migrate_5, _migrate_6]
+
+
+# ---------- Connections ----------
+class Database:
+    """
+    One SQLite connection per thread, opened on first use and kept for the
+    life of the thread. Statements are constant strings so sqlite3 reuses
+    its prepared-statement cache instead of compiling them on every call.
+    """
+
+    def __init__(self, path=Config.DB_PATH):
+        self.path = path
+        self.local = threading.local()
+        self.migrated = False
+        self.migrate_lock = threading.Lock()
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")     # readers don't block the writer
+            conn.execute("PRAGMA synchronous=NORMAL")   # safe with WAL, far fewer fsyncs
+            conn.execute("PRAGMA busy_timeout=5000")
+            self.local.conn = conn
+        if not self.migrated:
+            self.migrate()
+        return conn
+
+    def migrate(self):
+        with self.migrate_lock:
+            if self.migrated:
+                return
+            conn = self.local.conn
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            with conn:
+                cursor = conn.cursor()
+                for step in MIGRATIONS[version:]:
+                    step(cursor)
+                cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.migrated = True
+
+    def close(self):
+        """Close this thread's connection."""
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+
+db = Database()
+
+
+# Called with (name, user_name, bucket_name) after add_video stores a new video
+_video_added_listeners = []
+
+
+def on_video_added(callback):
+    """Run callback for every video added from now on, e.g. to start server-side packaging."""
+    _video_added_listeners.append(callback)
+
+
+# ---------- Create Database and Table ----------
+def create_table():
+    db.connection()
+
 
 # ---------- Video Functions ----------
 def add_video(name, user_name, bucket_name):
     """Insert a new video into the videos table."""
+    conn = db.connection()
     try:
-        conn = sqlite3.connect("users.db")
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO videos (name, user_name, bucket_name) VALUES (?, ?, ?)",
-            (name, user_name, bucket_name)
-        )      
-        conn.commit()
-        return True
+        with conn:
+            conn.execute(
+                "INSERT INTO videos (name, user_name, bucket_name) VALUES (?, ?, ?)",
+                (name, user_name, bucket_name)
+            )
     except sqlite3.IntegrityError:
         print(f"Error: Video '{name}' already exists!")
         return False
-    finally:
-        conn.close()
+    for callback in _video_added_listeners:
+        callback(name, user_name, bucket_name)
+    return True
 
 
 def get_supabase_name(user_name, bucket_name):
     """Return the Supabase file name for a given user_name"""
-    conn = sqlite3.connect("users.db")
-    cursor = conn.cursor()
-    cursor.execute(
-                "SELECT name FROM videos WHERE user_name = ? AND bucket_name = ?",
-                (user_name, bucket_name)
-            )
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else None
+    row = db.connection().execute(
+        "SELECT name FROM videos WHERE bucket_name = ? AND user_name = ? LIMIT 1",
+        (bucket_name, user_name)
+    ).fetchone()
+    return row[0] if row else None
+
 
 def get_all_videos(bucket=None):
-    """Return a list of tuples (name, user_name) for all videos."""
-    conn = sqlite3.connect("users.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_name FROM videos WHERE bucket_name = ?", (bucket,))
-    result = cursor.fetchall()
-    conn.close()
-    return result
+    """Return a list of (user_name,) tuples for all videos in a bucket."""
+    return db.connection().execute(
+        "SELECT user_name FROM videos WHERE bucket_name = ?", (bucket,)
+    ).fetchall()
+
+
+def get_videos_page(bucket, after=None, limit=200):
+    """
+    Return up to limit (user_name, name) rows of a bucket in title order,
+    starting after the (user_name, name) key of the previous page. Seeks
+    straight to the page on the covering index, so late pages cost the same
+    as the first.
+    """
+    conn = db.connection()
+    if after is None:
+        return conn.execute(
+            "SELECT user_name, name FROM videos WHERE bucket_name = ? "
+            "ORDER BY user_name, name LIMIT ?", (bucket, limit)
+        ).fetchall()
+    return conn.execute(
+        "SELECT user_name, name FROM videos WHERE bucket_name = ? "
+        "AND (user_name, name) > (?, ?) ORDER BY user_name, name LIMIT ?",
+        (bucket, after[0], after[1], limit)
+    ).fetchall()
+
+
+# ---------- Catalog Changes ----------
+def get_catalog_version():
+    """Version of the latest catalog change; 0 for a catalog never changed."""
+    row = db.connection().execute(
+        "SELECT version FROM catalog_changes ORDER BY version DESC LIMIT 1"
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def get_catalog_changes(bucket, since, limit=1000):
+    """
+    Return up to limit (version, op, user_name, name) rows for a bucket after
+    version since, oldest first; None if the log no longer reaches back that
+    far, in which case the caller has to reload the bucket.
+    """
+    conn = db.connection()
+    oldest = conn.execute(
+        "SELECT version FROM catalog_changes ORDER BY version LIMIT 1"
+    ).fetchone()
+    if oldest is not None and since < oldest[0] - 1:
+        return None
+    return conn.execute(
+        "SELECT version, op, user_name, name FROM catalog_changes "
+        "WHERE bucket_name = ? AND version > ? ORDER BY version LIMIT ?",
+        (bucket, since, limit)
+    ).fetchall()
+
+
+def trim_catalog_changes(keep):
+    """Forget all but the newest keep changes."""
+    conn = db.connection()
+    with conn:
+        conn.execute(
+            "DELETE FROM catalog_changes WHERE version <= "
+            "(SELECT MAX(version) FROM catalog_changes) - ?", (keep,)
+        )
+
+
+# ---------- Previews ----------
+def get_buckets():
+    return [row[0] for row in db.connection().execute(
+        "SELECT DISTINCT bucket_name FROM videos WHERE bucket_name IS NOT NULL"
+    )]
+
+
+def get_videos_without_preview(bucket, stale_before, limit=100):
+    """Names of videos in a bucket with no preview yet, or whose extraction started before stale_before."""
+    return [row[0] for row in db.connection().execute(
+        "SELECT v.name FROM videos v LEFT JOIN video_previews p ON p.name = v.name "
+        "WHERE v.bucket_name = ? AND (p.name IS NULL "
+        "OR (p.status = 'running' AND p.updated_at < ?)) LIMIT ?",
+        (bucket, stale_before, limit)
+    )]
+
+
+def claim_preview(name, now, stale_before):
+    """
+    Mark a video's preview as being made by the caller. False if another
+    process claimed it first and hasn't been at it since stale_before.
+    """
+    conn = db.connection()
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO video_previews (name, status, updated_at) VALUES (?, 'running', ?) "
+            "ON CONFLICT (name) DO UPDATE SET status = 'running', updated_at = excluded.updated_at "
+            "WHERE video_previews.status = 'running' AND video_previews.updated_at < ?",
+            (name, now, stale_before)
+        )
+    return cursor.rowcount == 1
+
+
+def save_preview(name, status, now, duration=None, width=None, height=None, bitrate=None, poster=None):
+    conn = db.connection()
+    with conn:
+        conn.execute(
+            "UPDATE video_previews SET status = ?, updated_at = ?, duration = ?, width = ?, "
+            "height = ?, bitrate = ?, poster = ? WHERE name = ?",
+            (status, now, duration, width, height, bitrate, poster, name)
+        )
+
+
+def get_preview(bucket, name):
+    """
+    (status, duration, width, height, bitrate, poster) of a video, all None
+    if it was never looked at; None if the bucket has no such video.
+    """
+    return db.connection().execute(
+        "SELECT p.status, p.duration, p.width, p.height, p.bitrate, p.poster "
+        "FROM videos v LEFT JOIN video_previews p ON p.name = v.name "
+        "WHERE v.name = ? AND v.bucket_name = ?",
+        (name, bucket)
+    ).fetchone()
+
+
+def forget_preview(name):
+    """Drop a video's preview, e.g. when the file is replaced, so it is made again."""
+    conn = db.connection()
+    with conn:
+        conn.execute("DELETE FROM video_previews WHERE name = ?", (name,))
 
-    conn.commit()
-    conn.close()
 
 # ---------- Insert User / Register ----------
+# Both hash passwords, which takes tens of milliseconds on purpose: call them
+# off the GUI thread or the event loop, e.g. through Passwords.hash_pool.
 def register_user(email, password):
+    hashed = hash_password(password)
+    conn = db.connection()
     try:
-        conn = sqlite3.connect("users.db")
-        cursor = conn.cursor()
-
-        cursor.execute("INSERT INTO users (email, password) VALUES (?, ?)", (email, password))
-        conn.commit()
+        with conn:
+            conn.execute("INSERT INTO users (email, password) VALUES (?, ?)", (email, hashed))
         return True  # registration successful
     except sqlite3.IntegrityError:
         print("Error: Email already exists!")
         return False
-    finally:
-        conn.close()
+
 
 # ---------- Retrieve User (Login Check) ----------
-def check_user(email, password):
-    conn = sqlite3.connect("users.db")
-    cursor = conn.cursor()
+_dummy = []  # hash checked against for unknown emails, made on first use
+
 
-    cursor.execute("SELECT * FROM users WHERE email = ? AND password = ?", (email, password))
-    result = cursor.fetchone()
-    conn.close()
+def _dummy_hash():
+    if not _dummy:
+        _dummy.append(hash_password(""))
+    return _dummy[0]
 
-    if result:
-        return True
-    else:
+
+def check_user(email, password):
+    conn = db.connection()
+    row = conn.execute(
+        "SELECT password FROM users WHERE email = ? LIMIT 1", (email,)
+    ).fetchone()
+    if row is None:
+        # Spend the same time as a real check so response times don't reveal who has an account
+        verify_password(password, _dummy_hash())
+        return False
+    if not verify_password(password, row[0]):
         return False
+    if needs_rehash(row[0]):
+        # The cost was raised since this hash was made; the password is at hand, so upgrade it
+        with conn:
+            conn.execute(
+                "UPDATE users SET password = ? WHERE email = ?", (hash_password(password), email)
+            )
+    return True
+
 
 # ---------- Ensure table exists when module is imported ----------
 create_table()
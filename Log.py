@@ -0,0 +1,47 @@
+"""
+Leveled server logging that never blocks the caller on the terminal.
+
+Records go onto an in-memory queue and a background thread writes them out,
+so a slow console can't stall a transfer. Per-request lines are DEBUG and
+off by default; VIDEO_LOG_LEVEL=OFF silences everything.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import Config
+
+_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "OFF": logging.CRITICAL + 1,
+}
+
+_root = logging.getLogger("a_server")
+_listener = None
+
+
+def _setup():
+    global _listener
+    _root.setLevel(_LEVELS.get(Config.LOG_LEVEL.upper(), logging.INFO))
+    _root.propagate = False
+
+    records = queue.SimpleQueue()
+    _root.addHandler(logging.handlers.QueueHandler(records))
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(logging.Formatter("%(asctime)s %(levelname)-5s %(message)s"))
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    atexit.register(_listener.stop)  # flush what is still queued
+
+
+def get_logger(name):
+    """Logger for one server module, e.g. get_logger("server")."""
+    return _root.getChild(name)
+
+
+_setup()
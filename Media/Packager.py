@@ -0,0 +1,258 @@
+"""
+Adaptive bitrate packaging: cut a stored video into HLS renditions.
+
+For each title, ffmpeg encodes every rung of the ladder that is not taller
+than the source. All rungs get keyframes at the same fixed interval, so
+segment i covers the same seconds in every rendition and a player can
+switch between them at any segment boundary. The result is kept under
+RENDITION_DIR/<cache key>/ next to a manifest.json listing the renditions
+and their segments.
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import Config
+from Cache.Disk_cache import FileRange, make_key, pid_alive
+from Log import get_logger
+from Storage.Backend import get_backend
+
+log = get_logger("packager")
+
+_VIDEO_SIZE = re.compile(r"Stream #.*Video:.*?\b(\d{2,5})x(\d{2,5})\b")
+_EXTINF = re.compile(r"#EXTINF:([\d.]+)")
+
+
+def parse_ladder(text):
+    """"720:2800,360:800" -> [(720, 2800), (360, 800)]: height and video kbit/s, tallest first."""
+    ladder = []
+    for rung in text.split(","):
+        height, _, kbps = rung.strip().partition(":")
+        ladder.append((int(height), int(kbps)))
+    return sorted(ladder, reverse=True)
+
+
+# ---------- Packager ----------
+class Packager:
+    """Builds renditions in the background and answers manifest/segment lookups."""
+
+    def __init__(self, root=Config.RENDITION_DIR, info=None,
+                 ladder=Config.RENDITION_LADDER, segment_seconds=Config.SEGMENT_SECONDS,
+                 ffmpeg=Config.FFMPEG_PATH, workers=Config.PACKAGE_WORKERS,
+                 marker_ttl=Config.PACKAGE_MARKER_TTL):
+        self.root = root
+        self.info = info  # (bucket, file) -> {"size", "version"} or None
+        self.ladder = parse_ladder(ladder)
+        self.segment_seconds = segment_seconds
+        self.ffmpeg = shutil.which(ffmpeg)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.running = set()  # keys being packaged by this process
+        self.failed = set()   # keys ffmpeg could not package, until restart
+        self.marker_ttl = marker_ttl
+        os.makedirs(root, exist_ok=True)
+        self._clean_stale()
+
+    def _key(self, bucket_name, file_name):
+        info = self.info(bucket_name, file_name)
+        if info is None:
+            return None
+        return make_key(bucket_name, file_name, info["version"])
+
+    def manifest(self, bucket_name, file_name, start=True):
+        """
+        {"status": "ready", "renditions": [...]} when packaged. Otherwise the
+        status is "packaging" (started if start is set), "unavailable" (no
+        ffmpeg, or it failed) or "missing" (no such video).
+        """
+        key = self._key(bucket_name, file_name)
+        if key is None:
+            return {"status": "missing"}
+        try:
+            with open(os.path.join(self.root, key, "manifest.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        if self.ffmpeg is None or key in self.failed:
+            return {"status": "unavailable"}
+        if start:
+            with self.lock:
+                if key not in self.running:
+                    self.running.add(key)
+                    self.executor.submit(self._package, bucket_name, file_name, key)
+        return {"status": "packaging"}
+
+    def segment(self, bucket_name, file_name, rendition, index):
+        """FileRange over one packaged segment, or None."""
+        key = self._key(bucket_name, file_name)
+        if key is None or not re.fullmatch(r"\d+p", rendition):
+            return None
+        path = os.path.join(self.root, key, rendition, f"seg_{index:05d}.ts")
+        try:
+            return FileRange(path, 0, os.path.getsize(path))
+        except OSError:
+            return None
+
+    # ---------- Encoding ----------
+    def _package(self, bucket_name, file_name, key):
+        final = os.path.join(self.root, key)
+        work = tempfile.mkdtemp(prefix=f".{key[:12]}-", dir=self.root)
+        try:
+            # Another worker process may be on it; the first to create the marker wins
+            marker = os.path.join(self.root, f".{key}.packaging")
+            if not self._claim(marker):
+                return
+
+            try:
+                log.info("🎞️ Packaging '%s' from '%s'", file_name, bucket_name)
+                source = self._source(bucket_name, file_name, work)
+                renditions = self._encode(source, work)
+                manifest = {
+                    "status": "ready",
+                    "segment_seconds": self.segment_seconds,
+                    "renditions": renditions,
+                }
+                with open(os.path.join(work, "manifest.json"), "w") as f:
+                    json.dump(manifest, f)
+                if os.path.exists(os.path.join(work, "source")):
+                    os.remove(os.path.join(work, "source"))
+                shutil.rmtree(final, ignore_errors=True)
+                os.replace(work, final)
+                log.info("✅ Packaged '%s' in %d renditions", file_name, len(renditions))
+            finally:
+                self._release(marker)
+        except Exception as err:
+            log.error("❌ Packaging '%s' failed: %s", file_name, err)
+            self.failed.add(key)
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+            with self.lock:
+                self.running.discard(key)
+
+    # ---------- Markers ----------
+    def _claim(self, marker):
+        """Create the marker holding this process's pid; False while a live owner holds it."""
+        for _ in range(2):
+            try:
+                fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._stale(marker):
+                    return False
+                log.warning("⚠️ Taking over abandoned packaging marker %s", os.path.basename(marker))
+                try:
+                    os.remove(marker)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(str(os.getpid()))
+            return True
+        return False
+
+    def _stale(self, marker):
+        """True if the marker's owner died, or has held it longer than marker_ttl."""
+        try:
+            with open(marker) as f:
+                pid = f.read().strip()
+            age = time.time() - os.path.getmtime(marker)
+        except OSError:
+            return True  # already gone
+        if age > self.marker_ttl:
+            return True
+        if not pid.isdigit():
+            return age > 10  # the owner writes its pid right after creating it
+        return int(pid) != os.getpid() and not pid_alive(int(pid))
+
+    def _release(self, marker):
+        """Remove our marker, unless another process has taken it over meanwhile."""
+        try:
+            with open(marker) as f:
+                if f.read().strip() != str(os.getpid()):
+                    return
+            os.remove(marker)
+        except OSError:
+            pass
+
+    def _clean_stale(self):
+        """Drop markers and work directories left by packagers that died mid-way."""
+        for entry in os.scandir(self.root):
+            if not entry.name.startswith("."):
+                continue
+            try:
+                if entry.name.endswith(".packaging"):
+                    if self._stale(entry.path):
+                        os.remove(entry.path)
+                elif entry.is_dir() and time.time() - entry.stat().st_mtime > self.marker_ttl:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                pass
+
+    def _source(self, bucket_name, file_name, work):
+        """A local path ffmpeg can read: the stored file itself, or a downloaded copy."""
+        backend = get_backend()
+        direct = backend.open_range(bucket_name, file_name, 0, 0)
+        if direct is not None:
+            direct.close()
+            return direct.file.name
+        path = os.path.join(work, "source")
+        with open(path, "wb") as f:
+            for chunk in backend.read(bucket_name, file_name):
+                f.write(chunk)
+        return path
+
+    def _source_height(self, source):
+        probe = subprocess.run(
+            [self.ffmpeg, "-hide_banner", "-i", source], capture_output=True, text=True
+        )
+        match = _VIDEO_SIZE.search(probe.stderr)
+        if match is None:
+            raise ValueError("no video stream found")
+        return int(match.group(2))
+
+    def _encode(self, source, work):
+        height = self._source_height(source)
+        rungs = [rung for rung in self.ladder if rung[0] <= height] or [self.ladder[-1]]
+        renditions = []
+        for rung_height, kbps in rungs:
+            name = f"{rung_height}p"
+            out = os.path.join(work, name)
+            os.makedirs(out)
+            seconds = self.segment_seconds
+            subprocess.run([
+                self.ffmpeg, "-hide_banner", "-loglevel", "error", "-y", "-i", source,
+                "-vf", f"scale=-2:{rung_height}",
+                "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main",
+                "-b:v", f"{kbps}k", "-maxrate", f"{int(kbps * 1.1)}k", "-bufsize", f"{kbps * 2}k",
+                # Same keyframe times in every rendition: segments line up for switching
+                "-force_key_frames", f"expr:gte(t,n_forced*{seconds})", "-sc_threshold", "0",
+                "-c:a", "aac", "-b:a", "128k", "-ac", "2",
+                "-f", "hls", "-hls_time", str(seconds), "-hls_playlist_type", "vod",
+                "-hls_segment_filename", os.path.join(out, "seg_%05d.ts"),
+                os.path.join(out, "index.m3u8"),
+            ], check=True, capture_output=True)
+            renditions.append(self._describe(name, rung_height, out))
+        return sorted(renditions, key=lambda r: r["bandwidth"])
+
+    @staticmethod
+    def _describe(name, height, directory):
+        with open(os.path.join(directory, "index.m3u8")) as f:
+            durations = [float(d) for d in _EXTINF.findall(f.read())]
+        segments = []
+        for index, duration in enumerate(durations):
+            size = os.path.getsize(os.path.join(directory, f"seg_{index:05d}.ts"))
+            segments.append({"duration": duration, "size": size})
+        total_bytes = sum(s["size"] for s in segments)
+        total_seconds = sum(durations) or 1
+        return {
+            "name": name,
+            "height": height,
+            # Measured average, audio and container overhead included
+            "bandwidth": int(total_bytes * 8 / total_seconds),
+            "segments": segments,
+        }
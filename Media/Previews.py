@@ -0,0 +1,213 @@
+"""
+Video previews: duration, resolution, bitrate and a small poster frame for
+every video in the catalog, so clients can show them without downloading
+the video.
+
+A background thread sweeps the catalog bucket by bucket and hands videos
+without a preview to a pool of worker processes, a batch at a time. Each
+runs ffmpeg straight on the stored object (a local path or a signed URL),
+so only the header and the frames around the poster are read. Results go
+into the video_previews table; a claim in that table keeps server
+processes from doing the same video twice. Finished previews are served
+from a small in-memory cache.
+"""
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import Config
+from Database.Sqlite_db import (
+    claim_preview, forget_preview, get_buckets, get_preview, get_videos_without_preview,
+    save_preview,
+)
+from Log import get_logger
+from Storage.Backend import get_backend
+
+log = get_logger("previews")
+
+_DURATION = re.compile(r"Duration: (\d+):(\d\d):(\d\d(?:\.\d+)?)")
+_BITRATE = re.compile(r"Duration: .*?bitrate: (\d+) kb/s")
+_VIDEO_SIZE = re.compile(r"Stream #.*Video:.*?\b(\d{2,5})x(\d{2,5})\b")
+
+# Seconds ffmpeg gets per probe or poster before the video counts as failed
+FFMPEG_TIMEOUT = 120
+
+
+# ---------- Extraction (runs in the worker processes) ----------
+def extract(ffmpeg, source, poster_height):
+    """Probe source and cut its poster. Returns {"duration", "width", "height", "bitrate", "poster"}."""
+    probe = subprocess.run(
+        [ffmpeg, "-hide_banner", "-i", source],
+        capture_output=True, text=True, timeout=FFMPEG_TIMEOUT,
+    )
+    size = _VIDEO_SIZE.search(probe.stderr)
+    if size is None:
+        raise ValueError("no video stream found")
+    duration = _DURATION.search(probe.stderr)
+    seconds = None
+    if duration:
+        hours, minutes, secs = duration.groups()
+        seconds = int(hours) * 3600 + int(minutes) * 60 + float(secs)
+    bitrate = _BITRATE.search(probe.stderr)
+
+    # A frame a little way in says more than the usual black first one
+    at = min(seconds * 0.1, 30) if seconds else 0
+    poster = subprocess.run([
+        ffmpeg, "-hide_banner", "-loglevel", "error", "-ss", f"{at:.2f}", "-i", source,
+        "-frames:v", "1", "-vf", f"scale=-2:{poster_height}", "-q:v", "5",
+        "-f", "image2pipe", "-c:v", "mjpeg", "pipe:1",
+    ], capture_output=True, timeout=FFMPEG_TIMEOUT)
+
+    return {
+        "duration": seconds,
+        "width": int(size.group(1)),
+        "height": int(size.group(2)),
+        "bitrate": int(bitrate.group(1)) * 1000 if bitrate else None,
+        "poster": poster.stdout or None,
+    }
+
+
+# ---------- Pipeline ----------
+class PreviewPipeline:
+    def __init__(self, ffmpeg=Config.FFMPEG_PATH, workers=Config.PREVIEW_WORKERS,
+                 batch=Config.PREVIEW_BATCH, interval=Config.PREVIEW_SCAN_INTERVAL,
+                 claim_ttl=Config.PREVIEW_CLAIM_TTL, poster_height=Config.POSTER_HEIGHT,
+                 cache_bytes=Config.PREVIEW_CACHE_BYTES):
+        self.ffmpeg = shutil.which(ffmpeg)
+        self.workers = workers
+        self.batch = batch
+        self.interval = interval
+        self.claim_ttl = claim_ttl
+        self.poster_height = poster_height
+        self.pool = None  # worker processes, started with the first batch
+        self.wake = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()  # (bucket, file) -> (info, poster), finished previews only
+        self.cache_bytes = cache_bytes
+        self.cached_bytes = 0
+
+    def start(self):
+        """Begin sweeping the catalog in the background; a no-op without ffmpeg."""
+        with self.lock:
+            if self.thread is not None or self.ffmpeg is None:
+                return
+            self.thread = threading.Thread(target=self._run, name="previews", daemon=True)
+            self.thread.start()
+
+    def poke(self):
+        """Sweep again now, e.g. because a video was just added."""
+        self.wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                for bucket_name in get_buckets():
+                    while self._batch(bucket_name):
+                        pass
+            except Exception as err:
+                log.error("❌ Preview sweep failed: %s", err)
+            self.wake.wait(self.interval)
+            self.wake.clear()
+
+    def _batch(self, bucket_name):
+        """Make previews for up to batch videos of a bucket; False once it has none left to do."""
+        now = time.time()
+        names = get_videos_without_preview(bucket_name, now - self.claim_ttl, self.batch)
+        claimed = [name for name in names if claim_preview(name, now, now - self.claim_ttl)]
+        if not claimed:
+            return False
+
+        if self.pool is None:
+            # Fresh interpreters: forking a process full of threads isn't safe
+            self.pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        backend = get_backend()
+        jobs = []
+        for name in claimed:
+            temp = None
+            source = backend.url(bucket_name, name)
+            if source is None:
+                # Only readable through the backend: hand ffmpeg a copy
+                fd, temp = tempfile.mkstemp(suffix=os.path.splitext(name)[1])
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in backend.read(bucket_name, name):
+                        f.write(chunk)
+                source = temp
+            future = self.pool.submit(extract, self.ffmpeg, source, self.poster_height)
+            jobs.append((name, future, temp))
+
+        for name, future, temp in jobs:
+            try:
+                info = future.result()
+                save_preview(name, "ready", time.time(), info["duration"], info["width"],
+                             info["height"], info["bitrate"], info["poster"])
+            except Exception as err:
+                log.warning("⚠️ No preview for '%s': %s", name, err)
+                save_preview(name, "failed", time.time())
+            finally:
+                if temp:
+                    os.remove(temp)
+        log.info("🖼️ Previewed %d videos in '%s'", len(jobs), bucket_name)
+        return True
+
+    # ---------- Lookups ----------
+    def _lookup(self, bucket_name, file_name):
+        """(info, poster) of a video, or None if it isn't in the catalog."""
+        key = (bucket_name, file_name)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        row = get_preview(bucket_name, file_name)
+        if row is None:
+            return None
+        status, duration, width, height, bitrate, poster = row
+        if status in (None, "running"):
+            self.poke()  # not swept yet, or being made right now
+            return {"status": "pending"}, None
+        found = {
+            "status": status, "duration": duration, "width": width, "height": height,
+            "bitrate": bitrate, "poster": len(poster) if poster else 0,
+        }, poster
+
+        # Only finished previews are cached: they don't change until forget()
+        with self.lock:
+            if key not in self.cache:
+                self.cache[key] = found
+                self.cached_bytes += len(poster or b"") + 128
+                while self.cached_bytes > self.cache_bytes and self.cache:
+                    _, (_, old) = self.cache.popitem(last=False)
+                    self.cached_bytes -= len(old or b"") + 128
+        return found
+
+    def info(self, bucket_name, file_name):
+        """
+        {"status", "duration", "width", "height", "bitrate", "poster"} with
+        poster the JPEG's size; status is "ready", "pending" or "failed".
+        None if the video isn't in the catalog.
+        """
+        found = self._lookup(bucket_name, file_name)
+        return found[0] if found else None
+
+    def poster(self, bucket_name, file_name):
+        """The poster JPEG, or None if there is none (yet)."""
+        found = self._lookup(bucket_name, file_name)
+        return found[1] if found else None
+
+    def forget(self, bucket_name, file_name):
+        """The stored file changed: make its preview again."""
+        forget_preview(file_name)
+        with self.lock:
+            found = self.cache.pop((bucket_name, file_name), None)
+            if found:
+                self.cached_bytes -= len(found[1] or b"") + 128
+        self.poke()
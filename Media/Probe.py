@@ -0,0 +1,58 @@
+"""
+Just enough MP4 parsing to learn a video's duration: walk the top-level
+boxes to moov, then read the timescale and duration from its mvhd. Only a
+few small reads, wherever moov sits in the file.
+"""
+import struct
+
+# Boxes looked at before giving up on a malformed file
+MAX_BOXES = 64
+
+
+def _boxes(read, start, end):
+    """Yield (type, payload offset, payload size) of the boxes between start and end."""
+    offset = start
+    for _ in range(MAX_BOXES):
+        if offset + 8 > end:
+            return
+        head = read(offset, 16)
+        if len(head) < 8:
+            return
+        size, kind = struct.unpack(">I4s", head[:8])
+        header = 8
+        if size == 1:
+            if len(head) < 16:
+                return
+            size = struct.unpack(">Q", head[8:16])[0]
+            header = 16
+        elif size == 0:
+            size = end - offset  # runs to the end of the file
+        if size < header:
+            return
+        yield kind, offset + header, size - header
+        offset += size
+
+
+def mp4_duration(read, size):
+    """
+    Seconds of media in an MP4/MOV, or None if it can't be found.
+    read(offset, length) returns bytes of the file; size is its length.
+    """
+    for kind, start, length in _boxes(read, 0, size):
+        if kind != b"moov":
+            continue
+        for child, child_start, child_length in _boxes(read, start, start + length):
+            if child != b"mvhd":
+                continue
+            body = read(child_start, min(child_length, 32))
+            if len(body) < 20:
+                return None
+            if body[0] == 1:  # version 1: 64-bit times
+                if len(body) < 32:
+                    return None
+                timescale, duration = struct.unpack(">IQ", body[20:32])
+            else:
+                timescale, duration = struct.unpack(">II", body[12:20])
+            return duration / timescale if timescale else None
+        return None
+    return None
@@ -0,0 +1,300 @@
+"""
+In-process server metrics, rendered in the Prometheus text format.
+
+Everything is kept in memory behind one lock; updates are a dict lookup and
+an addition, cheap enough to call once per chunk sent. The text is returned
+by the STATS command and, when VIDEO_METRICS_PORT is set, served at
+http://127.0.0.1:<port>/metrics.
+"""
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import Config
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+# ---------- Histogram ----------
+class Histogram:
+    """Counts of observations per latency bucket, plus their sum."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation (estimate)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+# ---------- Throughput ----------
+class Rate:
+    """Running total per second over the last window seconds."""
+
+    def __init__(self, window=10):
+        self.window = window
+        self.slots = deque()  # [second, amount], oldest first
+
+    def add(self, amount, now=None):
+        second = int(now if now is not None else time.monotonic())
+        if self.slots and self.slots[-1][0] == second:
+            self.slots[-1][1] += amount
+        else:
+            self.slots.append([second, amount])
+        self._trim(second)
+
+    def _trim(self, second):
+        while self.slots and self.slots[0][0] <= second - self.window:
+            self.slots.popleft()
+
+    def per_second(self, now=None):
+        second = int(now if now is not None else time.monotonic())
+        self._trim(second)
+        return sum(amount for _, amount in self.slots) / self.window
+
+
+# ---------- Registry ----------
+class Metrics:
+    """Counters, gauges and histograms keyed by (name, sorted label pairs)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+        self.sent_rate = Rate()
+        self.sent_per_second = None  # fixed rate of a merged snapshot
+        self.started = time.time()
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge_add(self, name, amount, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = self.gauges.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def add_sent(self, amount):
+        """Bytes written to clients; feeds both the total and the per-second rate."""
+        with self.lock:
+            key = ("bytes_sent_total", ())
+            self.counters[key] = self.counters.get(key, 0) + amount
+            self.sent_rate.add(amount)
+
+    def render(self):
+        """Everything as Prometheus exposition text."""
+        lines = []
+        with self.lock:
+            hits = sum(v for (n, l), v in self.counters.items()
+                       if n == "cache_lookups_total" and ("result", "hit") in l)
+            lookups = sum(v for (n, _), v in self.counters.items() if n == "cache_lookups_total")
+            rate = self.sent_per_second
+            if rate is None:
+                rate = self.sent_rate.per_second()
+            derived = [
+                ("uptime_seconds", time.time() - self.started),
+                ("bytes_sent_per_second", rate),
+                ("cache_hit_ratio", hits / lookups if lookups else 0.0),
+            ]
+
+            for kind, table in (("counter", self.counters), ("gauge", self.gauges)):
+                typed = set()
+                for (name, labels), value in sorted(table.items()):
+                    if name not in typed:
+                        typed.add(name)
+                        if name in self.help:
+                            lines.append(f"# HELP {name} {self.help[name]}")
+                        lines.append(f"# TYPE {name} {kind}")
+                    lines.append(f"{name}{_labels(labels)} {value}")
+
+            for name, value in derived:
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value:.6g}")
+
+            typed = set()
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    typed.add(name)
+                    if name in self.help:
+                        lines.append(f"# HELP {name} {self.help[name]}")
+                    lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                bounds = [str(b) for b in histogram.bounds] + ["+Inf"]
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    le = _labels(labels + (("le", bound),))
+                    lines.append(f"{name}_bucket{le} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+                # Not part of the format, but what a human reading STATS wants
+                lines.append(
+                    f"# {name}{_labels(labels)} p50={histogram.quantile(0.5)} "
+                    f"p99={histogram.quantile(0.99)}"
+                )
+        return "\n".join(lines) + "\n"
+
+    # ---------- Across processes ----------
+    def snapshot(self):
+        """Plain-data copy of every value, for another process to merge."""
+        with self.lock:
+            return {
+                "started": self.started,
+                "sent_per_second": self.sent_rate.per_second(),
+                "counters": [[n, l, v] for (n, l), v in self.counters.items()],
+                "gauges": [[n, l, v] for (n, l), v in self.gauges.items()],
+                "histograms": [
+                    [n, l, h.counts, h.sum, h.count] for (n, l), h in self.histograms.items()
+                ],
+            }
+
+    @classmethod
+    def merged(cls, snapshots, help=None):
+        """One registry holding the sum of several processes' snapshots."""
+        total = cls()
+        total.help = dict(help or {})
+        total.sent_per_second = 0.0
+        for snap in snapshots:
+            total.started = min(total.started, snap["started"])
+            total.sent_per_second += snap["sent_per_second"]
+            for table, rows in ((total.counters, snap["counters"]), (total.gauges, snap["gauges"])):
+                for name, labels, value in rows:
+                    key = (name, tuple(tuple(pair) for pair in labels))
+                    table[key] = table.get(key, 0) + value
+            for name, labels, counts, total_sum, count in snap["histograms"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                histogram = total.histograms.setdefault(key, Histogram())
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total_sum
+                histogram.count += count
+        return total
+
+
+metrics = Metrics()
+metrics.describe("connections_active", "Client connections currently open")
+metrics.describe("connections_total", "Client connections accepted")
+metrics.describe("requests_total", "Requests by command and outcome")
+metrics.describe("bucket_requests_total", "Answered requests per bucket and command")
+metrics.describe("bucket_response_bytes_total", "Body bytes promised to clients per bucket")
+metrics.describe("bytes_sent_total", "Body bytes written to clients")
+metrics.describe("cache_lookups_total", "Disk cache lookups for GET and RANGE bodies")
+metrics.describe("storage_seconds", "Storage call latency; download is time to first byte")
+metrics.describe("request_ttfb_seconds", "Time from request received to first body byte sent")
+metrics.describe("upstream_errors_total", "Bodies that failed mid-stream")
+metrics.describe("storage_calls_total", "Remote storage calls by outcome: ok, error, timeout, refused, busy (no free thread)")
+metrics.describe("storage_retries_total", "Remote storage calls tried again")
+metrics.describe("storage_hedges_total", "Duplicate requests sent for slow storage calls")
+metrics.describe("storage_hedge_wins_total", "Which of a hedged pair answered first")
+metrics.describe("stale_info_total", "Object versions served from an expired cache entry because storage failed")
+metrics.describe("storage_breaker_open", "1 while storage calls are refused after repeated failures")
+
+
+# ---------- Sharing between worker processes ----------
+# Directory where every worker of a multi-process server leaves its snapshot
+_shared_dir = None
+
+
+def share(directory, interval=1.0, publish=True):
+    """
+    Merge stats with the other processes using directory. With publish, this
+    process also writes its own snapshot there every interval seconds.
+    """
+    global _shared_dir
+    _shared_dir = directory
+    if not publish:
+        return
+    path = os.path.join(directory, f"{os.getpid()}.json")
+
+    def write_loop():
+        while True:
+            tmp = path + ".tmp"
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(metrics.snapshot(), f)
+                os.replace(tmp, path)
+            except OSError:
+                pass  # directory removed: the supervisor is shutting down
+            time.sleep(interval)
+
+    threading.Thread(target=write_loop, daemon=True).start()
+
+
+def render_all():
+    """This process's stats, or every worker's added up when they are shared."""
+    if _shared_dir is None:
+        return metrics.render()
+    snapshots = []
+    for path in glob.glob(os.path.join(_shared_dir, "*.json")):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # worker exited meanwhile
+    return Metrics.merged(snapshots, metrics.help).render()
+
+
+# ---------- HTTP endpoint ----------
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = render_all().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes every few seconds would flood the log
+
+
+def start_http_endpoint(host=Config.METRICS_HOST, port=Config.METRICS_PORT):
+    """Serve /metrics on a daemon thread. Returns the server, or None when disabled."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
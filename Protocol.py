@@ -0,0 +1,76 @@
+"""
+Framed protocol shared by the server and the client.
+
+A client that wants a persistent connection sends MAGIC first, then any
+number of REQUEST frames holding the same command text as the one-shot
+protocol ("GET bucket file", "RANGE ..."). Frames are
+
+    request_id (u32) | kind (u8) | payload length (u64) | payload
+
+Each request is answered in order with HEADER (the one-shot reply header),
+zero or more DATA frames, then END; or with a single ERROR frame. Requests
+can be pipelined: the client may send several before reading any reply.
+
+A request that carries data (PART, an upload part) is followed by its own
+DATA frames and an END, with the request's id, before the reply comes.
+"""
+import struct
+
+MAGIC = b"VSP1"
+FRAME = struct.Struct("!IBQ")
+
+REQUEST = 1
+HEADER = 2
+DATA = 3
+END = 4
+ERROR = 5
+
+# Longest command a client may send in one REQUEST frame
+MAX_REQUEST_BYTES = 64 * 1024
+
+# Largest DATA frame a client may send in a request body
+MAX_DATA_BYTES = 1024 * 1024
+
+
+def pack_frame(request_id, kind, payload=b""):
+    return FRAME.pack(request_id, kind, len(payload)) + payload
+
+
+def recv_exact(sock, size):
+    """Read exactly size bytes, or fewer if the peer closes the connection."""
+    buf = bytearray()
+    while len(buf) < size:
+        data = sock.recv(size - len(buf))
+        if not data:
+            break
+        buf += data
+    return bytes(buf)
+
+
+# ---------- Readers with bytes already pulled off the socket ----------
+class BufferedSocketReader:
+    """Reads from a blocking socket, starting with bytes received earlier."""
+
+    def __init__(self, sock, pending=b""):
+        self.sock = sock
+        self.pending = pending
+
+    def read_exact(self, size):
+        head, self.pending = self.pending[:size], self.pending[size:]
+        if len(head) == size:
+            return head
+        return head + recv_exact(self.sock, size - len(head))
+
+
+class BufferedStreamReader:
+    """Same as BufferedSocketReader for an asyncio StreamReader."""
+
+    def __init__(self, reader, pending=b""):
+        self.reader = reader
+        self.pending = pending
+
+    async def read_exact(self, size):
+        head, self.pending = self.pending[:size], self.pending[size:]
+        if len(head) == size:
+            return head
+        return head + await self.reader.readexactly(size - len(head))
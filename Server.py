@@ -1,90 +1,1156 @@
+import hashlib
+import json
+import os
+import queue
 import socket
 import threading
-from supabase import create_client, Client
-import Apikeys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import Config
+from Cache.Bucket_index import BucketIndex, decode_cursor, encode_cursor
+from Cache.Disk_cache import DiskCache, FileRange, head_key, make_key, sums_key
+from Cache.Prefetcher import Prefetcher
+from Database.Catalog import Catalog
+from Database.Passwords import hash_pool
+from Database.Sqlite_db import add_video, check_user, on_video_added, register_user
+from Log import get_logger
+from Media.Packager import Packager
+from Media.Previews import PreviewPipeline
+from Media.Probe import mp4_duration
+import Metrics
+from Metrics import metrics
+import Protocol
+from Sessions import sessions
+from Shaping import shaper
+from Storage.Backend import StorageError, get_backend
+from Storage.Uploads import UploadError, Uploads
 
-# Supabase client
-supabase: Client = create_client(Apikeys.SUPABASE_URL, Apikeys.SUPABASE_KEY)
+log = get_logger("server")
+
+# Local copy of recently served videos
+video_cache = DiskCache(Config.CACHE_DIR, Config.CACHE_MAX_BYTES, shared=Config.CACHE_SHARED)
+
+# ---------- List bucket ----------
+def list_bucket(bucket_name):
+    """Fetch a bucket's full listing from storage."""
+    started = time.monotonic()
+    try:
+        items = get_backend().list(bucket_name)
+    except Exception as err:
+        log.error("❌ Error listing videos in bucket '%s': %s", bucket_name, err)
+        return None
+    metrics.observe("storage_seconds", time.monotonic() - started, op="list")
+    return items
+
+
+# Every bucket's listing, kept in memory and refreshed in the background
+bucket_index = BucketIndex(list_bucket, Config.LIST_INDEX_TTL)
+
+# (bucket, file) -> (fetched_at, info) so hot titles don't stat storage on every GET
+_info_cache = {}
+_info_lock = threading.Lock()
 
 
 # ---------- Get video bytes ----------
 def get_video_bytes(bucket_name, file_name):
-    print(f"🎥 Trying to fetch '{file_name}' from bucket '{bucket_name}'...")
+    log.debug("🎥 Trying to fetch '%s' from bucket '%s'...", file_name, bucket_name)
     try:
-        result = supabase.storage.from_(bucket_name).download(file_name)
-        print(f"✅ Successfully fetched '{file_name}' ({len(result)} bytes)")
+        result = get_backend().read_all(bucket_name, file_name)
+        log.debug("✅ Successfully fetched '%s' (%d bytes)", file_name, len(result))
         return result
     except Exception as err:
-        print(f"❌ Couldn't fetch '{file_name}' from '{bucket_name}':", err)
+        log.error("❌ Couldn't fetch '%s' from '%s': %s", file_name, bucket_name, err)
         return None
 
 
-# ---------- Get list of videos ----------
-def get_video_list(bucket_name):
+# ---------- Get object metadata ----------
+def get_video_info(bucket_name, file_name):
+    """Return {"size", "version"} for a stored object, or None if it doesn't exist."""
+    entry = bucket_index.peek(bucket_name, file_name)
+    if entry is not None:
+        return {"size": entry["size"], "version": entry["version"]}
+
+    now = time.monotonic()
+    with _info_lock:
+        cached = _info_cache.get((bucket_name, file_name))
+    if cached and now - cached[0] < Config.CACHE_INFO_TTL:
+        return cached[1]
+
     try:
-        bucket_items = supabase.storage.from_(bucket_name).list()
-        return [f["name"] for f in bucket_items]
+        info = get_backend().stat(bucket_name, file_name)
     except Exception as err:
-        print(f"❌ Error listing videos in bucket '{bucket_name}':", err)
-        return []
+        if cached:
+            # Storage is down or slow: what it said last time beats nothing, and it
+            # still finds the video in the disk cache
+            log.warning("⚠️ Couldn't stat '%s' in '%s' (%s), using what it said %.0fs ago",
+                        file_name, bucket_name, err, now - cached[0])
+            metrics.inc("stale_info_total")
+            return cached[1]
+        log.error("❌ Couldn't stat '%s' in '%s': %s", file_name, bucket_name, err)
+        return None
+    metrics.observe("storage_seconds", time.monotonic() - now, op="stat")
 
+    with _info_lock:
+        _info_cache[(bucket_name, file_name)] = (now, info)
+    return info
 
-# ---------- Handle client ----------
-def handle_client(client_socket, address):
-    print(f"🔗 Client connected: {address}")
+
+# HLS renditions of each video, cut in the background by ffmpeg
+packager = Packager(info=get_video_info)
+
+
+# Uploads being received, staged on disk until complete
+uploads = Uploads()
+
+
+# Titles of every bucket, shared by all clients
+catalog = Catalog()
+
+# Duration, resolution, bitrate and poster of every catalog video, made in the background
+previews = PreviewPipeline()
+
+# Newly added videos get their renditions cut and their preview made before anyone presses play
+on_video_added(lambda name, user_name, bucket_name: packager.manifest(bucket_name, name))
+on_video_added(lambda *_: previews.poke())
+
+
+# ---------- Stream video from storage ----------
+def download_chunks(bucket_name, file_name, offset=0, length=None,
+                    chunk_size=Config.STREAM_CHUNK_SIZE):
+    """Yield the object's bytes (or just offset..offset+length) as they arrive from storage."""
+    started = time.monotonic()
+    chunks = get_backend().read(bucket_name, file_name, offset, length, chunk_size)
     try:
-        data = client_socket.recv(1024).decode().strip()
-        print(f"📩 Request from {address}: {data}")
+        while True:
+            # Prefetching pauses only while a chunk is on its way, not while the client is
+            # slow to take it or a long stream sits idle
+            with prefetcher.foreground():
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            if started is not None:
+                metrics.observe("storage_seconds", time.monotonic() - started, op="download")
+                started = None
+            yield chunk
+    finally:
+        chunks.close()
+
+
+def relay_chunks(chunks, max_chunks=Config.STREAM_QUEUE_CHUNKS):
+    """
+    Read chunks on a background thread into a bounded queue. When the client
+    falls behind the queue fills up and reading from storage pauses.
+    """
+    buffer = queue.Queue(maxsize=max_chunks)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+            put(None)
+        except Exception as err:
+            put(err)
+        finally:
+            chunks.close()
 
-        if data.startswith("GET"):
-            parts = data.split(" ", 2)  # Split into 3 parts: GET, bucket, filename
-            if len(parts) < 3:
-                client_socket.send(b"ERROR: Missing bucket or file name.")
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is None:
                 return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def open_video_stream(bucket_name, file_name):
+    """
+    Return (size, chunks) for a stored video, or None if it doesn't exist.
+    Local files are sent as they are; remote videos that fit the cache are
+    streamed through it, larger ones are relayed straight from storage.
+    """
+    info = get_video_info(bucket_name, file_name)
+    if info is None or info["size"] is None:
+        return None
+    size = info["size"]
+
+    direct = get_backend().open_range(bucket_name, file_name, 0, size)
+    if direct is not None:
+        return size, direct
+
+    if size <= video_cache.max_bytes:
+        key = make_key(bucket_name, file_name, info["version"])
+        chunks = video_cache.stream(
+            key, size,
+            lambda: download_chunks(bucket_name, file_name),
+            Config.STREAM_CHUNK_SIZE,
+        )
+        result = "hit" if isinstance(chunks, FileRange) else "miss"
+        metrics.inc("cache_lookups_total", result=result)
+    else:
+        chunks = relay_chunks(download_chunks(bucket_name, file_name))
+    return size, chunks
+
+
+def open_video_range(bucket_name, file_name, offset, length):
+    """
+    Return (offset, length, total, chunks) for part of a stored video, or None
+    if it doesn't exist. length 0 means "to the end of the file". The range is
+    read from the disk cache when present, otherwise only that range is
+    fetched from storage.
+    """
+    info = get_video_info(bucket_name, file_name)
+    if info is None or info["size"] is None:
+        return None
+    total = info["size"]
+
+    offset = min(offset, total)
+    end = total if length == 0 else min(total, offset + length)
+    length = end - offset
+    if length == 0:
+        return offset, 0, total, None
+
+    direct = get_backend().open_range(bucket_name, file_name, offset, length)
+    if direct is not None:
+        return offset, length, total, direct
+
+    key = make_key(bucket_name, file_name, info["version"])
+    chunks = video_cache.read_range(key, offset, length, Config.STREAM_CHUNK_SIZE)
+    metrics.inc("cache_lookups_total", result="miss" if chunks is None else "hit")
+    if chunks is None:
+        chunks = relay_chunks(download_chunks(bucket_name, file_name, offset, length))
+    return offset, length, total, chunks
+
+
+# ---------- Checksums ----------
+# Segment sizes a client may ask checksums for: bounds the work and the reply size
+MIN_SUM_SEGMENT = 64 * 1024
+MAX_SUM_SEGMENT = 64 * 1024 * 1024
+
+# Videos are hashed off the request threads; a CHECKSUMS that finds none answers "pending"
+_sum_pool = ThreadPoolExecutor(Config.CHECKSUM_WORKERS, thread_name_prefix="checksums")
+_sum_jobs = {}                # cache key -> Future of the hashing running for it
+_sum_failed = OrderedDict()   # cache key -> error of its last hashing, reported to the next ask
+_sum_lock = threading.Lock()
+PENDING = {"status": "pending"}
+
+
+def _cached_sums(key):
+    path = video_cache.get(key)
+    if not path:
+        return None
+    try:
+        with open(path, "rb") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # evicted or damaged: hash again
+
+
+def get_checksums(bucket_name, file_name, segment_size):
+    """
+    {"size", "version", "segment_size", "sha256", "segments"} for a stored
+    video, or None if it doesn't exist: the SHA-256 of the whole file and a
+    BLAKE2b-128 of every segment_size piece, so a client can check each
+    piece as it arrives and the file once it has it all. Worked out once
+    per object version in the background and kept in the disk cache; until
+    then the answer is {"status": "pending"}. Raises if hashing failed.
+    """
+    info = get_video_info(bucket_name, file_name)
+    if info is None or info["size"] is None:
+        return None
+    key = sums_key(make_key(bucket_name, file_name, info["version"]), segment_size)
+
+    sums = _cached_sums(key)
+    if sums is not None:
+        return sums
+    with _sum_lock:
+        error = _sum_failed.pop(key, None)
+        if error is not None:
+            if isinstance(error, FileNotFoundError):
+                return None
+            raise error
+        if key in _sum_jobs:
+            return PENDING
+        sums = _cached_sums(key)  # it may have finished since the look above
+        if sums is not None:
+            return sums
+        job = _sum_jobs[key] = _sum_pool.submit(
+            _hash_video, bucket_name, file_name, info["version"], key, segment_size
+        )
+    # Outside the lock: a job that has already finished runs its callback right here
+    job.add_done_callback(lambda done: _hashed(key, done))
+    return PENDING
+
+
+def _hashed(key, job):
+    """A hashing job ended; keep its error, if any, for the CHECKSUMS that asks next."""
+    with _sum_lock:
+        _sum_jobs.pop(key, None)
+        error = job.exception()
+        if error is not None:
+            _sum_failed[key] = error
+            while len(_sum_failed) > 256:
+                _sum_failed.popitem(last=False)
+
+
+def _hash_video(bucket_name, file_name, version, key, segment_size):
+    """Read the video once and keep its checksums under key in the disk cache."""
+    # Remote videos that fit are read through the cache, so a download started
+    # alongside shares the transfer and later ones are served from disk
+    stream = open_video_stream(bucket_name, file_name)
+    if stream is None:
+        raise FileNotFoundError(file_name)
+    size, chunks = stream
+    whole, segments, piece, read = hashlib.sha256(), [], hashlib.blake2b(digest_size=16), 0
+    started = time.monotonic()
+    try:
+        for chunk in chunks:
+            whole.update(chunk)
+            view = memoryview(chunk)
+            while view:
+                take = min(len(view), segment_size - read % segment_size)
+                piece.update(view[:take])
+                read += take
+                view = view[take:]
+                if read % segment_size == 0:
+                    segments.append(piece.hexdigest())
+                    piece = hashlib.blake2b(digest_size=16)
+    finally:
+        chunks.close()
+    if read != size:
+        raise StorageError(f"expected {size} bytes, read {read}")
+    if read % segment_size:
+        segments.append(piece.hexdigest())
+
+    sums = {
+        "size": size, "version": version, "segment_size": segment_size,
+        "sha256": whole.hexdigest(), "segments": segments,
+    }
+    video_cache.put(key, json.dumps(sums).encode())
+    log.debug("🧮 Hashed '%s' in %.2fs", file_name, time.monotonic() - started)
+
+
+# ---------- Prefetch ----------
+def warm_video_head(bucket_name, file_name, throttle):
+    """Get the first PREFETCH_HEAD_BYTES of a video onto local disk, unless already there."""
+    info = get_video_info(bucket_name, file_name)
+    if info is None or not info["size"]:
+        return
+    length = min(Config.PREFETCH_HEAD_BYTES, info["size"])
+
+    direct = get_backend().open_range(bucket_name, file_name, 0, length)
+    if direct is not None:
+        # Already a local file: just ask the kernel to read it into the page cache
+        try:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(direct.file.fileno(), 0, length, os.POSIX_FADV_WILLNEED)
+        finally:
+            direct.close()
+        return
+
+    key = make_key(bucket_name, file_name, info["version"])
+    if video_cache.get(key) or video_cache.get(head_key(key)):
+        return
+    head = bytearray()
+    started = time.monotonic()
+    chunks = get_backend().read(bucket_name, file_name, 0, length)
+    try:
+        for chunk in chunks:
+            throttle(len(chunk))
+            head += chunk
+    finally:
+        chunks.close()
+    if len(head) == length:
+        video_cache.put(head_key(key), head)
+        metrics.observe("storage_seconds", time.monotonic() - started, op="prefetch")
+        log.debug("🔥 Prefetched %d bytes of '%s'", length, file_name)
+
+
+# Background warming of the titles clients are about to open
+prefetcher = Prefetcher(warm_video_head, Config.PREFETCH_RATE)
+
+
+def prefetch(bucket_name, file_name=None):
+    """Queue one title, or without file_name the first PREFETCH_TOP_N of the bucket."""
+    if file_name:
+        prefetcher.enqueue(bucket_name, file_name)
+        return True
+    page = bucket_index.page(bucket_name, None, Config.PREFETCH_TOP_N)
+    if page is None:
+        return False
+    # Queued last first: the queue runs newest first, so the top title is warmed first
+    for item in reversed(page[0]):
+        prefetcher.enqueue(bucket_name, item["name"])
+    return True
+
+
+# ---------- Media bitrate ----------
+# cache key -> seconds of video (None when it isn't an MP4 we can read)
+_durations = {}
+
+
+def _read_bytes(bucket_name, file_name, offset, length):
+    return b"".join(get_backend().read(bucket_name, file_name, offset, length))
+
+
+def media_bitrate(data):
+    """
+    ((bucket, file), bytes per second) of the video a GET, RANGE or SEGMENT
+    request is for, or None when that isn't known.
+    """
+    parts = data.split(" ", 4)
+    command = parts[0]
+    if command == "SEGMENT" and len(parts) == 5:
+        manifest = packager.manifest(parts[1], parts[4], start=False)
+        for rendition in manifest.get("renditions", []):
+            if rendition["name"] == parts[2]:
+                return (parts[1], parts[4]), rendition["bandwidth"] / 8
+        return None
+    if command == "GET" and len(parts) >= 3:
+        bucket_name, file_name = parts[1], data.split(" ", 2)[2]
+    elif command == "RANGE" and len(parts) == 5:
+        bucket_name, file_name = parts[1], parts[4]
+    else:
+        return None
+
+    info = get_video_info(bucket_name, file_name)
+    if info is None or not info["size"]:
+        return None
+    key = make_key(bucket_name, file_name, info["version"])
+    if key not in _durations:
+        try:
+            duration = mp4_duration(
+                lambda offset, length: _read_bytes(bucket_name, file_name, offset, length),
+                info["size"],
+            )
+        except Exception as err:
+            log.debug("⚠️ No duration for '%s': %s", file_name, err)
+            duration = None
+        if len(_durations) > 10000:
+            _durations.clear()
+        _durations[key] = duration
+    duration = _durations[key]
+    return ((bucket_name, file_name), info["size"] / duration) if duration else None
+
+
+# ---------- Get list of videos ----------
+def get_video_list(bucket_name):
+    snap = bucket_index.snapshot(bucket_name)
+    return list(snap["names"]) if snap else []
+
+
+def _single_chunk(data):
+    yield data
+
+
+# ---------- Build response ----------
+COMMANDS = ("GET", "RANGE", "LIST", "STATS", "MANIFEST", "SEGMENT", "PACKAGE",
+            "PUT", "PART", "COMMIT", "PREFETCH", "LOGIN", "REGISTER", "AUTH",
+            "CATALOG", "SEARCH", "RESOLVE", "PREVIEW", "POSTER", "CHECKSUMS")
+
+# Answered without a session even when Config.REQUIRE_AUTH is on
+OPEN_COMMANDS = ("STATS", "LOGIN", "REGISTER", "AUTH")
+
 
-            _, bucket_name, filename = parts
-            print(f"🪣 Bucket received from client: '{bucket_name}'")
-            print(f"🎥 File requested: '{filename}'")
+def prepare_response(data, token=None):
+    """
+    Turn one request line into (header, chunks, size). chunks is None when
+    the header alone is the whole reply (errors). Shared by every server mode.
+    token is the session the connection authenticated with, if any.
+    """
+    command = data.split(" ", 1)[0]
+    if not authorized(command, token):
+        header, chunks, size, bucket_name = b"ERROR: Login required.", None, 0, None
+    else:
+        header, chunks, size, bucket_name = _build_response(data)
+    if command not in COMMANDS:
+        command = "invalid"
+    status = "error" if chunks is None and header.startswith(b"ERROR") else "ok"
+    metrics.inc("requests_total", command=command, status=status)
+    if bucket_name is not None and status == "ok":
+        # Only buckets that answered, so junk names can't grow the label set
+        metrics.inc("bucket_requests_total", bucket=bucket_name, command=command)
+        metrics.inc("bucket_response_bytes_total", size, bucket=bucket_name)
+    return header, chunks, size
 
-            file_data = get_video_bytes(bucket_name, filename)  # Modify this function to accept bucket_name
 
-            if file_data:
-                size_str = str(len(file_data)).encode().ljust(16)
-                client_socket.send(size_str)
+def not_found_reply():
+    """Why a video couldn't be opened: clients retry later when storage is down."""
+    if not get_backend().healthy():
+        return b"ERROR: Storage unavailable, try again later."
+    return b"ERROR: Video not found or failed to download."
 
-                chunk_size = 4096
-                for i in range(0, len(file_data), chunk_size):
-                    client_socket.send(file_data[i:i + chunk_size])
-                print(f"✅ Done sending {filename} from bucket {bucket_name}")
+
+def _build_response(data):
+    """prepare_response plus the bucket the request was for, when there is one."""
+    if data.startswith("GET"):
+        parts = data.split(" ", 2)  # Split into 3 parts: GET, bucket, filename
+        if len(parts) < 3:
+            return b"ERROR: Missing bucket or file name.", None, 0, None
+
+        _, bucket_name, filename = parts
+        log.debug("🪣 Bucket '%s', file '%s'", bucket_name, filename)
+
+        stream = open_video_stream(bucket_name, filename)
+        if not stream:
+            return not_found_reply(), None, 0, None
+
+        size, chunks = stream
+        return str(size).encode().ljust(16), chunks, size, bucket_name
+
+    elif data.startswith("RANGE"):
+        # RANGE <bucket> <offset> <length> <filename>
+        parts = data.split(" ", 4)
+        if len(parts) < 5:
+            return b"ERROR: Usage RANGE <bucket> <offset> <length> <file>.", None, 0, None
+        _, bucket_name, offset, length, filename = parts
+        try:
+            offset, length = int(offset), int(length)
+        except ValueError:
+            return b"ERROR: Offset and length must be integers.", None, 0, None
+        if offset < 0 or length < 0:
+            return b"ERROR: Offset and length must not be negative.", None, 0, None
+
+        stream = open_video_range(bucket_name, filename, offset, length)
+        if not stream:
+            return not_found_reply(), None, 0, None
+
+        # Header: offset, length and total size, 16 bytes each
+        offset, length, total, chunks = stream
+        header = b"".join(str(n).encode().ljust(16) for n in (offset, length, total))
+        return header, chunks, length, bucket_name
+
+    elif data.startswith("LIST"):
+        # LIST <bucket> [cursor] [limit]
+        parts = data.split()
+        if len(parts) < 2 or len(parts) > 4:
+            return b"ERROR: Usage LIST <bucket> [cursor] [limit].", None, 0, None
+        bucket_name = parts[1]
+        cursor = parts[2] if len(parts) > 2 and parts[2] != "-" else None
+        try:
+            limit = int(parts[3]) if len(parts) > 3 else Config.LIST_PAGE_SIZE
+            if cursor:
+                decode_cursor(cursor)
+        except ValueError:
+            return b"ERROR: Bad cursor or limit.", None, 0, None
+        limit = max(1, min(limit, Config.LIST_MAX_PAGE_SIZE))
+
+        page = bucket_index.page(bucket_name, cursor, limit)
+        if page is None:
+            return b"ERROR: Could not list bucket.", None, 0, None
+        items, next_cursor, total = page
+
+        # Header: body size (16 bytes), then a JSON page
+        body = json.dumps({
+            "items": [
+                {"name": i["name"], "size": i["size"], "mtime": i["mtime"]} for i in items
+            ],
+            "next": next_cursor,
+            "total": total,
+        }).encode()
+        return str(len(body)).encode().ljust(16), _single_chunk(body), len(body), bucket_name
+
+    elif data.startswith(("MANIFEST", "PACKAGE")):
+        # MANIFEST <bucket> <file>: rendition ladder as JSON, packaging the video if needed
+        # PACKAGE <bucket> <file>: same, sent at upload time so the ladder is ready early
+        parts = data.split(" ", 2)
+        if len(parts) < 3:
+            return b"ERROR: Missing bucket or file name.", None, 0, None
+        _, bucket_name, filename = parts
+        manifest = packager.manifest(bucket_name, filename)
+        if manifest["status"] == "missing":
+            return b"ERROR: Video not found.", None, 0, None
+
+        body = json.dumps(manifest).encode()
+        return str(len(body)).encode().ljust(16), _single_chunk(body), len(body), bucket_name
+
+    elif data.startswith("SEGMENT"):
+        # SEGMENT <bucket> <rendition> <index> <filename>
+        parts = data.split(" ", 4)
+        if len(parts) < 5:
+            return b"ERROR: Usage SEGMENT <bucket> <rendition> <index> <file>.", None, 0, None
+        _, bucket_name, rendition, index, filename = parts
+        try:
+            index = int(index)
+        except ValueError:
+            return b"ERROR: Segment index must be an integer.", None, 0, None
+
+        segment = packager.segment(bucket_name, filename, rendition, index) if index >= 0 else None
+        if segment is None:
+            return b"ERROR: Segment not found.", None, 0, None
+        return str(segment.length).encode().ljust(16), segment, segment.length, bucket_name
+
+    elif data.startswith("PUT"):
+        # PUT <bucket> <size> <fingerprint> <filename>: start or resume an upload
+        parts = data.split(" ", 4)
+        if len(parts) < 5:
+            return b"ERROR: Usage PUT <bucket> <size> <fingerprint> <file>.", None, 0, None
+        _, bucket_name, size, fingerprint, filename = parts
+        try:
+            size = int(size)
+        except ValueError:
+            return b"ERROR: Size must be an integer.", None, 0, None
+        if size < 0 or "/" in filename or filename.startswith("."):
+            return b"ERROR: Bad size or file name.", None, 0, None
+
+        try:
+            body = json.dumps(uploads.begin(bucket_name, filename, size, fingerprint)).encode()
+        except (OSError, UploadError) as err:
+            log.error("❌ Couldn't start upload of '%s': %s", filename, err)
+            return b"ERROR: Could not start upload.", None, 0, None
+        return str(len(body)).encode().ljust(16), _single_chunk(body), len(body), bucket_name
+
+    elif data.startswith("COMMIT"):
+        # COMMIT <upload> <sha256> [title]: store the finished upload as the object
+        # and list it in the catalog under title (the file name without extension)
+        parts = data.split(" ", 3)
+        if len(parts) < 3:
+            return b"ERROR: Usage COMMIT <upload> <sha256> [title].", None, 0, None
+        started = time.monotonic()
+        try:
+            meta = uploads.commit(parts[1], parts[2], get_backend().write)
+        except UploadError as err:
+            return f"ERROR: {err}.".encode(), None, 0, None
+        except (OSError, StorageError) as err:
+            log.error("❌ Couldn't store upload %s: %s", parts[1], err)
+            return b"ERROR: Could not store upload.", None, 0, None
+        metrics.observe("storage_seconds", time.monotonic() - started, op="upload")
+
+        # The new object is listed and served from now on
+        bucket_name = meta["bucket"]
+        bucket_index.invalidate(bucket_name)
+        with _info_lock:
+            _info_cache.pop((bucket_name, meta["name"]), None)
+        title = parts[3] if len(parts) > 3 and parts[3] else os.path.splitext(meta["name"])[0]
+        added = add_video(meta["name"], title, bucket_name)
+        if not added:
+            previews.forget(bucket_name, meta["name"])  # re-upload of a listed file
+
+        body = json.dumps({
+            "name": meta["name"], "size": meta["size"], "sha256": parts[2],
+            "title": title, "added": added,
+        }).encode()
+        return str(len(body)).encode().ljust(16), _single_chunk(body), len(body), bucket_name
+
+    elif data.startswith("PART"):
+        return b"ERROR: PART needs a framed connection.", None, 0, None
+
+    elif data.startswith(("LOGIN ", "REGISTER ")):
+        # LOGIN|REGISTER <email> <password>: a session token for AUTH, as JSON
+        parts = data.split(" ", 2)
+        if len(parts) < 3 or not parts[1] or not parts[2]:
+            return b"ERROR: Usage LOGIN|REGISTER <email> <password>.", None, 0, None
+        # Hashing is slow on purpose; the pool bounds how many run at once
+        return hash_pool.submit(_account, *parts).result()
+
+    elif data.startswith("CATALOG"):
+        # CATALOG <bucket> [cursor] [limit]: a page of titles, in title order
+        # CATALOG <bucket> SINCE <version>: what changed in the bucket after version
+        parts = data.split()
+        if len(parts) < 2 or len(parts) > 4:
+            return b"ERROR: Usage CATALOG <bucket> [cursor|SINCE <version>] [limit].", None, 0, None
+        bucket_name = parts[1]
+        try:
+            if len(parts) == 4 and parts[2] == "SINCE":
+                limit = Config.LIST_MAX_PAGE_SIZE
+                version, changes = catalog.changes(bucket_name, int(parts[3]), limit)
+                reply = {
+                    "version": version,
+                    "changes": changes and [list(c) for c in changes],
+                    "more": bool(changes) and len(changes) == limit,  # ask again from the last one
+                }
             else:
-                client_socket.send(b"ERROR: Video not found or failed to download.")
+                after = None
+                if len(parts) > 2 and parts[2] != "-":
+                    # The cursor comes back from the client: only a (user_name, name) pair will do
+                    after = json.loads(decode_cursor(parts[2]))
+                    if not isinstance(after, list) or len(after) != 2 \
+                            or not all(isinstance(key, str) for key in after):
+                        raise ValueError("bad cursor")
+                    after = tuple(after)
+                limit = int(parts[3]) if len(parts) > 3 else Config.CATALOG_PAGE_SIZE
+                limit = max(1, min(limit, Config.LIST_MAX_PAGE_SIZE))
+                version, page = catalog.page(bucket_name, after, limit)
+                next_cursor = encode_cursor(json.dumps(page[-1])) if len(page) == limit else None
+                reply = {"version": version, "items": [list(row) for row in page], "next": next_cursor}
+        except (ValueError, TypeError):
+            return b"ERROR: Bad cursor, version or limit.", None, 0, None
+
+        body = json.dumps(reply).encode()
+        known = reply.get("items") or reply.get("changes")
+        return str(len(body)).encode().ljust(16), _single_chunk(body), len(body), \
+            bucket_name if known else None
+
+    elif data.startswith("SEARCH"):
+        # SEARCH <limit> <query>: best matching titles across every bucket
+        parts = data.split(" ", 2)
+        if len(parts) < 3:
+            return b"ERROR: Usage SEARCH <limit> <query>.", None, 0, None
+        try:
+            limit = max(1, min(int(parts[1]), Config.LIST_MAX_PAGE_SIZE))
+        except ValueError:
+            return b"ERROR: Limit must be an integer.", None, 0, None
+        version, results = catalog.search(parts[2], limit)
+        body = json.dumps({"version": version, "results": [list(r) for r in results]}).encode()
+        return str(len(body)).encode().ljust(16), _single_chunk(body), len(body), None
+
+    elif data.startswith("RESOLVE"):
+        # RESOLVE <bucket> <title>: the stored file name of a title
+        parts = data.split(" ", 2)
+        if len(parts) < 3:
+            return b"ERROR: Usage RESOLVE <bucket> <title>.", None, 0, None
+        _, bucket_name, title = parts
+        version, name = catalog.resolve(bucket_name, title)
+        if name is None:
+            return b"ERROR: Title not found.", None, 0, None
+        body = json.dumps({"version": version, "name": name}).encode()
+        return str(len(body)).encode().ljust(16), _single_chunk(body), len(body), bucket_name
+
+    elif data.startswith("PREVIEW"):
+        # PREVIEW <bucket> <file>: duration, resolution, bitrate and poster size as JSON
+        parts = data.split(" ", 2)
+        if len(parts) < 3:
+            return b"ERROR: Missing bucket or file name.", None, 0, None
+        _, bucket_name, filename = parts
+        info = previews.info(bucket_name, filename)
+        if info is None:
+            return b"ERROR: Video not found.", None, 0, None
+        body = json.dumps(info).encode()
+        return str(len(body)).encode().ljust(16), _single_chunk(body), len(body), bucket_name
+
+    elif data.startswith("POSTER"):
+        # POSTER <bucket> <file>: the poster JPEG
+        parts = data.split(" ", 2)
+        if len(parts) < 3:
+            return b"ERROR: Missing bucket or file name.", None, 0, None
+        _, bucket_name, filename = parts
+        poster = previews.poster(bucket_name, filename)
+        if poster is None:
+            return b"ERROR: No poster.", None, 0, None
+        return str(len(poster)).encode().ljust(16), _single_chunk(poster), len(poster), bucket_name
+
+    elif data.startswith("CHECKSUMS"):
+        # CHECKSUMS <bucket> <segment size> <file>: whole-file and per-segment digests as JSON,
+        # or {"status": "pending"} while they are still being worked out; ask again later
+        parts = data.split(" ", 3)
+        if len(parts) < 4:
+            return b"ERROR: Usage CHECKSUMS <bucket> <segment size> <file>.", None, 0, None
+        _, bucket_name, segment_size, filename = parts
+        try:
+            segment_size = int(segment_size)
+        except ValueError:
+            return b"ERROR: Segment size must be an integer.", None, 0, None
+        if not MIN_SUM_SEGMENT <= segment_size <= MAX_SUM_SEGMENT:
+            return b"ERROR: Segment size out of range.", None, 0, None
+        try:
+            sums = get_checksums(bucket_name, filename, segment_size)
+        except Exception as err:
+            log.error("❌ Couldn't hash '%s': %s", filename, err)
+            return b"ERROR: Could not read video.", None, 0, None
+        if sums is None:
+            return not_found_reply(), None, 0, None
+        body = json.dumps(sums).encode()
+        return str(len(body)).encode().ljust(16), _single_chunk(body), len(body), bucket_name
+
+    elif data.startswith("PREFETCH"):
+        # PREFETCH <bucket> [filename]: warm a title, or the top of the bucket, in the background
+        parts = data.split(" ", 2)
+        if len(parts) < 2 or not parts[1]:
+            return b"ERROR: Usage PREFETCH <bucket> [file].", None, 0, None
+        if not prefetch(parts[1], parts[2] if len(parts) > 2 else None):
+            return b"ERROR: Could not list bucket.", None, 0, None
+        return b"OK", None, 0, None
+
+    if data.strip() == "STATS":
+        body = Metrics.render_all().encode()
+        return str(len(body)).encode().ljust(16), _single_chunk(body), len(body), None
+
+    return b"ERROR: Invalid request format.", None, 0, None
+
+
+# ---------- Accounts ----------
+def _account(command, email, password):
+    if command == "REGISTER":
+        if not register_user(email, password):
+            return b"ERROR: Email already registered.", None, 0, None
+    elif not check_user(email, password):
+        return b"ERROR: Invalid email or password.", None, 0, None
+
+    token, expires = sessions.issue(email)
+    log.info("🔑 %s for %s", "Registered" if command == "REGISTER" else "Logged in", email)
+    body = json.dumps({"token": token, "expires": expires, "email": email}).encode()
+    return str(len(body)).encode().ljust(16), _single_chunk(body), len(body), None
+
+
+def authenticate(data):
+    """
+    AUTH <token> on a framed connection. Returns (token or None, reply
+    header); the connection keeps the token and passes it with every later request.
+    """
+    parts = data.split()
+    token = parts[1] if len(parts) == 2 else None
+    if token is None or sessions.check(token) is None:
+        metrics.inc("requests_total", command="AUTH", status="error")
+        return None, b"ERROR: Invalid or expired session."
+    metrics.inc("requests_total", command="AUTH", status="ok")
+    return token, b"OK"
+
+
+def for_log(data):
+    """The request line with any password cut off, fit for the log."""
+    if data.startswith(("LOGIN ", "REGISTER ")):
+        return " ".join(data.split(" ", 2)[:2]) + " ***"
+    return data
+
+
+def is_auth_request(data):
+    return data.startswith("AUTH ")
+
+
+def authorized(command, token):
+    """Whether a request may run: a cache lookup per request, no password work."""
+    if not Config.REQUIRE_AUTH or command in OPEN_COMMANDS:
+        return True
+    return token is not None and sessions.check(token) is not None
+
+
+# ---------- Request bodies ----------
+def open_request_body(data, token=None):
+    """
+    PART <upload> <index> is followed by the part itself, as DATA frames and
+    then END. Returns (writer, None) for a PART request, or (None, error
+    header) when the part can't be taken; the body must be read either way.
+    """
+    if not authorized("PART", token):
+        return None, b"ERROR: Login required."
+    parts = data.split()
+    if len(parts) != 3:
+        return None, b"ERROR: Usage PART <upload> <index>."
+    try:
+        return uploads.open_part(parts[1], int(parts[2])), None
+    except ValueError:
+        return None, b"ERROR: Part index must be an integer."
+    except (OSError, UploadError) as err:
+        return None, f"ERROR: {err}.".encode()
+
+
+def finish_request_body(writer, error):
+    """Close out a PART body. Returns (header, chunks, size) like prepare_response."""
+    if writer is not None and error is None:
+        try:
+            body = json.dumps({"part": writer.index, "sha256": writer.finish()}).encode()
+        except (OSError, UploadError) as err:
+            error = f"ERROR: {err}.".encode()
+    elif writer is not None:
+        writer.abort()
 
-        elif data == "LIST":
-            # Optional: list videos for a specific bucket
-            client_socket.send(b"ERROR: LIST not implemented with bucket.")
+    metrics.inc("requests_total", command="PART", status="error" if error else "ok")
+    if error:
+        return error, None, 0
+    metrics.inc("bytes_received_total", writer.length)
+    return str(len(body)).encode().ljust(16), _single_chunk(body), len(body)
+
+
+def is_body_request(data):
+    return data.startswith("PART ")
+
+
+# ---------- Send engine ----------
+class UpstreamError(Exception):
+    """Reading the body from storage or the cache failed mid-response."""
+
+
+def tune_socket(sock):
+    # Replies are written whole, so there is nothing for Nagle's algorithm to gather;
+    # left on it holds every small reply on a kept-alive connection for a delayed ACK
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass
+    if Config.SEND_BUFFER_BYTES:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, Config.SEND_BUFFER_BYTES)
+        except OSError:
+            pass
+
+
+def _first_byte(started):
+    if started is not None:
+        metrics.observe("request_ttfb_seconds", time.monotonic() - started)
+
+
+def _wait_turn(pace, amount):
+    """Sleep until a shaped stream may send amount more bytes."""
+    wait = pace.reserve(amount)
+    if wait > 0:
+        metrics.inc("shaping_delay_seconds_total", wait)
+        time.sleep(wait)
+
+
+# Cached ranges up to this size are read into memory and sent with their frames in one write
+SMALL_BODY_BYTES = 64 * 1024
+
+
+def send_parts(sock, parts):
+    """sendall() of several buffers, in one write when the kernel takes them all."""
+    parts = [memoryview(part) for part in parts if part]
+    if not hasattr(sock, "sendmsg"):
+        sock.sendall(b"".join(parts))
+        return
+    while parts:
+        written = sock.sendmsg(parts)
+        while parts and written >= len(parts[0]):
+            written -= len(parts.pop(0))
+        if written:
+            parts[0] = parts[0][written:]
+
+
+def send_body(sock, chunks, request_id=None, started=None, pace=None,
+              lead=b"", trail=b"", size=None):
+    """
+    Write a response body and return the bytes sent. Cached files go through
+    sendfile() so the data never enters Python; anything else is written with
+    sendall(), which retries partial writes without copying the chunk.
+    With a request_id the body is wrapped in DATA frames. started is when
+    the request arrived (time.monotonic()), for the time-to-first-byte metric.
+    pace, a Shaping.StreamShaper, holds each quantum back until its turn.
+    lead (the HEADER frame) goes out in the same write as the first bytes of
+    the body and trail (END) in the one that completes size bytes, so a small
+    reply costs one write and one packet.
+    """
+    if isinstance(chunks, FileRange):
+        frame = b"" if request_id is None else Protocol.FRAME.pack(request_id, Protocol.DATA, chunks.length)
+        if chunks.length <= SMALL_BODY_BYTES and not pace:
+            data = os.pread(chunks.file.fileno(), chunks.length, chunks.offset)
+            send_parts(sock, (lead, frame, data, trail))
+            _first_byte(started)
+            metrics.add_sent(len(data))
+            return len(data)
+        send_parts(sock, (lead, frame))
+        block = pace.quantum if pace else Config.SENDFILE_BLOCK
+        sent = 0
+        while sent < chunks.length:
+            count = min(block, chunks.length - sent)
+            if pace:
+                _wait_turn(pace, count)
+            written = sock.sendfile(chunks.file, chunks.offset + sent, count)
+            if not written:
+                break
+            if not sent:
+                _first_byte(started)
+            sent += written
+            metrics.add_sent(written)
+        sock.sendall(trail)
+        return sent
+
+    sent = 0
+    while size is None or sent < size:
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            break
+        except Exception as err:
+            raise UpstreamError(err) from err
+        if pace:
+            _wait_turn(pace, len(chunk))
+        frame = b"" if request_id is None else Protocol.FRAME.pack(request_id, Protocol.DATA, len(chunk))
+        last = size is not None and sent + len(chunk) >= size
+        send_parts(sock, (lead, frame, chunk, trail if last else b""))
+        lead = b""
+        if last:
+            trail = b""
+        if not sent:
+            _first_byte(started)
+        sent += len(chunk)
+        metrics.add_sent(len(chunk))
+    send_parts(sock, (lead, trail))
+    return sent
+
+
+def serve_framed(client_socket, address, pending, shaping):
+    """Answer framed requests on one connection until the client hangs up."""
+    reader = Protocol.BufferedSocketReader(client_socket, pending)
+    client_socket.settimeout(Config.IDLE_TIMEOUT)
+    token = None  # session set by AUTH, checked on every request
+
+    while True:
+        raw = reader.read_exact(Protocol.FRAME.size)
+        if len(raw) < Protocol.FRAME.size:
+            return
+        request_id, kind, length = Protocol.FRAME.unpack(raw)
+        if kind != Protocol.REQUEST or length > Protocol.MAX_REQUEST_BYTES:
+            client_socket.sendall(
+                Protocol.pack_frame(request_id, Protocol.ERROR, b"ERROR: Bad frame.")
+            )
+            return
+        data = reader.read_exact(length).decode().strip()
+        started = time.monotonic()
+        log.debug("📩 Request %d from %s: %s", request_id, address, for_log(data))
+
+        if is_auth_request(data):
+            token, header = authenticate(data)
+            chunks = None
+        elif is_body_request(data):
+            header, chunks, size = receive_body(reader, request_id, data, token)
         else:
-            client_socket.send(b"ERROR: Invalid request format.")
+            header, chunks, size = prepare_response(data, token)
+        if chunks is None:
+            if header.startswith(b"ERROR"):
+                client_socket.sendall(Protocol.pack_frame(request_id, Protocol.ERROR, header))
+            else:
+                client_socket.sendall(
+                    Protocol.pack_frame(request_id, Protocol.HEADER, header)
+                    + Protocol.pack_frame(request_id, Protocol.END)
+                )
+            continue
+
+        try:
+            pace = shaping.stream(lambda: media_bitrate(data))
+            sent = send_body(
+                client_socket, chunks, request_id, started, pace,
+                lead=Protocol.pack_frame(request_id, Protocol.HEADER, header),
+                trail=Protocol.pack_frame(request_id, Protocol.END), size=size,
+            )
+        except UpstreamError as err:
+            # Storage failed mid-stream; the connection itself is still good
+            metrics.inc("upstream_errors_total")
+            log.error("❌ Upstream failed for %s: %s", data, err)
+            client_socket.sendall(
+                Protocol.pack_frame(request_id, Protocol.ERROR, b"ERROR: Upstream failed.")
+            )
+            continue
+        finally:
+            chunks.close()
+
+        if sent != size:
+            log.warning("❌ Sent only %d/%d bytes for %s", sent, size, data)
+
+
+def receive_body(reader, request_id, data, token=None):
+    """Read a request's DATA frames up to END into its writer."""
+    writer, error = open_request_body(data, token)
+    try:
+        while True:
+            raw = reader.read_exact(Protocol.FRAME.size)
+            if len(raw) < Protocol.FRAME.size:
+                raise ConnectionError("client left mid-upload")
+            frame_id, kind, length = Protocol.FRAME.unpack(raw)
+            if frame_id != request_id or kind not in (Protocol.DATA, Protocol.END) \
+                    or length > Protocol.MAX_DATA_BYTES:
+                raise ConnectionError("bad frame in request body")
+            if kind == Protocol.END:
+                break
+            chunk = reader.read_exact(length)
+            if len(chunk) < length:
+                raise ConnectionError("client left mid-upload")
+            if error is None:
+                try:
+                    writer.write(chunk)
+                except (OSError, UploadError) as err:
+                    error = f"ERROR: {err}.".encode()
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    return finish_request_body(writer, error)
+
+
+# ---------- Handle client ----------
+def handle_client(client_socket, address):
+    log.debug("🔗 Client connected: %s", address)
+    metrics.inc("connections_total")
+    metrics.gauge_add("connections_active", 1)
+    shaping = shaper.connection(address[0])
+    try:
+        tune_socket(client_socket)
+        raw = client_socket.recv(1024)
+        while raw and len(raw) < len(Protocol.MAGIC) and Protocol.MAGIC.startswith(raw):
+            more = client_socket.recv(1024)
+            if not more:
+                break
+            raw += more
+
+        if raw.startswith(Protocol.MAGIC):
+            serve_framed(client_socket, address, raw[len(Protocol.MAGIC):], shaping)
+            return
+
+        data = raw.decode().strip()
+        started = time.monotonic()
+        log.debug("📩 Request from %s: %s", address, for_log(data))
+
+        header, chunks, size = prepare_response(data)
+        client_socket.sendall(header)
+        if chunks is None:
+            return
+
+        try:
+            pace = shaping.stream(lambda: media_bitrate(data))
+            sent = send_body(client_socket, chunks, started=started, pace=pace)
+        finally:
+            chunks.close()
+        if sent == size:
+            log.debug("✅ Done sending %s", data)
+        else:
+            log.warning("❌ Sent only %d/%d bytes for %s", sent, size, data)
 
     except Exception as ex:
-        print(f"❌ Exception while handling {address}: {ex}")
+        log.error("❌ Exception while handling %s: %s", address, ex)
     finally:
+        shaping.close()
         client_socket.close()
-        print(f"🔒 Disconnected: {address}")
+        metrics.gauge_add("connections_active", -1)
+        log.debug("🔒 Disconnected: %s", address)
 
 
 # ---------- Start server ----------
-def start_server(host="0.0.0.0", port=9999):
-    print("🧠 Starting server...")
+def start_metrics_endpoint():
+    """Serve /metrics on Config.METRICS_PORT when it is set."""
+    try:
+        if Metrics.start_http_endpoint():
+            log.info("📊 Metrics at http://%s:%s/metrics", Config.METRICS_HOST, Config.METRICS_PORT)
+    except OSError as e:
+        log.error("❌ Failed to start metrics endpoint: %s", e)
+
+
+def start_server(host="0.0.0.0", port=9999, mode=Config.SERVER_MODE):
+    if mode == "async":
+        from Server_async import run_server
+        run_server(host, port)
+        return
+    if mode == "multi":
+        from Server_multi import run_supervisor
+        run_supervisor(host, port)
+        return
+
+    log.info("🧠 Starting server...")
     srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
         srv.bind((host, port))
     except Exception as e:
-        print("❌ Failed to bind socket:", e)
+        log.error("❌ Failed to bind socket: %s", e)
         return
 
-    srv.listen(5)
-    print(f"🚀 Server running at {host}:{port}")
-    print("💡 Waiting for clients...")
+    srv.listen(Config.LISTEN_BACKLOG)
+    start_metrics_endpoint()
+    previews.start()
+    log.info("🚀 Server running at %s:%s", host, port)
+    log.info("💡 Waiting for clients...")
 
     while True:
         sock, addr = srv.accept()
@@ -0,0 +1,343 @@
+import asyncio
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+import Config
+from Cache.Disk_cache import FileRange
+from Log import get_logger
+from Metrics import metrics
+import Protocol
+from Server import (
+    UpstreamError, authenticate, finish_request_body, for_log, is_auth_request, is_body_request,
+    media_bitrate, open_request_body, prepare_response, previews, start_metrics_endpoint,
+    tune_socket,
+)
+from Shaping import shaper
+from Storage.Uploads import UploadError
+
+log = get_logger("server.async")
+
+
+# ---------- Raise open file limit ----------
+def raise_file_limit():
+    """Let one process hold thousands of sockets (no-op where unsupported)."""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+# ---------- Async server ----------
+class AsyncVideoServer:
+    """Serves the GET protocol from one event loop instead of one thread per client."""
+
+    def __init__(self, host="0.0.0.0", port=9999, reuse_port=False, metrics_endpoint=True):
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port  # other worker processes listen on the same port
+        self.metrics_endpoint = metrics_endpoint
+        self.server = None
+        self.active = set()
+        self.idle = set()      # framed connections waiting for their next request
+        self.closing = False
+        # Storage and disk reads still block, so they run on a bounded pool
+        self.executor = ThreadPoolExecutor(max_workers=Config.ASYNC_IO_THREADS)
+
+    async def handle_connection(self, reader, writer):
+        address = writer.get_extra_info("peername")
+        if len(self.active) >= Config.MAX_CONNECTIONS:
+            writer.write(b"ERROR: Server busy, try again later.")
+            await self._close(writer)
+            return
+
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            tune_socket(sock)
+
+        task = asyncio.current_task()
+        self.active.add(task)
+        metrics.inc("connections_total")
+        metrics.gauge_add("connections_active", 1)
+        shaping = shaper.connection(address[0] if address else None)
+        try:
+            await self._serve(reader, writer, address, shaping)
+        except asyncio.TimeoutError:
+            log.debug("⌛ Timed out: %s", address)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as ex:
+            log.error("❌ Exception while handling %s: %s", address, ex)
+        finally:
+            shaping.close()
+            self.active.discard(task)
+            metrics.gauge_add("connections_active", -1)
+            await self._close(writer)
+
+    async def _serve(self, reader, writer, address, shaping):
+        loop = asyncio.get_running_loop()
+        raw = await asyncio.wait_for(reader.read(1024), Config.REQUEST_TIMEOUT)
+        while raw and len(raw) < len(Protocol.MAGIC) and Protocol.MAGIC.startswith(raw):
+            more = await asyncio.wait_for(reader.read(1024), Config.REQUEST_TIMEOUT)
+            if not more:
+                break
+            raw += more
+
+        if raw.startswith(Protocol.MAGIC):
+            await self._serve_framed(reader, writer, address, raw[len(Protocol.MAGIC):], shaping)
+            return
+
+        data = raw.decode().strip()
+        if not data:
+            return
+        started = time.monotonic()
+        log.debug("📩 Request from %s: %s", address, for_log(data))
+
+        header, chunks, size = await loop.run_in_executor(
+            self.executor, prepare_response, data
+        )
+        writer.write(header)
+        await asyncio.wait_for(writer.drain(), Config.WRITE_TIMEOUT)
+        if chunks is None:
+            return
+
+        sent = 0
+        try:
+            pace = await self._pace(shaping, data)
+            sent = await self._send_body(writer, chunks, started=started, pace=pace)
+        finally:
+            await loop.run_in_executor(self.executor, chunks.close)
+            if sent != size:
+                log.warning("❌ Sent only %d/%d bytes for %s", sent, size, data)
+
+    async def _serve_framed(self, reader, writer, address, pending, shaping):
+        """Answer framed requests on one connection until the client hangs up."""
+        loop = asyncio.get_running_loop()
+        frames = Protocol.BufferedStreamReader(reader, pending)
+        token = None  # session set by AUTH, checked on every request
+
+        task = asyncio.current_task()
+        while not self.closing:
+            self.idle.add(task)
+            try:
+                raw = await asyncio.wait_for(
+                    frames.read_exact(Protocol.FRAME.size), Config.IDLE_TIMEOUT
+                )
+            except asyncio.IncompleteReadError:
+                return
+            finally:
+                self.idle.discard(task)
+            request_id, kind, length = Protocol.FRAME.unpack(raw)
+            if kind != Protocol.REQUEST or length > Protocol.MAX_REQUEST_BYTES:
+                writer.write(Protocol.pack_frame(request_id, Protocol.ERROR, b"ERROR: Bad frame."))
+                return
+            payload = await asyncio.wait_for(frames.read_exact(length), Config.REQUEST_TIMEOUT)
+            data = payload.decode().strip()
+            started = time.monotonic()
+            log.debug("📩 Request %d from %s: %s", request_id, address, for_log(data))
+
+            if is_auth_request(data):
+                # A cache lookup, cheap enough for the event loop
+                token, header = authenticate(data)
+                chunks = None
+            elif is_body_request(data):
+                header, chunks, size = await self._receive_body(frames, request_id, data, token)
+            else:
+                header, chunks, size = await loop.run_in_executor(
+                    self.executor, prepare_response, data, token
+                )
+            if chunks is None:
+                if header.startswith(b"ERROR"):
+                    writer.write(Protocol.pack_frame(request_id, Protocol.ERROR, header))
+                else:
+                    writer.write(Protocol.pack_frame(request_id, Protocol.HEADER, header))
+                    writer.write(Protocol.pack_frame(request_id, Protocol.END))
+                await asyncio.wait_for(writer.drain(), Config.WRITE_TIMEOUT)
+                continue
+
+            writer.write(Protocol.pack_frame(request_id, Protocol.HEADER, header))
+            sent = 0
+            try:
+                pace = await self._pace(shaping, data)
+                sent = await self._send_body(writer, chunks, request_id, started, pace)
+            except UpstreamError as err:
+                # Storage failed mid-stream; the connection itself is still good
+                metrics.inc("upstream_errors_total")
+                log.error("❌ Upstream failed for %s: %s", data, err)
+                writer.write(Protocol.pack_frame(request_id, Protocol.ERROR, b"ERROR: Upstream failed."))
+                await asyncio.wait_for(writer.drain(), Config.WRITE_TIMEOUT)
+                continue
+            finally:
+                await loop.run_in_executor(self.executor, chunks.close)
+
+            writer.write(Protocol.pack_frame(request_id, Protocol.END))
+            await asyncio.wait_for(writer.drain(), Config.WRITE_TIMEOUT)
+            if sent != size:
+                log.warning("❌ Sent only %d/%d bytes for %s", sent, size, data)
+
+    async def _receive_body(self, frames, request_id, data, token=None):
+        """Read a request's DATA frames up to END into its writer (see Server.receive_body)."""
+        loop = asyncio.get_running_loop()
+        part, error = await loop.run_in_executor(self.executor, open_request_body, data, token)
+        try:
+            while True:
+                raw = await asyncio.wait_for(
+                    frames.read_exact(Protocol.FRAME.size), Config.REQUEST_TIMEOUT
+                )
+                frame_id, kind, length = Protocol.FRAME.unpack(raw)
+                if frame_id != request_id or kind not in (Protocol.DATA, Protocol.END) \
+                        or length > Protocol.MAX_DATA_BYTES:
+                    raise ConnectionError("bad frame in request body")
+                if kind == Protocol.END:
+                    break
+                chunk = await asyncio.wait_for(frames.read_exact(length), Config.REQUEST_TIMEOUT)
+                if error is None:
+                    try:
+                        await loop.run_in_executor(self.executor, part.write, chunk)
+                    except (OSError, UploadError) as err:
+                        error = f"ERROR: {err}.".encode()
+        except BaseException:
+            if part is not None:
+                part.abort()
+            raise
+        return await loop.run_in_executor(self.executor, finish_request_body, part, error)
+
+    async def _pace(self, shaping, data):
+        """The StreamShaper for a response body, or None when it goes out unshaped."""
+        if not shaping.shaper.limits()["pace_factor"]:
+            return shaping.stream()
+        # Finding the video's bitrate may read storage
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, shaping.stream, lambda: media_bitrate(data)
+        )
+
+    @staticmethod
+    async def _wait_turn(pace, amount):
+        wait = pace.reserve(amount)
+        if wait > 0:
+            metrics.inc("shaping_delay_seconds_total", wait)
+            await asyncio.sleep(wait)
+
+    async def _send_body(self, writer, chunks, request_id=None, started=None, pace=None):
+        """
+        Write a response body, in DATA frames when request_id is given.
+        started is when the request arrived, for the time-to-first-byte metric.
+        pace, a Shaping.StreamShaper, holds each quantum back until its turn.
+        """
+        loop = asyncio.get_running_loop()
+        if isinstance(chunks, FileRange):
+            if request_id is not None:
+                writer.write(Protocol.FRAME.pack(request_id, Protocol.DATA, chunks.length))
+                await asyncio.wait_for(writer.drain(), Config.WRITE_TIMEOUT)
+            return await self._sendfile(writer, chunks, started, pace)
+
+        sent = 0
+        while True:
+            try:
+                chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+            except Exception as err:
+                raise UpstreamError(err) from err
+            if chunk is None:
+                return sent
+            if pace:
+                await self._wait_turn(pace, len(chunk))
+            if request_id is not None:
+                writer.write(Protocol.FRAME.pack(request_id, Protocol.DATA, len(chunk)))
+            writer.write(chunk)
+            # drain() waits while the client's socket buffer is full
+            await asyncio.wait_for(writer.drain(), Config.WRITE_TIMEOUT)
+            if not sent and started is not None:
+                metrics.observe("request_ttfb_seconds", time.monotonic() - started)
+            sent += len(chunk)
+            metrics.add_sent(len(chunk))
+
+    async def _sendfile(self, writer, body, started=None, pace=None):
+        """Send a cached file with the kernel's sendfile, block by block."""
+        loop = asyncio.get_running_loop()
+        block = pace.quantum if pace else Config.SENDFILE_BLOCK
+        sent = 0
+        while sent < body.length:
+            count = min(block, body.length - sent)
+            if pace:
+                await self._wait_turn(pace, count)
+            written = await asyncio.wait_for(
+                loop.sendfile(writer.transport, body.file, body.offset + sent, count),
+                Config.WRITE_TIMEOUT,
+            )
+            if not written:
+                break
+            if not sent and started is not None:
+                metrics.observe("request_ttfb_seconds", time.monotonic() - started)
+            sent += written
+            metrics.add_sent(written)
+        return sent
+
+    async def _close(self, writer):
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+    async def serve(self, stop_event):
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port,
+            backlog=Config.LISTEN_BACKLOG, reuse_address=True, reuse_port=self.reuse_port or None,
+        )
+        if self.metrics_endpoint:
+            start_metrics_endpoint()
+        previews.start()
+        log.info("🚀 Async server running at %s:%s", self.host, self.port)
+        log.info("💡 Waiting for clients...")
+
+        await stop_event.wait()
+        await self.shutdown()
+
+    async def shutdown(self):
+        """Stop accepting, let active transfers finish, then cancel stragglers."""
+        log.info("🛑 Shutting down, draining active connections...")
+        self.closing = True
+        self.server.close()
+
+        # Connections between requests have nothing to finish
+        for task in list(self.idle):
+            task.cancel()
+        if self.active:
+            _, pending = await asyncio.wait(set(self.active), timeout=Config.SHUTDOWN_GRACE)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+        await self.server.wait_closed()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        log.info("🔒 Server stopped")
+
+
+# ---------- Start server ----------
+def run_server(host="0.0.0.0", port=9999, reuse_port=False, metrics_endpoint=True):
+    log.info("🧠 Starting async server...")
+    raise_file_limit()
+
+    async def main():
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+        await AsyncVideoServer(host, port, reuse_port, metrics_endpoint).serve(stop_event)
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        log.error("❌ Failed to bind socket: %s", e)
+
+
+if __name__ == "__main__":
+    run_server()
@@ -0,0 +1,198 @@
+"""
+Multi-process server: one async worker per core, all listening on the same
+port with SO_REUSEPORT so the kernel spreads new connections across them.
+
+The supervisor only watches the workers. It restarts any that exit, with a
+growing delay if one keeps dying right after start, and on SIGINT/SIGTERM
+asks every worker to drain (see AsyncVideoServer.shutdown). Workers share
+the disk cache (DiskCache shared mode) and publish their stats to a temp
+directory; STATS on any worker, and the supervisor's /metrics endpoint,
+report the sum over all of them.
+
+The supervisor owns the settings every worker must agree on (shared cache
+mode, the session signing key). It decides them once and hands them to
+each worker, which puts them into its Config before Server is imported.
+"""
+import json
+import multiprocessing
+import os
+import secrets
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from multiprocessing.connection import wait
+import Config
+from Log import get_logger
+import Metrics
+
+log = get_logger("server.multi")
+
+# A worker that exits sooner than this after starting is restarted with a delay
+MIN_UPTIME = 5.0
+MAX_RESTART_DELAY = 30.0
+
+
+# ---------- Worker ----------
+def _configure(settings):
+    """Apply the supervisor's settings; must run before Server is imported."""
+    for name, value in settings.items():
+        setattr(Config, name, value)
+
+
+def _worker_main(host, port, stats_dir, settings):
+    _configure(settings)
+    Metrics.share(stats_dir)
+    from Server_async import run_server
+    run_server(host, port, reuse_port=True, metrics_endpoint=False)
+
+
+def _check_port(host, port):
+    """Fail early, in the supervisor, if the port is taken by something else."""
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        probe.bind((host, port))
+    finally:
+        probe.close()
+
+
+# ---------- Supervisor ----------
+class Supervisor:
+    def __init__(self, host="0.0.0.0", port=9999, workers=None):
+        self.host = host
+        self.port = port
+        self.count = workers or os.cpu_count() or 1
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = {}      # slot -> Process
+        self.started_at = {}   # slot -> monotonic start time
+        self.delays = {}       # slot -> current restart delay
+        self.restart_at = {}   # slot -> monotonic time to restart a dead worker
+        self.stopping = False
+        self.stats_dir = tempfile.mkdtemp(prefix="a_server_stats_")
+        self.settings = {
+            "CACHE_SHARED": True,
+            # One signing key for all workers, so a token from one is good on the others
+            "SESSION_SECRET": Config.SESSION_SECRET or secrets.token_hex(32),
+        }
+
+    def _spawn(self, slot):
+        process = self.context.Process(
+            target=_worker_main, args=(self.host, self.port, self.stats_dir, self.settings),
+            name=f"video-worker-{slot}", daemon=False,
+        )
+        process.start()
+        self.workers[slot] = process
+        self.started_at[slot] = time.monotonic()
+        log.info("👷 Worker %d started (pid %d)", slot, process.pid)
+
+    def _retire_stats(self, pid):
+        """
+        Keep a dead worker's counters in the totals so they never go backwards;
+        its gauges (open connections...) died with it.
+        """
+        path = os.path.join(self.stats_dir, f"{pid}.json")
+        retired_path = os.path.join(self.stats_dir, "retired.json")
+        try:
+            with open(path) as f:
+                snap = json.load(f)
+            os.remove(path)
+        except (OSError, ValueError):
+            return
+        snap["gauges"] = []
+        snap["sent_per_second"] = 0.0
+        snapshots = [snap]
+        try:
+            with open(retired_path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            pass
+        retired = Metrics.Metrics.merged(snapshots).snapshot()
+        tmp = retired_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(retired, f)
+        os.replace(tmp, retired_path)
+
+    def _reap(self, slot):
+        process = self.workers.pop(slot)
+        process.join()
+        self._retire_stats(process.pid)
+        if self.stopping:
+            return
+        uptime = time.monotonic() - self.started_at[slot]
+        if uptime < MIN_UPTIME:
+            delay = min(MAX_RESTART_DELAY, max(1.0, self.delays.get(slot, 0) * 2))
+        else:
+            delay = 0.0
+        self.delays[slot] = delay
+        self.restart_at[slot] = time.monotonic() + delay
+        log.warning("💥 Worker %d (pid %d) exited with code %s, restarting in %.0fs",
+                    slot, process.pid, process.exitcode, delay)
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+
+    def run(self):
+        _check_port(self.host, self.port)
+        # Workers are fresh interpreters (spawn) and get the settings as an argument;
+        # the supervisor's own Config says the same for anything it reads later
+        _configure(self.settings)
+        Metrics.share(self.stats_dir, publish=False)
+
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+
+        from Server import start_metrics_endpoint
+        start_metrics_endpoint()
+        for slot in range(self.count):
+            self._spawn(slot)
+        log.info("🚀 %d workers serving %s:%s", self.count, self.host, self.port)
+
+        while not self.stopping:
+            by_sentinel = {p.sentinel: slot for slot, p in self.workers.items()}
+            for sentinel in wait(list(by_sentinel), timeout=0.5):
+                self._reap(by_sentinel[sentinel])
+            now = time.monotonic()
+            for slot, when in list(self.restart_at.items()):
+                if when <= now and not self.stopping:
+                    del self.restart_at[slot]
+                    self._spawn(slot)
+
+        self.shutdown()
+
+    def shutdown(self):
+        """Ask every worker to drain, then kill whatever outlives the grace period."""
+        log.info("🛑 Stopping %d workers...", len(self.workers))
+        for process in self.workers.values():
+            if process.is_alive():
+                process.terminate()  # SIGTERM: the worker stops accepting and drains
+
+        deadline = time.monotonic() + Config.SHUTDOWN_GRACE + 5
+        for slot in list(self.workers):
+            process = self.workers[slot]
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                log.warning("⚠️ Worker %d did not stop in time, killing it", slot)
+                process.kill()
+                process.join()
+            self.workers.pop(slot)
+        shutil.rmtree(self.stats_dir, ignore_errors=True)
+        log.info("🔒 Server stopped")
+
+
+# ---------- Start server ----------
+def run_supervisor(host="0.0.0.0", port=9999, workers=Config.WORKERS):
+    log.info("🧠 Starting multi-process server...")
+    if not hasattr(socket, "SO_REUSEPORT"):
+        log.error("❌ Multi-process mode needs SO_REUSEPORT, which this platform lacks")
+        return
+    try:
+        Supervisor(host, port, workers).run()
+    except OSError as e:
+        log.error("❌ Failed to bind socket: %s", e)
+
+
+if __name__ == "__main__":
+    run_supervisor()
@@ -0,0 +1,104 @@
+"""
+Session tokens handed out at login.
+
+A token is "<base64 email>.<hex expiry>.<signature>", signed with HMAC-SHA256 under
+SESSION_SECRET, so any worker process holding the secret can accept a
+token another one issued. Issued and checked tokens are kept in an LRU of
+max_cached entries, so checking one again (every request on a connection)
+is a single lookup plus an expiry comparison; a token that fell out of it
+is just verified again.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+import Config
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class Sessions:
+    def __init__(self, secret=Config.SESSION_SECRET, ttl=Config.SESSION_TTL, max_cached=100000):
+        self.secret = secret.encode() if secret else os.urandom(32)
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self.cache = OrderedDict()  # token -> (email, expires), least recently used first
+        self.revoked = {}           # token -> expires; forgotten once the token has expired anyway
+        self.lock = threading.Lock()
+
+    def _sign(self, payload):
+        return _b64(hmac.new(self.secret, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, email):
+        """A new token for email; returns (token, expires as a Unix time)."""
+        expires = int(time.time() + self.ttl)
+        payload = f"{_b64(email.encode())}.{expires:x}"
+        token = f"{payload}.{self._sign(payload)}"
+        with self.lock:
+            self._remember(token, (email, expires))
+        return token, expires
+
+    def check(self, token):
+        """The email the token was issued to, or None if it is forged, expired or revoked."""
+        with self.lock:
+            entry = self.cache.get(token)
+            if entry is not None:
+                self.cache.move_to_end(token)
+        if entry is None:
+            entry = self._verify(token)
+            if entry is None:
+                return None
+        email, expires = entry
+        if time.time() >= expires:
+            with self.lock:
+                self.cache.pop(token, None)
+            return None
+        return email
+
+    def _verify(self, token):
+        try:
+            user, expires, signature = token.split(".")
+            email = _unb64(user).decode()
+            expires = int(expires, 16)
+        except ValueError:
+            return None
+        if not hmac.compare_digest(signature, self._sign(f"{user}.{expires:x}")):
+            return None
+        with self.lock:
+            if token in self.revoked:
+                return None
+            self._remember(token, (email, expires))
+        return email, expires
+
+    def revoke(self, token):
+        """Log a token out, in this process."""
+        entry = self._verify(token)
+        with self.lock:
+            self.cache.pop(token, None)
+            if entry is None:
+                return  # forged or already revoked: nothing to log out
+            now = time.time()
+            for old, expires in list(self.revoked.items()):
+                if expires <= now:
+                    del self.revoked[old]
+            self.revoked[token] = entry[1]
+
+    def _remember(self, token, entry):
+        """Cache a good token; called with the lock held."""
+        self.cache[token] = entry
+        self.cache.move_to_end(token)
+        # Expired tokens stop being used, so they are the first to go
+        while len(self.cache) > self.max_cached:
+            self.cache.popitem(last=False)
+
+
+sessions = Sessions()
@@ -0,0 +1,171 @@
+"""
+Bandwidth shaping for response bodies.
+
+While any limit is set, a body goes out in quanta of SHAPE_QUANTUM bytes.
+Each quantum must clear four token buckets: the connection's, its user's,
+the server-wide one, and a pacing bucket running at SHAPE_PACE_FACTOR
+times the video's bitrate. The buckets work by reservation: asking for
+bytes books them and returns how long to wait. Streams ask for one
+quantum at a time, so those competing for the same bucket take turns.
+That makes a fair round robin without a scheduler thread, and the same
+call serves threads (sleep) and the event loop (asyncio.sleep).
+
+Limits start from Config. Editing SHAPE_LIMITS_FILE changes them while
+the server runs, in every worker process.
+"""
+import json
+import os
+import threading
+import time
+import Config
+from Log import get_logger
+from Throttle import TokenBucket
+
+log = get_logger("shaping")
+
+# Seconds between checks of the limits file
+RELOAD_INTERVAL = 2.0
+
+DEFAULT_LIMITS = {
+    "global_rate": Config.SHAPE_GLOBAL_RATE,
+    "connection_rate": Config.SHAPE_CONNECTION_RATE,
+    "user_rate": Config.SHAPE_USER_RATE,
+    "pace_factor": Config.SHAPE_PACE_FACTOR,
+    "pace_burst_seconds": Config.SHAPE_PACE_BURST_SECONDS,
+    "quantum": Config.SHAPE_QUANTUM,
+}
+
+
+# ---------- Streams ----------
+class StreamShaper:
+    """The buckets one response body has to get through."""
+
+    def __init__(self, buckets, quantum):
+        self.buckets = buckets
+        self.quantum = quantum
+
+    def reserve(self, amount):
+        """Book amount bytes in every bucket; returns the seconds to wait before sending."""
+        return max(bucket.delay(amount) for bucket in self.buckets)
+
+
+class ConnectionShaper:
+    """Limits for one client connection, across all the requests it makes."""
+
+    def __init__(self, shaper, user):
+        self.shaper = shaper
+        self.user = user
+        self.bucket = TokenBucket(0)
+        self.paced_title = None  # video the pacing bucket belongs to
+        self.pace = None
+
+    def stream(self, media=None):
+        """
+        A StreamShaper for the next response body, or None when no limit
+        applies. media() gives (title, bytes per second) for the video being
+        sent, or None; it is only called when pacing is on.
+        """
+        limits = self.shaper.limits()
+        buckets = []
+        if limits["connection_rate"]:
+            self.bucket.configure(limits["connection_rate"])
+            buckets.append(self.bucket)
+        if limits["user_rate"]:
+            buckets.append(self.shaper.user_bucket(self.user, limits["user_rate"]))
+        if limits["global_rate"]:
+            buckets.append(self.shaper.global_bucket)
+        if limits["pace_factor"] and media is not None:
+            found = media()
+            if found:
+                title, bitrate = found
+                rate = int(bitrate * limits["pace_factor"])
+                burst = int(bitrate * limits["pace_burst_seconds"])
+                # Kept across the ranges of one video, so many small requests are paced
+                # like one long one; a new video starts with a fresh burst
+                if title != self.paced_title:
+                    self.paced_title = title
+                    self.pace = TokenBucket(rate, burst)
+                else:
+                    self.pace.configure(rate, burst)
+                buckets.append(self.pace)
+        if not buckets:
+            return None
+        return StreamShaper(buckets, limits["quantum"])
+
+    def close(self):
+        self.shaper.release_user(self.user)
+
+
+# ---------- Shaper ----------
+class Shaper:
+    def __init__(self, limits_file=Config.SHAPE_LIMITS_FILE):
+        self.limits_file = limits_file
+        self.current = dict(DEFAULT_LIMITS)
+        self.loaded_mtime = None
+        self.checked_at = 0.0
+        self.global_bucket = TokenBucket(self.current["global_rate"])
+        self.users = {}  # user -> [TokenBucket, open connections]
+        self.lock = threading.Lock()
+
+    def limits(self):
+        """The limits in force, re-reading the limits file when it has changed."""
+        now = time.monotonic()
+        if now - self.checked_at >= RELOAD_INTERVAL:
+            self.checked_at = now
+            self._reload()
+        return self.current
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.limits_file).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self.loaded_mtime:
+            return
+        self.loaded_mtime = mtime
+
+        limits = dict(DEFAULT_LIMITS)
+        if mtime is not None:
+            try:
+                with open(self.limits_file) as f:
+                    overrides = json.load(f)
+                for name, value in overrides.items():
+                    if name not in limits:
+                        raise ValueError(f"unknown limit '{name}'")
+                    limits[name] = type(limits[name])(value)
+            except (OSError, ValueError, TypeError) as err:
+                log.error("❌ Ignoring %s: %s", self.limits_file, err)
+                return
+        limits["quantum"] = max(4096, limits["quantum"])
+        self.current = limits
+        self.global_bucket.configure(limits["global_rate"])
+        with self.lock:
+            for bucket, _ in self.users.values():
+                bucket.configure(limits["user_rate"])
+        log.info("🚦 Bandwidth limits: %s", limits)
+
+    def connection(self, user):
+        with self.lock:
+            entry = self.users.get(user)
+            if entry is None:
+                entry = self.users[user] = [TokenBucket(self.current["user_rate"]), 0]
+            entry[1] += 1
+        return ConnectionShaper(self, user)
+
+    def user_bucket(self, user, rate):
+        with self.lock:
+            bucket = self.users[user][0]
+        if bucket.rate != rate:
+            bucket.configure(rate)
+        return bucket
+
+    def release_user(self, user):
+        with self.lock:
+            entry = self.users.get(user)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self.users[user]
+
+
+shaper = Shaper()
@@ -0,0 +1,96 @@
+import threading
+import Config
+
+
+class StorageError(Exception):
+    """A storage call failed (network, permissions...), as opposed to "not found"."""
+
+
+# ---------- Interface ----------
+class StorageBackend:
+    """
+    Where the server reads videos from. Objects are addressed by bucket and
+    file name; every listing entry and stat result carries a version that
+    changes whenever the object's content does, for cache keys.
+    """
+
+    def list(self, bucket_name):
+        """Every object in the bucket: [{"name", "size", "mtime", "version"}]."""
+        raise NotImplementedError
+
+    def stat(self, bucket_name, file_name):
+        """{"size", "version"} for one object, or None if it doesn't exist."""
+        raise NotImplementedError
+
+    def read(self, bucket_name, file_name, offset=0, length=None,
+             chunk_size=Config.STREAM_CHUNK_SIZE):
+        """Yield the object's bytes from offset, all of them or just length."""
+        raise NotImplementedError
+
+    def read_all(self, bucket_name, file_name):
+        return b"".join(self.read(bucket_name, file_name))
+
+    def open_range(self, bucket_name, file_name, offset, length):
+        """
+        A FileRange over the stored file itself when the backend keeps objects
+        as local files, so the server can sendfile() it with no cache copy.
+        None for remote backends.
+        """
+        return None
+
+    def url(self, bucket_name, file_name):
+        """
+        Where a tool like ffmpeg can read the object by itself, fetching only
+        the parts it needs: a local path or a short-lived signed URL. None
+        when the object can only be read through read().
+        """
+        return None
+
+    def healthy(self):
+        """False while calls are being refused because storage keeps failing."""
+        return True
+
+    def write(self, bucket_name, file_name, path):
+        """
+        Store the local file at path as the object, replacing any old one.
+        Readers see the old object or the whole new one, never a partial
+        write. The backend may move path into place instead of copying it.
+        """
+        raise StorageError(f"{type(self).__name__} is read-only")
+
+
+# ---------- Selection ----------
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def make_backend(name=None):
+    name = (name or Config.STORAGE_BACKEND).lower()
+    if name == "supabase":
+        from Storage.Resilient import ResilientStorage
+        from Storage.Supabase_storage import SupabaseStorage
+        return ResilientStorage(SupabaseStorage())
+    if name == "local":
+        from Storage.Local_storage import LocalStorage
+        return LocalStorage(Config.STORAGE_ROOT)
+    if name == "memory":
+        from Storage.Memory_storage import MemoryStorage
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage backend '{name}'")
+
+
+def get_backend():
+    """The backend picked by Config.STORAGE_BACKEND, created on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = make_backend()
+    return _backend
+
+
+def set_backend(backend):
+    """Serve from backend instead, e.g. a MemoryStorage in benchmarks."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
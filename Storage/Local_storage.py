@@ -0,0 +1,124 @@
+import mmap
+import os
+import shutil
+import Config
+from Cache.Disk_cache import FileRange
+from Storage.Backend import StorageBackend, StorageError
+
+
+# ---------- Local directory ----------
+class LocalStorage(StorageBackend):
+    """
+    Objects as files under root, one directory per bucket: a local SSD
+    mirror or an NFS mount. The server sends these files with sendfile()
+    straight from where they are (see open_range); read() maps the file
+    and yields memoryview slices of the mapping, so no bytes are copied
+    into Python there either.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+
+    def _bucket_path(self, bucket_name):
+        path = os.path.realpath(os.path.join(self.root, bucket_name))
+        # A directory right under root: "", ".." or "a/b" would reach elsewhere
+        if os.path.dirname(path) != self.root:
+            raise FileNotFoundError(bucket_name)
+        return path
+
+    def _path(self, bucket_name, file_name, must_exist=True):
+        bucket = self._bucket_path(bucket_name)
+        path = os.path.realpath(os.path.join(bucket, file_name))
+        # Refuse names that leave the bucket ("../otherbucket/x", "../../etc/passwd")
+        # or name the bucket itself (""), and anything that isn't a regular file
+        if os.path.commonpath([bucket, path]) != bucket or path == bucket:
+            raise FileNotFoundError(file_name)
+        if not os.path.isfile(path) and (must_exist or os.path.exists(path)):
+            raise FileNotFoundError(file_name)
+        return path
+
+    @staticmethod
+    def _version(stat):
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    def list(self, bucket_name):
+        try:
+            entries = list(os.scandir(self._bucket_path(bucket_name)))
+        except FileNotFoundError:
+            return []
+        except OSError as err:
+            raise StorageError(err) from err
+
+        items = []
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            stat = entry.stat()
+            items.append({
+                "name": entry.name,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "version": self._version(stat),
+            })
+        return items
+
+    def stat(self, bucket_name, file_name):
+        try:
+            stat = os.stat(self._path(bucket_name, file_name))
+        except FileNotFoundError:
+            return None
+        except OSError as err:
+            raise StorageError(err) from err
+        return {"size": stat.st_size, "version": self._version(stat)}
+
+    def read(self, bucket_name, file_name, offset=0, length=None,
+             chunk_size=Config.STREAM_CHUNK_SIZE):
+        with open(self._path(bucket_name, file_name), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            end = size if length is None else min(size, offset + length)
+            if offset >= end:
+                return
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            for start in range(offset, end, chunk_size):
+                yield view[start:min(end, start + chunk_size)]
+        finally:
+            view.release()
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # a consumer still holds a slice; unmapped when it lets go
+
+    def read_all(self, bucket_name, file_name):
+        with open(self._path(bucket_name, file_name), "rb") as f:
+            return f.read()
+
+    def open_range(self, bucket_name, file_name, offset, length):
+        try:
+            return FileRange(self._path(bucket_name, file_name), offset, length)
+        except OSError:
+            return None
+
+    def url(self, bucket_name, file_name):
+        try:
+            return self._path(bucket_name, file_name)
+        except OSError:
+            return None
+
+    def write(self, bucket_name, file_name, path):
+        try:
+            target = self._path(bucket_name, file_name, must_exist=False)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                # Same filesystem: the staged upload simply becomes the object
+                os.replace(path, target)
+                return
+            except OSError:
+                pass
+            # Hidden while it is copied, so list() never shows half a file
+            tmp = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.{os.getpid()}")
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, target)
+        except OSError as err:
+            raise StorageError(err) from err
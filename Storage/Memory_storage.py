@@ -0,0 +1,61 @@
+import threading
+import time
+import Config
+from Storage.Backend import StorageBackend
+
+
+# ---------- In-memory ----------
+class MemoryStorage(StorageBackend):
+    """Objects held in a dict, for tests and benchmarks. Nothing survives a restart."""
+
+    def __init__(self, buckets=None):
+        self.buckets = buckets if buckets is not None else {}  # bucket -> {name: bytes}
+        self.versions = {}  # (bucket, name) -> (version, mtime)
+        self.lock = threading.Lock()
+
+    def put(self, bucket_name, file_name, data):
+        with self.lock:
+            self.buckets.setdefault(bucket_name, {})[file_name] = bytes(data)
+            version, _ = self.versions.get((bucket_name, file_name), (0, 0))
+            self.versions[(bucket_name, file_name)] = (version + 1, time.time())
+
+    def _version(self, bucket_name, file_name):
+        return self.versions.get((bucket_name, file_name), (0, 0))
+
+    def list(self, bucket_name):
+        with self.lock:
+            objects = dict(self.buckets.get(bucket_name, {}))
+        items = []
+        for name, data in objects.items():
+            version, mtime = self._version(bucket_name, name)
+            items.append({"name": name, "size": len(data), "mtime": mtime, "version": str(version)})
+        return items
+
+    def stat(self, bucket_name, file_name):
+        with self.lock:
+            data = self.buckets.get(bucket_name, {}).get(file_name)
+        if data is None:
+            return None
+        return {"size": len(data), "version": str(self._version(bucket_name, file_name)[0])}
+
+    def read(self, bucket_name, file_name, offset=0, length=None,
+             chunk_size=Config.STREAM_CHUNK_SIZE):
+        with self.lock:
+            data = self.buckets.get(bucket_name, {}).get(file_name)
+        if data is None:
+            raise FileNotFoundError(file_name)
+        end = len(data) if length is None else min(len(data), offset + length)
+        view = memoryview(data)
+        for start in range(offset, end, chunk_size):
+            yield view[start:min(end, start + chunk_size)]
+
+    def read_all(self, bucket_name, file_name):
+        with self.lock:
+            data = self.buckets.get(bucket_name, {}).get(file_name)
+        if data is None:
+            raise FileNotFoundError(file_name)
+        return data
+
+    def write(self, bucket_name, file_name, path):
+        with open(path, "rb") as f:
+            self.put(bucket_name, file_name, f.read())
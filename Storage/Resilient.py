@@ -0,0 +1,375 @@
+"""
+Deadlines, retries, hedging and a circuit breaker around a remote storage
+backend, so a slow or flapping storage endpoint costs the server a bounded
+wait instead of a stuck thread.
+
+Every call runs on a pool of its own and is waited for at most
+STORAGE_TIMEOUT seconds (STORAGE_STALL_TIMEOUT between two chunks of a
+read) from when a pool thread takes it up; a call still running after
+that is left to finish by itself and its result thrown away. A call that
+can't get a thread within STORAGE_TIMEOUT fails as busy, which says
+nothing about storage, so it is neither retried nor held against it. Failed calls are tried again after a jittered
+exponential wait, reads from the first byte not yet delivered. When a stat
+or the first byte of a read is slower than usual (the recent 95th
+percentile), the same request is sent once more and whichever answers
+first is used. After STORAGE_BREAKER_FAILURES failures in a row calls fail
+at once for STORAGE_BREAKER_COOLDOWN seconds; then one trial call decides
+whether storage is back.
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import Config
+from Log import get_logger
+from Metrics import metrics
+from Storage.Backend import StorageBackend, StorageError
+
+log = get_logger("storage")
+
+# Longest wait between two tries of a call, in seconds
+RETRY_CAP = 2.0
+
+
+class StorageUnavailable(StorageError):
+    """Storage has been failing, so the call wasn't even tried."""
+
+
+class StorageBusy(StorageError):
+    """Every storage thread stayed busy until the deadline, so the call wasn't even started."""
+
+
+def _retryable(err):
+    """Worth another try: timeouts, connection trouble, 5xx. Not "not found" or "forbidden"."""
+    if isinstance(err, (StorageUnavailable, StorageBusy)):
+        return False
+    if isinstance(err, (FileNotFoundError, PermissionError)):
+        return False
+    cause = err.__cause__ if isinstance(err, StorageError) and err.__cause__ else err
+    status = getattr(getattr(cause, "response", None), "status_code", None)
+    return status is None or status >= 500 or status in (408, 429)
+
+
+# ---------- Circuit breaker ----------
+class CircuitBreaker:
+    """
+    Closed: calls go through. Open after threshold failures in a row: calls
+    are refused. Half-open once cooldown has passed: one trial call goes
+    through, and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, threshold=Config.STORAGE_BREAKER_FAILURES,
+                 cooldown=Config.STORAGE_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None  # None while closed
+        self.trial_at = None   # when the half-open trial call went out
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        """True if a call may go to storage now."""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.cooldown:
+                return False
+            # A trial that never reported back (its caller gave up) doesn't block forever
+            if self.trial_at is not None and now - self.trial_at < self.cooldown:
+                return False
+            self.trial_at = now
+            return True
+
+    def success(self):
+        with self.lock:
+            was_open = self.opened_at is not None
+            self.failures = 0
+            self.opened_at = self.trial_at = None
+        if was_open:
+            metrics.gauge_add("storage_breaker_open", -1)
+            log.info("✅ Storage answers again, closing the circuit")
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.opened_at is not None:
+                if self.trial_at is None:
+                    return  # a call from before the circuit opened
+                self.opened_at = time.monotonic()  # the trial failed: wait again
+                self.trial_at = None
+                return
+            if self.failures < self.threshold:
+                return
+            self.opened_at = time.monotonic()
+        metrics.gauge_add("storage_breaker_open", 1)
+        log.warning("🚧 Storage failed %d times in a row, not calling it for %gs",
+                    self.threshold, self.cooldown)
+
+
+# ---------- Calls on the pool ----------
+class _Task:
+    """fn() as handed to the pool, noting when a thread actually took it up."""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.queued = time.monotonic()
+        self.began = None
+        self.started = threading.Event()
+        self.future = None
+
+    def __call__(self):
+        self.began = time.monotonic()
+        self.started.set()
+        return self.fn()
+
+    def deadline(self, timeout, queue_timeout):
+        """Until the call starts, queue_timeout bounds the wait for a thread; then timeout the call."""
+        began = self.began
+        return self.queued + queue_timeout if began is None else began + timeout
+
+
+# ---------- Reads in progress ----------
+class _Stream:
+    """A read from the wrapped backend, advanced on the pool one chunk at a time."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.lock = threading.Lock()
+        self.busy = False
+        self.closed = False
+
+    def next(self):
+        """The next chunk, or None at the end."""
+        with self.lock:
+            if self.closed:
+                raise StorageError("read abandoned")
+            self.busy = True
+        try:
+            return next(self.chunks, None)
+        finally:
+            with self.lock:
+                self.busy = False
+                closed = self.closed
+            if closed:
+                self.chunks.close()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            if self.busy:
+                return  # the call in flight closes it when it returns
+        self.chunks.close()
+
+
+def _close_stream(opened):
+    opened[0].close()
+
+
+# ---------- Resilient backend ----------
+class ResilientStorage(StorageBackend):
+    """Wraps a remote backend; see the module docstring for what it adds."""
+
+    def __init__(self, inner, timeout=Config.STORAGE_TIMEOUT,
+                 stall_timeout=Config.STORAGE_STALL_TIMEOUT, retries=Config.STORAGE_RETRIES,
+                 retry_base=Config.STORAGE_RETRY_BASE, hedge_after=Config.STORAGE_HEDGE_AFTER,
+                 breaker=None, threads=Config.STORAGE_CALL_THREADS):
+        self.inner = inner
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self.retries = retries
+        self.retry_base = retry_base
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix="storage")
+        self.latencies = {}  # op -> seconds to the first answer of recent hedgeable calls
+
+    def healthy(self):
+        return self.breaker.state == "closed"
+
+    def _hedge_delay(self, op):
+        """Seconds to wait before sending a duplicate request, or None to never send one."""
+        if self.hedge_after <= 0:
+            return None
+        recent = self.latencies.get(op)
+        if recent is None or len(recent) < 20:
+            return self.hedge_after
+        ordered = sorted(recent)
+        return ordered[int(len(ordered) * 0.95)]
+
+    def _submit(self, fn):
+        task = _Task(fn)
+        task.future = self.pool.submit(task)
+        return task
+
+    def _call(self, op, fn, timeout, hedge=False, gate=True, discard=None):
+        """
+        fn() on the pool, waited for at most timeout seconds once a thread
+        runs it; with hedge a second fn() runs if the first is slow. Results
+        that arrive too late or lose the race are passed to discard.
+        """
+        if gate and not self.breaker.allow():
+            metrics.inc("storage_calls_total", op=op, result="refused")
+            raise StorageUnavailable("storage keeps failing, not calling it for now")
+
+        # Waiting for a free thread may take as long as a whole call, however short this one's deadline
+        queue_timeout = max(timeout, self.timeout)
+        tasks = [self._submit(fn)]
+        delay = self._hedge_delay(op) if hedge else None
+        if delay is not None and delay < timeout:
+            first = tasks[0]
+            # Only a call that storage is slow to answer is worth a duplicate, not a queued one
+            if first.started.wait(queue_timeout) and not wait(
+                    [first.future], max(0.0, first.began + delay - time.monotonic())).done:
+                tasks.append(self._submit(fn))
+                metrics.inc("storage_hedges_total", op=op)
+
+        winner, error = None, None
+        owner = {task.future: task for task in tasks}
+        pending = set(owner)
+        while pending and winner is None:
+            now = time.monotonic()
+            live = [future for future in pending if owner[future].deadline(timeout, queue_timeout) > now]
+            if not live:
+                break
+            until = min(owner[future].deadline(timeout, queue_timeout) for future in live)
+            done, pending = wait(pending, max(0.0, until - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    winner = winner or owner[future]
+                else:
+                    error = future.exception()
+                    if not _retryable(error):
+                        pending = set()  # the duplicate would only say the same
+
+        for task in tasks:
+            if task is not winner and not task.future.cancel() and discard is not None:
+                task.future.add_done_callback(
+                    lambda late: late.exception() is None and discard(late.result())
+                )
+
+        if winner is not None:
+            self.breaker.success()
+            if hedge:
+                self.latencies.setdefault(op, deque(maxlen=200)).append(
+                    time.monotonic() - winner.began
+                )
+            if len(tasks) > 1:
+                metrics.inc("storage_hedge_wins_total", op=op,
+                            request="first" if winner is tasks[0] else "duplicate")
+            metrics.inc("storage_calls_total", op=op, result="ok")
+            return winner.future.result()
+
+        if error is None and all(task.began is None for task in tasks):
+            # Never started: the pool is overloaded, which is no fault of storage
+            metrics.inc("storage_calls_total", op=op, result="busy")
+            raise StorageBusy(f"no storage thread free within {queue_timeout:g}s")
+        if error is None:
+            error = StorageError(f"no answer from storage within {timeout:g}s")
+            metrics.inc("storage_calls_total", op=op, result="timeout")
+        else:
+            metrics.inc("storage_calls_total", op=op, result="error")
+        if _retryable(error):
+            self.breaker.failure()
+        else:
+            self.breaker.success()  # storage answered, just not with the object
+        raise error
+
+    def _retrying(self, op, attempt):
+        """attempt(), tried again on retryable errors with jittered exponential waits."""
+        tries = 0
+        while True:
+            try:
+                return attempt()
+            except Exception as err:
+                if not _retryable(err):
+                    raise
+                if tries >= self.retries:
+                    if isinstance(err, StorageError):
+                        raise
+                    raise StorageError(err) from err
+                tries += 1
+                self._backoff(op, tries, err)
+
+    def _backoff(self, op, tries, err):
+        # "Full jitter": spread retries of many failed calls over the whole wait
+        pause = random.uniform(0, min(RETRY_CAP, self.retry_base * 2 ** (tries - 1)))
+        metrics.inc("storage_retries_total", op=op)
+        log.warning("🔁 Storage %s failed (%s), try %d in %.2fs", op, err, tries, pause)
+        time.sleep(pause)
+
+    # ---------- Backend calls ----------
+    def list(self, bucket_name):
+        return self._retrying("list", lambda: self._call(
+            "list", lambda: self.inner.list(bucket_name), self.timeout
+        ))
+
+    def stat(self, bucket_name, file_name):
+        return self._retrying("stat", lambda: self._call(
+            "stat", lambda: self.inner.stat(bucket_name, file_name), self.timeout, hedge=True
+        ))
+
+    def url(self, bucket_name, file_name):
+        return self._retrying("url", lambda: self._call(
+            "url", lambda: self.inner.url(bucket_name, file_name), self.timeout
+        ))
+
+    def open_range(self, bucket_name, file_name, offset, length):
+        return self.inner.open_range(bucket_name, file_name, offset, length)
+
+    def write(self, bucket_name, file_name, path):
+        # Uploads take as long as they take, and a retry would send the whole file again
+        return self.inner.write(bucket_name, file_name, path)
+
+    def _open(self, bucket_name, file_name, offset, length, chunk_size):
+        """(stream, first chunk) of a new read from the wrapped backend."""
+        stream = _Stream(self.inner.read(bucket_name, file_name, offset, length, chunk_size))
+        try:
+            return stream, stream.next()
+        except BaseException:
+            stream.close()
+            raise
+
+    def read(self, bucket_name, file_name, offset=0, length=None,
+             chunk_size=Config.STREAM_CHUNK_SIZE):
+        delivered = 0
+        tries = 0
+        progress = 0  # delivered when the last try failed
+        while True:
+            remaining = None if length is None else length - delivered
+            stream = None
+            try:
+                stream, chunk = self._call(
+                    "read",
+                    lambda: self._open(bucket_name, file_name, offset + delivered, remaining,
+                                       chunk_size),
+                    self.timeout, hedge=True, discard=_close_stream,
+                )
+                while chunk is not None:
+                    delivered += len(chunk)
+                    yield chunk
+                    chunk = self._call("read", stream.next, self.stall_timeout, gate=False)
+                return
+            except Exception as err:
+                if not _retryable(err):
+                    raise
+                if delivered > progress:
+                    tries, progress = 0, delivered  # got somewhere: a fresh set of tries
+                if tries >= self.retries:
+                    if isinstance(err, StorageError):
+                        raise
+                    raise StorageError(err) from err
+                tries += 1
+                self._backoff("read", tries, err)
+            finally:
+                if stream is not None:
+                    stream.close()
@@ -0,0 +1,118 @@
+import threading
+import Config
+from Storage.Backend import StorageBackend, StorageError
+
+
+# ---------- Supabase storage ----------
+class SupabaseStorage(StorageBackend):
+    """
+    Objects in Supabase storage. The client is created on the first call,
+    not at import, so the server starts without touching the network;
+    downloads stream from a signed URL so a range costs only its bytes.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from supabase import create_client
+                    import Apikeys
+                    self._client = create_client(Apikeys.SUPABASE_URL, Apikeys.SUPABASE_KEY)
+        return self._client
+
+    def _bucket(self, bucket_name):
+        return self.client.storage.from_(bucket_name)
+
+    def list(self, bucket_name):
+        items = []
+        offset = 0
+        try:
+            while True:
+                batch = self._bucket(bucket_name).list("", {
+                    "limit": Config.LIST_FETCH_BATCH,
+                    "offset": offset,
+                    "sortBy": {"column": "name", "order": "asc"},
+                })
+                for item in batch:
+                    metadata = item.get("metadata")
+                    if not metadata:
+                        continue  # folders have no metadata
+                    items.append({
+                        "name": item["name"],
+                        "size": metadata.get("size"),
+                        "mtime": metadata.get("lastModified") or item.get("updated_at"),
+                        "version": metadata.get("eTag") or item.get("updated_at") or "",
+                    })
+                if len(batch) < Config.LIST_FETCH_BATCH:
+                    return items
+                offset += len(batch)
+        except Exception as err:
+            raise StorageError(err) from err
+
+    def stat(self, bucket_name, file_name):
+        try:
+            items = self._bucket(bucket_name).list("", {"search": file_name})
+        except Exception as err:
+            raise StorageError(err) from err
+        for item in items:
+            if item.get("name") == file_name:
+                metadata = item.get("metadata") or {}
+                return {
+                    "size": metadata.get("size"),
+                    "version": metadata.get("eTag") or item.get("updated_at") or "",
+                }
+        return None
+
+    def read(self, bucket_name, file_name, offset=0, length=None,
+             chunk_size=Config.STREAM_CHUNK_SIZE):
+        import httpx
+
+        url = self.url(bucket_name, file_name)
+
+        headers = {}
+        if offset or length is not None:
+            last = "" if length is None else str(offset + length - 1)
+            headers["Range"] = f"bytes={offset}-{last}"
+
+        with httpx.stream("GET", url, headers=headers, timeout=30) as response:
+            response.raise_for_status()
+            # Storage ignored the Range header: skip ahead ourselves
+            skip = offset if headers and response.status_code == 200 else 0
+            remaining = length
+            for chunk in response.iter_bytes(chunk_size):
+                if skip:
+                    if len(chunk) <= skip:
+                        skip -= len(chunk)
+                        continue
+                    chunk = chunk[skip:]
+                    skip = 0
+                if remaining is not None:
+                    chunk = chunk[:remaining]
+                    remaining -= len(chunk)
+                yield chunk
+                if remaining == 0:
+                    return
+
+    def url(self, bucket_name, file_name):
+        signed = self._bucket(bucket_name).create_signed_url(
+            file_name, Config.SIGNED_URL_EXPIRES
+        )
+        return signed.get("signedURL") or signed.get("signedUrl")
+
+    def read_all(self, bucket_name, file_name):
+        try:
+            return self._bucket(bucket_name).download(file_name)
+        except Exception as err:
+            raise StorageError(err) from err
+
+    def write(self, bucket_name, file_name, path):
+        try:
+            # The client streams the file from disk; upsert replaces an existing object
+            self._bucket(bucket_name).upload(file_name, path, {"upsert": "true"})
+        except Exception as err:
+            raise StorageError(err) from err
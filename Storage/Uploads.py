@@ -0,0 +1,177 @@
+"""
+Resumable uploads, staged on the server's disk until every part is in.
+
+Each upload is a directory under UPLOAD_DIR named by its id. "data" is a
+file of the final size, and every part is written into it at its own
+offset. parts/<index> is created once that part is safely on disk and
+holds the part's SHA-256. Nothing is buffered in memory, so several
+connections, even in different worker processes, can fill one upload at
+once. A client that reconnects asks which parts already arrived and sends
+only the rest.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+import Config
+from Log import get_logger
+
+log = get_logger("uploads")
+
+
+class UploadError(Exception):
+    """The upload is unknown, or a part or the whole file does not check out."""
+
+
+# ---------- Part writer ----------
+class PartWriter:
+    """Receives one part's bytes, hashing them as they arrive."""
+
+    def __init__(self, directory, index, offset, length):
+        self.directory = directory
+        self.index = index
+        self.length = length
+        self.received = 0
+        self.hash = hashlib.sha256()
+        self.file = open(os.path.join(directory, "data"), "r+b")
+        self.file.seek(offset)
+
+    def write(self, data):
+        if self.received + len(data) > self.length:
+            raise UploadError(f"part {self.index} is longer than {self.length} bytes")
+        self.file.write(data)
+        self.hash.update(data)
+        self.received += len(data)
+
+    def finish(self):
+        """Make the part durable and record it. Returns its SHA-256 in hex."""
+        try:
+            if self.received != self.length:
+                raise UploadError(f"part {self.index} has {self.received}/{self.length} bytes")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        finally:
+            self.file.close()
+        digest = self.hash.hexdigest()
+        marker = os.path.join(self.directory, "parts", str(self.index))
+        with open(marker + ".tmp", "w") as f:
+            f.write(digest)
+        os.replace(marker + ".tmp", marker)
+        return digest
+
+    def abort(self):
+        self.file.close()
+
+
+# ---------- Uploads ----------
+class Uploads:
+    def __init__(self, root=Config.UPLOAD_DIR, part_size=Config.UPLOAD_PART_SIZE,
+                 ttl=Config.UPLOAD_TTL):
+        self.root = root
+        self.part_size = part_size
+        self.ttl = ttl
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def upload_id(bucket_name, file_name, size, fingerprint):
+        raw = f"{bucket_name}\0{file_name}\0{size}\0{fingerprint}".encode()
+        return hashlib.sha256(raw).hexdigest()[:32]
+
+    def _dir(self, upload_id):
+        if len(upload_id) != 32 or not all(c in "0123456789abcdef" for c in upload_id):
+            raise UploadError("unknown upload")
+        return os.path.join(self.root, upload_id)
+
+    def _meta(self, upload_id):
+        try:
+            with open(os.path.join(self._dir(upload_id), "meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadError("unknown upload") from None
+
+    def _parts(self, directory):
+        try:
+            names = os.listdir(os.path.join(directory, "parts"))
+        except OSError:
+            return []
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def part_count(self, meta):
+        return max(1, -(-meta["size"] // meta["part_size"]))
+
+    def begin(self, bucket_name, file_name, size, fingerprint):
+        """
+        Start an upload, or find the one this client started before with the
+        same file. Returns {"upload", "part_size", "parts"}, parts being the
+        indexes already received.
+        """
+        self.sweep()
+        upload_id = self.upload_id(bucket_name, file_name, size, fingerprint)
+        directory = self._dir(upload_id)
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            os.makedirs(os.path.join(directory, "parts"), exist_ok=True)
+            # Sparse file of the final size; parts land at their offsets in any order
+            with open(os.path.join(directory, "data"), "ab") as f:
+                f.truncate(size)
+            meta = {
+                "bucket": bucket_name, "name": file_name, "size": size,
+                "part_size": self.part_size, "created": time.time(),
+            }
+            with open(os.path.join(directory, "meta.json.tmp"), "w") as f:
+                json.dump(meta, f)
+            os.replace(os.path.join(directory, "meta.json.tmp"), os.path.join(directory, "meta.json"))
+            log.info("📤 Upload of '%s' to '%s' started (%d bytes)", file_name, bucket_name, size)
+        meta = self._meta(upload_id)
+        return {"upload": upload_id, "part_size": meta["part_size"], "parts": self._parts(directory)}
+
+    def open_part(self, upload_id, index):
+        meta = self._meta(upload_id)
+        if not 0 <= index < self.part_count(meta):
+            raise UploadError(f"no part {index}")
+        offset = index * meta["part_size"]
+        length = min(meta["part_size"], meta["size"] - offset)
+        return PartWriter(self._dir(upload_id), index, offset, length)
+
+    def commit(self, upload_id, sha256, store):
+        """
+        Check that every part is in and the whole file hashes to sha256, then
+        hand it to store(bucket, name, path). Returns the upload's metadata.
+        """
+        meta = self._meta(upload_id)
+        directory = self._dir(upload_id)
+        missing = set(range(self.part_count(meta))) - set(self._parts(directory))
+        if missing:
+            raise UploadError(f"{len(missing)} parts missing")
+
+        path = os.path.join(directory, "data")
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        if digest.hexdigest() != sha256.lower():
+            # The parts checked out one by one but not together: start over
+            shutil.rmtree(directory, ignore_errors=True)
+            raise UploadError("checksum mismatch")
+
+        store(meta["bucket"], meta["name"], path)
+        shutil.rmtree(directory, ignore_errors=True)
+        log.info("✅ Upload of '%s' to '%s' stored", meta["name"], meta["bucket"])
+        return meta
+
+    def sweep(self):
+        """Drop uploads nobody has touched for longer than the TTL."""
+        cutoff = time.time() - self.ttl
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                    parts = os.path.join(entry.path, "parts")
+                    if not os.path.exists(parts) or os.stat(parts).st_mtime < cutoff:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                        log.info("🧹 Dropped abandoned upload %s", entry.name)
+            except OSError:
+                pass
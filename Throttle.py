@@ -0,0 +1,41 @@
+"""
+Token-bucket rate limiting, shared by the server and the client.
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Lets through rate bytes per second on average, with bursts of up to
+    burst bytes. take() blocks until the bytes are allowed; a rate of 0
+    means no limit.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.lock = threading.Lock()
+        self.configure(rate, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def configure(self, rate, burst=None):
+        """Change the limit in place; bytes already booked stay booked."""
+        with self.lock:
+            self.rate = rate
+            self.burst = burst or max(rate, 64 * 1024)
+
+    def delay(self, amount):
+        """Seconds to wait before amount bytes may pass; reserves them."""
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def take(self, amount):
+        wait = self.delay(amount)
+        if wait:
+            time.sleep(wait)
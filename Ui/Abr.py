@@ -0,0 +1,79 @@
+"""
+Adaptive bitrate: pick which rendition each HLS segment is fetched from.
+
+Throughput is measured on every segment download. Playback starts on the
+lowest rendition so the first frame comes quickly on any link, climbs one
+rung at a time while the next rung fits comfortably in the estimate, and
+drops straight to a rung that fits as soon as throughput falls.
+"""
+import threading
+import Config
+
+# Downloads smaller than this mostly measure latency, not bandwidth
+MIN_SAMPLE_BYTES = 16 * 1024
+
+
+# ---------- Throughput ----------
+class ThroughputEstimator:
+    """
+    Two moving averages of download speed in bit/s. The estimate is the lower
+    of the two: the fast one catches a drop after one slow segment, the slow
+    one keeps a single lucky segment from looking like a faster link.
+    """
+
+    def __init__(self, fast=0.5, slow=0.15):
+        self.alphas = (fast, slow)
+        self.averages = [None, None]
+        self.lock = threading.Lock()
+
+    def record(self, size, seconds):
+        if size < MIN_SAMPLE_BYTES or seconds <= 0:
+            return
+        sample = size * 8 / seconds
+        with self.lock:
+            for i, alpha in enumerate(self.alphas):
+                old = self.averages[i]
+                self.averages[i] = sample if old is None else alpha * sample + (1 - alpha) * old
+
+    def estimate(self):
+        """Bits per second, or None before the first measurement."""
+        with self.lock:
+            if self.averages[0] is None:
+                return None
+            return min(self.averages)
+
+
+# ---------- Rendition choice ----------
+class AbrController:
+    """Rendition choice for one playing video, given its server manifest."""
+
+    def __init__(self, manifest, safety=Config.ABR_SAFETY):
+        self.renditions = sorted(manifest["renditions"], key=lambda r: r["bandwidth"])
+        self.safety = safety
+        self.throughput = ThroughputEstimator()
+        self.level = 0
+        self.lock = threading.Lock()
+
+    def segment_durations(self):
+        """Segment lengths in seconds; renditions share keyframe times, so any one will do."""
+        count = min(len(r["segments"]) for r in self.renditions)
+        return [s["duration"] for s in self.renditions[0]["segments"][:count]]
+
+    def choose(self):
+        """The rendition the next segment should come from."""
+        estimate = self.throughput.estimate()
+        with self.lock:
+            if estimate is not None:
+                budget = estimate * self.safety
+                fits = 0
+                for level, rendition in enumerate(self.renditions):
+                    if rendition["bandwidth"] <= budget:
+                        fits = level
+                if fits < self.level:
+                    self.level = fits
+                elif fits > self.level:
+                    self.level += 1
+            return self.renditions[self.level]
+
+    def record(self, size, seconds):
+        self.throughput.record(size, seconds)
@@ -0,0 +1,250 @@
+import socket
+import threading
+import Config
+import Protocol
+from Protocol import recv_exact
+
+# Request bodies are sent in DATA frames of this size
+BODY_FRAME_BYTES = 256 * 1024
+
+# Session token from the last login, sent as AUTH on every new connection
+_session = {"token": None}
+
+
+# ---------- Connection ----------
+class Connection:
+    """One persistent, framed connection to the video server."""
+
+    def __init__(self, host, port, timeout=Config.CLIENT_TIMEOUT):
+        self.sock = socket.create_connection((host, port), timeout)
+        # Requests are written whole; Nagle would hold each one back for the last reply's ACK
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.sendall(Protocol.MAGIC)
+        self.next_id = 1
+        self.pool = None
+        self.closed = False
+        if _session["token"]:
+            self.authenticate(_session["token"])
+
+    def authenticate(self, token):
+        """Tie this connection to a session; a rejected token leaves it anonymous."""
+        header, body = self.request(f"AUTH {token}")
+        if body is None:
+            print(f"❌ Session rejected: {header.decode(errors='replace')}")
+            return False
+        self.read_frame()  # END of the OK reply
+        return True
+
+    def send_request(self, command, body=None):
+        """Send one request; body (bytes) follows it as DATA frames and an END."""
+        request_id = self.next_id
+        self.next_id = (self.next_id + 1) % 2 ** 32 or 1
+        frames = Protocol.pack_frame(request_id, Protocol.REQUEST, command.encode())
+        if body is not None:
+            # Each DATA frame goes out with its header, and the END with the last one
+            view = memoryview(body)
+            for start in range(0, len(view), BODY_FRAME_BYTES):
+                chunk = view[start:start + BODY_FRAME_BYTES]
+                frames += Protocol.FRAME.pack(request_id, Protocol.DATA, len(chunk)) + chunk
+                if start + BODY_FRAME_BYTES < len(view):
+                    self.sock.sendall(frames)
+                    frames = b""
+            frames += Protocol.pack_frame(request_id, Protocol.END)
+        self.sock.sendall(frames)
+        return request_id
+
+    def read_frame(self):
+        raw = recv_exact(self.sock, Protocol.FRAME.size)
+        if len(raw) < Protocol.FRAME.size:
+            raise ConnectionError("server closed the connection")
+        return Protocol.FRAME.unpack(raw)
+
+    def read_response(self, request_id):
+        """
+        Read the reply header for request_id. Returns (header, body); body is
+        None for an error reply, whose header starts with b"ERROR".
+        """
+        reply_id, kind, length = self.read_frame()
+        payload = recv_exact(self.sock, length)
+        if reply_id != request_id or len(payload) < length:
+            raise ConnectionError("framing out of sync")
+        if kind == Protocol.ERROR:
+            return payload, None
+        if kind != Protocol.HEADER:
+            raise ConnectionError(f"unexpected frame kind {kind}")
+        return payload, ResponseBody(self, request_id)
+
+    def request(self, command, body=None):
+        return self.read_response(self.send_request(command, body))
+
+    def pipeline(self, commands):
+        """Send every command before reading any reply. Returns [(header, body bytes)]."""
+        ids = [self.send_request(command) for command in commands]
+        replies = []
+        for request_id in ids:
+            header, body = self.read_response(request_id)
+            replies.append((header, body.read_all(release=False) if body else None))
+        return replies
+
+    def release(self):
+        if self.pool is not None and not self.closed:
+            self.pool.release(self)
+        else:
+            self.close()
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class ResponseBody:
+    """
+    Body of one framed reply with a socket-like recv()/close(). Closing it
+    after the END frame returns the connection to its pool; closing early
+    drops the connection, since unread data would still be on the wire.
+    """
+
+    def __init__(self, connection, request_id):
+        self.connection = connection
+        self.request_id = request_id
+        self.remaining = 0  # bytes left in the current DATA frame
+        self.received = 0
+        self.expected = None  # body length, when the reply header announced one
+        self.done = False
+        self.failed = False
+        self.closed = False
+
+    def recv(self, size):
+        conn = self.connection
+        while self.remaining == 0:
+            if self.done:
+                return b""
+            reply_id, kind, length = conn.read_frame()
+            if reply_id != self.request_id:
+                raise ConnectionError("framing out of sync")
+            if kind == Protocol.DATA:
+                self.remaining = length
+            elif kind == Protocol.END:
+                self.done = True
+            elif kind == Protocol.ERROR:
+                print(f"❌ Server error mid-stream: {recv_exact(conn.sock, length).decode()}")
+                self.done = self.failed = True
+            else:
+                raise ConnectionError(f"unexpected frame kind {kind}")
+
+        data = conn.sock.recv(min(size, self.remaining))
+        if not data:
+            raise ConnectionError("server closed the connection")
+        self.remaining -= len(data)
+        self.received += len(data)
+        return data
+
+    def read_all(self, release=True):
+        """
+        The rest of the body. The connection then goes back to its pool,
+        unless release is False because its owner still has replies to read.
+        """
+        buf = bytearray()
+        while True:
+            data = self.recv(65536)
+            if not data:
+                break
+            buf += data
+        if release:
+            self.close()
+        else:
+            self.closed = True
+        return bytes(buf)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if not self.done and self.expected is not None and self.received >= self.expected:
+            # Everything announced has arrived; pick up the END frame so the
+            # connection can be reused
+            try:
+                self.recv(1)
+            except (OSError, ConnectionError):
+                pass
+        if self.done and self.remaining == 0:
+            self.connection.release()
+        else:
+            self.connection.close()
+
+
+# ---------- Pool ----------
+class ConnectionPool:
+    """Keeps a few idle connections to one server so requests skip the TCP handshake."""
+
+    def __init__(self, host, port, max_idle=Config.CLIENT_POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.max_idle = max_idle
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        conn = Connection(self.host, self.port)
+        conn.pool = self
+        return conn
+
+    def release(self, conn):
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, command, data=None):
+        """
+        Send one command, and data with it if given, on a pooled connection.
+        Returns (header, body). A connection the server already closed is
+        replaced and retried once.
+        """
+        for attempt in range(2):
+            conn = self.acquire()
+            try:
+                header, body = conn.request(command, data)
+            except (OSError, ConnectionError):
+                conn.close()
+                if attempt:
+                    raise
+                continue
+            if body is None:
+                conn.release()  # error replies carry no body
+            return header, body
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def set_session_token(token):
+    """Use token from now on. Idle connections are dropped, since they were opened without it."""
+    _session["token"] = token
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+
+
+def get_pool(host, port):
+    """Pool shared by everything in this client process that talks to host:port."""
+    with _pools_lock:
+        pool = _pools.get((host, port))
+        if pool is None:
+            pool = _pools[(host, port)] = ConnectionPool(host, port)
+        return pool
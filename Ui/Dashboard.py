@@ -1,56 +1,38 @@
-import socket
-import tempfile
 import vlc
 import sys
+import threading
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
-    QListWidget, QMessageBox, QLabel, QPushButton
+    QListView, QMessageBox, QLabel, QPushButton, QProgressBar, QFileDialog
 )
 from PyQt5.QtGui import QFont, QColor, QPalette, QBrush, QLinearGradient
-from PyQt5.QtCore import Qt
-from Database.Sqlite_db import get_supabase_name, get_all_videos
+from PyQt5.QtCore import Qt, QSize, QThread, QTimer, pyqtSignal
+import Config
 from Ui.Searchbar import SearchBar
-
-
-# ---------- Video Receiving ----------
-def receive_video(filename, bucket_name, host="127.0.0.1", port=9999):
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        client_socket.connect((host, port))
-        client_socket.sendall(f"GET {bucket_name} {filename}".encode())
-
-        raw_size = client_socket.recv(16).decode()
-        try:
-            file_size = int(raw_size.strip())
-        except ValueError:
-            print(f"❌ Invalid file size received for '{filename}'")
-            return None
-
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
-        received = 0
-        while received < file_size:
-            data = client_socket.recv(4096)
-            if not data:
-                break
-            temp_file.write(data)
-            received += len(data)
-        temp_file.close()
-        return temp_file.name
-
-    except Exception as e:
-        print(f"❌ Error receiving video: {e}")
-        return None
-    finally:
-        client_socket.close()
+from Ui.Downloader import DownloadWorker
+from Ui.Stream_client import request_prefetch
+from Ui.Video_Player import VideoProxy, PrebufferWorker, PrefetchWorker
+from Ui.Uploader import UploadWorker
+from Ui.Video_list_model import VideoListModel
 
 
 # ---------- Dashboard ----------
 class DashboardWindow(QWidget):
+    # VLC reports buffering from its own thread; this hops it onto the GUI thread
+    vlc_buffering = pyqtSignal(float)
+    # The proxy reports rendition switches from its own threads too
+    rendition_shown = pyqtSignal(str)
+
     def __init__(self, host="127.0.0.1", port=9999):
         super().__init__()
         self.host = host
         self.port = port
         self.current_bucket = None
+        self.buffer_worker = None
+        self.upload_worker = None
+        self.download_worker = None
+        self.prefetch_worker = None
+        self.playing_row = 0
 
         # ---------- Window setup ----------
         self.setWindowTitle("🎬 A_Server Video Player")
@@ -78,13 +60,32 @@ class DashboardWindow(QWidget):
         main_layout.addWidget(title)
 
         # ---------- Search Bar ----------
-        self.search_bar = SearchBar(search_callback=self.handle_search)
+        self.search_bar = SearchBar(
+            search_callback=self.handle_search, results_callback=self.show_search_results,
+            host=host, port=port,
+        )
         main_layout.addWidget(self.search_bar)
 
         # ---------- Video List ----------
-        self.video_list = QListWidget()
+        # Rows come from the model a page at a time; the view only draws what is visible
+        self.video_model = VideoListModel(host, port, parent=self)
+        self.video_model.load_failed.connect(
+            lambda message: QMessageBox.critical(self, "Error", f"Could not load videos: {message}")
+        )
+        # The first few titles are the likely clicks: have the server warm them
+        self.video_model.top_rows.connect(self.prefetch_top)
+        # Titles others add or remove show up as small deltas from the server catalog
+        self.catalog_timer = QTimer(self)
+        self.catalog_timer.setInterval(Config.CATALOG_REFRESH_MS)
+        self.catalog_timer.timeout.connect(self.video_model.refresh)
+        self.catalog_timer.start()
+        self.video_list = QListView()
+        self.video_list.setModel(self.video_model)
+        self.video_list.setUniformItemSizes(True)
+        # Posters are POSTER_HEIGHT tall on the server; shown at half size, 16:9
+        self.video_list.setIconSize(QSize(Config.POSTER_HEIGHT * 8 // 9, Config.POSTER_HEIGHT // 2))
         self.video_list.setStyleSheet("""
-            QListWidget {
+            QListView {
                 background-color: #FFFFFF;
                 color: #333;
                 border-radius: 8px;
@@ -92,7 +93,7 @@ class DashboardWindow(QWidget):
                 padding: 6px;
                 border: 1px solid #90CAF9;
             }
-            QListWidget::item:selected {
+            QListView::item:selected {
                 background-color: #42A5F5;
                 color: white;
                 border-radius: 5px;
@@ -109,6 +110,35 @@ class DashboardWindow(QWidget):
         """)
         main_layout.addWidget(self.video_widget, 1)
 
+        # ---------- Buffering Indicator ----------
+        self.buffer_bar = QProgressBar()
+        self.buffer_bar.setRange(0, 100)
+        self.buffer_bar.setFormat("Buffering %p%")
+        self.buffer_bar.setAlignment(Qt.AlignCenter)
+        self.buffer_bar.setFixedHeight(16)
+        self.buffer_bar.setStyleSheet("""
+            QProgressBar {
+                background-color: #FFFFFF;
+                border: 1px solid #90CAF9;
+                border-radius: 6px;
+                color: #0D47A1;
+                font-size: 11px;
+            }
+            QProgressBar::chunk {
+                background-color: #42A5F5;
+                border-radius: 6px;
+            }
+        """)
+        self.buffer_bar.hide()
+        main_layout.addWidget(self.buffer_bar)
+
+        # ---------- Quality Indicator ----------
+        self.quality_label = QLabel()
+        self.quality_label.setAlignment(Qt.AlignCenter)
+        self.quality_label.setStyleSheet("color: #0D47A1; font-size: 11px;")
+        self.quality_label.hide()
+        main_layout.addWidget(self.quality_label)
+
         # ---------- Control Buttons ----------
         controls_layout = QHBoxLayout()
         controls_layout.setSpacing(12)
@@ -133,16 +163,28 @@ class DashboardWindow(QWidget):
         self.pause_btn = QPushButton("⏸ Pause")
         self.stop_btn = QPushButton("⏹ Stop")
         self.forward_btn = QPushButton("⏩ Forward 10s")
+        self.upload_btn = QPushButton("⬆ Upload")
+        self.download_btn = QPushButton("⬇ Download")
 
-        for btn in [self.back_btn, self.play_btn, self.pause_btn, self.stop_btn, self.forward_btn]:
+        for btn in [self.back_btn, self.play_btn, self.pause_btn, self.stop_btn, self.forward_btn,
+                    self.upload_btn, self.download_btn]:
             btn.setStyleSheet(button_style)
             controls_layout.addWidget(btn)
 
         main_layout.addLayout(controls_layout)
 
+        # ---------- Loopback proxy: VLC streams and seeks through RANGE requests ----------
+        self.proxy = VideoProxy(host, port, on_rendition=self.rendition_shown.emit)
+        self.rendition_shown.connect(self.show_rendition)
+
         # ---------- VLC Setup ----------
-        self.vlc_instance = vlc.Instance()
+        self.vlc_instance = vlc.Instance(f"--network-caching={Config.PLAYER_NETWORK_CACHING_MS}")
         self.player = self.vlc_instance.media_player_new()
+        self.player.event_manager().event_attach(
+            vlc.EventType.MediaPlayerBuffering,
+            lambda event: self.vlc_buffering.emit(event.u.new_cache),
+        )
+        self.vlc_buffering.connect(self.show_buffering)
 
         if sys.platform.startswith("linux"):
             self.player.set_xwindow(self.video_widget.winId())
@@ -152,51 +194,71 @@ class DashboardWindow(QWidget):
             self.player.set_nsobject(int(self.video_widget.winId()))
 
         # ---------- Connect Buttons ----------
-        self.video_list.itemClicked.connect(self.play_video)
+        self.video_list.clicked.connect(self.play_video)
         self.play_btn.clicked.connect(self.play_video_action)
         self.pause_btn.clicked.connect(self.pause_video)
         self.stop_btn.clicked.connect(self.stop_video)
         self.back_btn.clicked.connect(lambda: self.seek_video(-10))
         self.forward_btn.clicked.connect(lambda: self.seek_video(10))
+        self.upload_btn.clicked.connect(self.upload_video)
+        self.download_btn.clicked.connect(self.download_video)
 
     # ---------- Load Videos ----------
     def load_videos(self, bucket=None):
-        self.video_list.clear()
         self.current_bucket = bucket
-        try:
-            videos = get_all_videos(bucket=bucket)
-            if videos:
-                for (user_name,) in videos:
-                    self.video_list.addItem(user_name)
-            else:
-                self.video_list.addItem("No videos found 😢")
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Could not load videos: {e}")
+        self.video_model.load_bucket(bucket)
 
     # ---------- Handle Search ----------
     def handle_search(self, bucket_name):
         self.load_videos(bucket=bucket_name)
 
-    # ---------- Play Video ----------
-    def play_video(self, item):
-        user_name = item.text()
-        if "No videos" in user_name:
-            return
-
-        supabase_name = get_supabase_name(user_name, bucket_name=self.current_bucket)
-        if not supabase_name:
-            QMessageBox.critical(
-                self, "Error",
-                f"No video found for '{user_name}' in bucket '{self.current_bucket}'"
-            )
+    def show_search_results(self, query, results):
+        """List titles matching the query from every bucket, best match first."""
+        if not query:
+            self.load_videos(bucket=self.current_bucket)
             return
+        self.video_model.set_results(results)
 
-        file_path = receive_video(supabase_name, self.current_bucket, self.host, self.port)
-        if not file_path:
-            QMessageBox.critical(self, "Error", f"Could not fetch '{supabase_name}' from server.")
-            return
-
-        media = self.vlc_instance.media_new(file_path)
+    # ---------- Play Video ----------
+    def play_video(self, index):
+        # Every row already knows its bucket and Supabase file name
+        found = index.data(Qt.UserRole)
+        if not found:
+            return  # the "No videos" placeholder
+        bucket_name, supabase_name = found
+
+        # Make sure the first few seconds are cached, then hand VLC the proxy URL
+        if self.buffer_worker:
+            self.buffer_worker.requestInterruption()
+        if self.prefetch_worker:
+            self.prefetch_worker.requestInterruption()
+            self.prefetch_worker = None
+        self.playing_row = index.row()
+        self.player.stop()
+        self.show_buffering(0)
+
+        worker = PrebufferWorker(supabase_name, bucket_name, self.host, self.port, parent=self)
+        worker.progress.connect(
+            lambda done, target: self.show_buffering(100 * done / max(target, 1))
+        )
+        worker.ready.connect(lambda w=worker: self.start_playback(w))
+        worker.failed.connect(lambda message, w=worker: self.buffering_failed(w, message))
+        worker.finished.connect(worker.deleteLater)
+        self.buffer_worker = worker
+        worker.start()
+
+    def start_playback(self, worker):
+        if worker is not self.buffer_worker:
+            return  # user picked another video meanwhile
+        self.buffer_worker = None
+
+        if worker.manifest:
+            # Packaged on the server: HLS from the proxy, rendition picked per segment
+            url = self.proxy.abr_url_for(worker.bucket_name, worker.filename, worker.manifest)
+        else:
+            url = self.proxy.url_for(worker.bucket_name, worker.filename)
+            self.quality_label.hide()
+        media = self.vlc_instance.media_new(url)
         self.player.set_media(media)
 
         # 🎯 Play video inside the same widget size (fit, not stretch)
@@ -204,6 +266,121 @@ class DashboardWindow(QWidget):
         self.player.video_set_aspect_ratio(None)
 
         self.player.play()
+        self.prefetch_neighbours()
+
+    # ---------- Prefetch ----------
+    def prefetch_top(self, titles):
+        titles = titles[:Config.PREFETCH_TOP_N]
+        threading.Thread(
+            target=request_prefetch, args=(titles, self.host, self.port), daemon=True
+        ).start()
+
+    def prefetch_neighbours(self):
+        """Fetch the start of the videos next to the playing one, at low priority."""
+        titles = self.video_model.neighbours(self.playing_row, Config.CLIENT_PREFETCH_NEIGHBOURS)
+        if not titles:
+            return
+        worker = PrefetchWorker(titles, self.host, self.port, parent=self)
+        worker.finished.connect(lambda w=worker: self.prefetch_finished(w))
+        worker.finished.connect(worker.deleteLater)
+        self.prefetch_worker = worker
+        worker.start(QThread.LowestPriority)
+
+    def prefetch_finished(self, worker):
+        if worker is self.prefetch_worker:
+            self.prefetch_worker = None
+
+    def buffering_failed(self, worker, message):
+        if worker is not self.buffer_worker:
+            return
+        self.buffer_worker = None
+        self.buffer_bar.hide()
+        QMessageBox.critical(self, "Error", message)
+
+    # ---------- Upload Video ----------
+    def upload_video(self):
+        if self.upload_worker:
+            return  # one upload at a time
+        if not self.current_bucket:
+            QMessageBox.information(self, "Upload", "Open a bucket first, then upload into it.")
+            return
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Upload video", "", "Videos (*.mp4 *.mkv *.mov *.webm)"
+        )
+        if not path:
+            return
+
+        worker = UploadWorker(path, self.current_bucket, self.host, self.port, parent=self)
+        worker.progress.connect(
+            lambda sent, total: self.upload_btn.setText(f"⬆ {100 * sent // max(total, 1)}%")
+        )
+        worker.done.connect(self.upload_done)
+        worker.failed.connect(lambda message: QMessageBox.critical(self, "Upload failed", message))
+        worker.finished.connect(self.upload_finished)
+        worker.finished.connect(worker.deleteLater)
+        self.upload_worker = worker
+        self.upload_btn.setText("⬆ 0%")
+        worker.start()
+
+    def upload_done(self, bucket_name, title):
+        if bucket_name == self.current_bucket:
+            self.video_model.refresh()
+
+    def upload_finished(self):
+        self.upload_worker = None
+        self.upload_btn.setText("⬆ Upload")
+
+    # ---------- Download Video ----------
+    def download_video(self):
+        if self.download_worker:
+            return  # one download at a time
+        found = self.video_list.currentIndex().data(Qt.UserRole)
+        if not found:
+            QMessageBox.information(self, "Download", "Pick a video in the list first.")
+            return
+        bucket_name, supabase_name = found
+        path, _ = QFileDialog.getSaveFileName(self, "Save video", supabase_name)
+        if not path:
+            return
+
+        worker = DownloadWorker(supabase_name, bucket_name, path, self.host, self.port, parent=self)
+        worker.progress.connect(self.show_download_progress)
+        worker.done.connect(lambda path: QMessageBox.information(self, "Download", f"Saved to {path}"))
+        worker.failed.connect(lambda message: QMessageBox.critical(self, "Download failed", message))
+        worker.finished.connect(self.download_finished)
+        worker.finished.connect(worker.deleteLater)
+        self.download_worker = worker
+        self.download_btn.setText("⬇ 0%")
+        worker.start()
+
+    def show_download_progress(self, received, total, rate):
+        self.download_btn.setText(
+            f"⬇ {100 * received // max(total, 1)}% · {rate / 1024 ** 2:.1f} MB/s"
+        )
+
+    def download_finished(self):
+        self.download_worker = None
+        self.download_btn.setText("⬇ Download")
+
+    # ---------- Buffering Indicator ----------
+    def show_buffering(self, percent):
+        if percent >= 100:
+            self.buffer_bar.hide()
+            return
+        self.buffer_bar.setValue(int(percent))
+        self.buffer_bar.show()
+
+    def show_rendition(self, name):
+        self.quality_label.setText(f"Quality {name}")
+        self.quality_label.show()
+
+    # ---------- Close ----------
+    def closeEvent(self, event):
+        if self.prefetch_worker:
+            self.prefetch_worker.requestInterruption()
+        self.player.stop()
+        self.proxy.stop()  # also saves the client cache index
+        super().closeEvent(event)
 
     # ---------- Control Actions ----------
     def play_video_action(self):
@@ -216,6 +393,7 @@ class DashboardWindow(QWidget):
         self.player.stop()
 
     def seek_video(self, seconds):
+        # VLC asks the proxy for the new position, which fetches only that range
         length = self.player.get_length()
         current = self.player.get_time()
         new_time = max(0, min(current + (seconds * 1000), length))
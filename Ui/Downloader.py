@@ -0,0 +1,39 @@
+import shutil
+from PyQt5.QtCore import QThread, pyqtSignal
+from Ui.Stream_client import receive_video
+
+
+# ---------- Download Worker ----------
+class DownloadWorker(QThread):
+    """
+    Downloads one whole video off the GUI thread and saves a copy to path.
+    Only a file that matches the server's checksums is saved; a download
+    cut off by the network resumes where it stopped, now or on a later try.
+    """
+
+    progress = pyqtSignal(object, object, object)  # bytes received, total bytes, bytes per second
+    done = pyqtSignal(str)                         # where the video was saved
+    failed = pyqtSignal(str)
+
+    def __init__(self, filename, bucket_name, path, host="127.0.0.1", port=9999, parent=None):
+        super().__init__(parent)
+        self.filename = filename
+        self.bucket_name = bucket_name
+        self.path = path
+        self.host = host
+        self.port = port
+
+    def run(self):
+        try:
+            cached = receive_video(
+                self.filename, self.bucket_name, self.host, self.port,
+                progress=self.progress.emit,
+            )
+            if cached is None:
+                self.failed.emit(f"Could not download '{self.filename}'. Try again to resume it.")
+                return
+            shutil.copyfile(cached, self.path)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.done.emit(self.path)
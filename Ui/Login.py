@@ -1,8 +1,8 @@
 import re
 from PyQt5.QtWidgets import QWidget, QLabel, QLineEdit, QPushButton, QVBoxLayout, QMessageBox
 from PyQt5.QtGui import QFont
-from PyQt5.QtCore import Qt
-from Database.Sqlite_db import check_user, register_user  
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from Ui.Stream_client import login
 
 def validate_email(email):
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -23,10 +23,36 @@ def validate_password(pw):
     return True
 
 
+# -------------- Login Worker --------------
+class LoginWorker(QThread):
+    """Logs in or signs up with the server off the GUI thread; the server hashes the password."""
+
+    done = pyqtSignal(str)    # email
+    failed = pyqtSignal(str)  # reason
+
+    def __init__(self, email, password, register, host, port, parent=None):
+        super().__init__(parent)
+        self.email = email
+        self.password = password
+        self.register = register
+        self.host = host
+        self.port = port
+
+    def run(self):
+        email, error = login(self.email, self.password, self.register, self.host, self.port)
+        if email is None:
+            self.failed.emit(error)
+        else:
+            self.done.emit(email)
+
+
 # -------------- Authentication Window --------------
 class AuthWindow(QWidget):
-    def __init__(self):
+    def __init__(self, host="127.0.0.1", port=9999):
         super().__init__()
+        self.host = host
+        self.port = port
+        self.worker = None
         self.setWindowTitle("A_Server Authentication")
         self.setGeometry(200, 200, 400, 320)
         self.setFixedSize(400, 320)
@@ -96,53 +122,50 @@ class AuthWindow(QWidget):
         self.setLayout(layout)
 
     def handle_login_clicked(self):
-        email = self.email_field.text().strip()
-        pw = self.pass_field.text()
-
-        if not validate_email(email):
-            QMessageBox.critical(self, "Invalid Email", "Please enter a proper email address.")
-            return
-        if not validate_password(pw):
-            QMessageBox.critical(self, "Weak Password",
-                                 "Password must be 8+ chars, include 1 uppercase, 1 number, and 1 special character.")
-            return
-
-        try:
-            ok = check_user(email, pw)
-        except Exception as e:
-            QMessageBox.critical(self, "Database Error", f"Something went wrong while checking user:\n{e}")
-            return
-
-        if ok:
-            QMessageBox.information(self, "Welcome!", f"Successfully logged in as {email}")
-            if self.handle_success:
-                self.handle_success(email)
-            self.close()
-        else:
-            QMessageBox.warning(self, "Login Failed", "Email or password seems incorrect.")
+        self.start_login(register=False)
 
     def handle_signup_clicked(self):
+        self.start_login(register=True)
+
+    def start_login(self, register):
         email = self.email_field.text().strip()
         pw = self.pass_field.text()
 
         if not validate_email(email):
-            QMessageBox.critical(self, "Invalid Email", "Please enter a valid email address.")
+            QMessageBox.critical(self, "Invalid Email", "Please enter a proper email address.")
             return
         if not validate_password(pw):
             QMessageBox.critical(self, "Weak Password",
                                  "Password must be 8+ chars, include 1 uppercase, 1 number, and 1 special character.")
             return
-
-        try:
-            created = register_user(email, pw)
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Something went wrong during registration:\n{e}")
-            return
-
-        if created:
+        if self.worker is not None:
+            return  # one attempt at a time
+
+        self.btn_login.setEnabled(False)
+        self.btn_signup.setEnabled(False)
+        self.worker = LoginWorker(email, pw, register, self.host, self.port, parent=self)
+        self.worker.done.connect(lambda email: self.login_succeeded(email, register))
+        self.worker.failed.connect(lambda reason: self.login_failed(reason, register))
+        self.worker.finished.connect(self.login_finished)
+        self.worker.start()
+
+    def login_finished(self):
+        self.worker.deleteLater()
+        self.worker = None
+        self.btn_login.setEnabled(True)
+        self.btn_signup.setEnabled(True)
+
+    def login_succeeded(self, email, register):
+        if register:
             QMessageBox.information(self, "Success", f"Account created for {email}!")
-            if self.handle_success:
-                self.handle_success(email)
-            self.close()
         else:
-            QMessageBox.warning(self, "Registration Failed", "User may already exist or DB error occurred.")
+            QMessageBox.information(self, "Welcome!", f"Successfully logged in as {email}")
+        if self.handle_success:
+            self.handle_success(email)
+        self.close()
+
+    def login_failed(self, reason, register):
+        if register:
+            QMessageBox.warning(self, "Registration Failed", reason)
+        else:
+            QMessageBox.warning(self, "Login Failed", reason)
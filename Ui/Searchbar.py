@@ -1,6 +1,12 @@
 # ---------- SearchBar.py ----------
 from PyQt5.QtWidgets import QWidget, QLineEdit, QPushButton, QHBoxLayout, QMessageBox
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
 from difflib import get_close_matches
+from Ui.Stream_client import search_catalog
+
+# Wait this long after the last keystroke before searching titles
+TYPING_DELAY_MS = 150
+RESULT_LIMIT = 50
 
 # Buckets in your system
 BUCKETS = [
@@ -19,9 +25,31 @@ KEYWORDS = {
 }
 
 
+class SearchWorker(QThread):
+    """Runs one title search on the server off the GUI thread."""
+
+    found = pyqtSignal(int, str, object)  # generation, query, [(user_name, bucket, name)] or None
+
+    def __init__(self, generation, query, host, port, parent=None):
+        super().__init__(parent)
+        self.generation = generation
+        self.query = query
+        self.host = host
+        self.port = port
+
+    def run(self):
+        results = search_catalog(self.query, RESULT_LIMIT, self.host, self.port)
+        self.found.emit(self.generation, self.query, results)
+
+
 class SearchBar(QWidget):
-    def __init__(self, parent=None, search_callback=None):
+    def __init__(self, parent=None, search_callback=None, results_callback=None,
+                 host="127.0.0.1", port=9999):
         super().__init__(parent)
+        self.host = host
+        self.port = port
+        self.generation = 0   # bumped per search; answers to older ones are dropped
+        self.fallback = False  # whether the latest search came from Enter
 
         # --- UI Setup ---
         self.search_bar = QLineEdit()
@@ -33,12 +61,20 @@ class SearchBar(QWidget):
         layout.addWidget(self.search_btn)
         self.setLayout(layout)
 
-        # Callback function from main GUI
-        self.search_callback = search_callback
+        # Callback functions from main GUI
+        self.search_callback = search_callback      # bucket name
+        self.results_callback = results_callback    # (query, [(user_name, bucket, name)])
+
+        # Title search runs while typing, once the user pauses
+        self.typing_timer = QTimer(self)
+        self.typing_timer.setSingleShot(True)
+        self.typing_timer.setInterval(TYPING_DELAY_MS)
+        self.typing_timer.timeout.connect(self.search_titles)
 
         # Connect actions
         self.search_btn.clicked.connect(self.perform_search)
         self.search_bar.returnPressed.connect(self.perform_search)
+        self.search_bar.textChanged.connect(lambda _: self.typing_timer.start())
 
     # ---------- Logic Section ----------
 
@@ -55,14 +91,47 @@ class SearchBar(QWidget):
                     return bucket
         return None
 
+    def search_titles(self, fallback=False):
+        """Search video titles across every bucket; the ranked results are handed over when they arrive."""
+        query = self.search_bar.text().strip()
+        self.generation += 1
+        self.fallback = fallback
+        if not query:
+            if self.results_callback:
+                self.results_callback(query, [])
+            return
+        worker = SearchWorker(self.generation, query, self.host, self.port, parent=self)
+        worker.found.connect(self.titles_found)
+        worker.finished.connect(worker.deleteLater)
+        worker.start()
+
+    def titles_found(self, generation, query, results):
+        if generation != self.generation:
+            return  # the user typed on meanwhile
+        if self.fallback and not results:
+            self.search_bucket(query.lower())  # nothing by title: maybe a bucket name
+            return
+        if self.results_callback:
+            self.results_callback(query, results or [])
+
     def perform_search(self):
-        """Handle search event and return bucket name."""
+        """Handle search event: show matching titles, else fall back to a bucket name."""
+        self.typing_timer.stop()
         query = self.search_bar.text().strip().lower()
 
         if not query:
             QMessageBox.warning(self, "Search", "Please enter something to search!")
             return None
 
+        # Step 0: Titles in the catalog, unless the query names a bucket exactly;
+        # the bucket steps below run if none match (see titles_found)
+        if query not in BUCKETS and self.results_callback:
+            self.search_titles(fallback=True)
+            return None
+        return self.search_bucket(query)
+
+    def search_bucket(self, query):
+        """Open the bucket the query names or hints at."""
         # Step 1: Try correcting the bucket name directly
         corrected_bucket = self.correct_word(query, BUCKETS)
 
@@ -0,0 +1,315 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+import Config
+
+
+def _video_id(bucket_name, filename):
+    return hashlib.sha256(f"{bucket_name}\0{filename}".encode()).hexdigest()[:32]
+
+
+def _is_video_id(name):
+    return len(name) == 32 and all(c in "0123456789abcdef" for c in name)
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+# ---------- Segment Cache ----------
+class SegmentCache:
+    """
+    Keeps the parts of videos this client has already received. Each video is
+    a sparse data file split into fixed-size segments; meta.json records the
+    hash of every segment we hold so damaged bytes are never played, and is
+    the journal an interrupted download resumes from. Once the server's
+    checksums are known (expect()), only segments matching them are stored.
+    Whole videos are evicted, least recently used first, once max_bytes is
+    exceeded.
+    """
+
+    def __init__(self, root=Config.CLIENT_CACHE_DIR, max_bytes=Config.CLIENT_CACHE_MAX_BYTES,
+                 segment_size=Config.CLIENT_SEGMENT_SIZE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.segment_size = segment_size
+        self.lock = threading.RLock()
+        self.videos = OrderedDict()  # video id -> meta, least recently used first
+        self.total_bytes = 0
+        self.dirty = set()
+        self.last_save = 0.0
+
+        os.makedirs(root, exist_ok=True)
+        self._load_existing()
+
+    # ---------- Startup ----------
+    def _load_existing(self):
+        """Drop leftovers from crashed runs and index what is still usable."""
+        found = []
+        for entry in os.scandir(self.root):
+            # Only touch directories this cache created
+            if not entry.is_dir() or not _is_video_id(entry.name):
+                continue
+            try:
+                with open(os.path.join(entry.path, "meta.json")) as f:
+                    meta = json.load(f)
+                meta["segments"] = {int(k): v for k, v in meta["segments"].items()}
+                if meta["segment_size"] != self.segment_size:
+                    raise ValueError("segment size changed")
+            except (OSError, ValueError, KeyError, TypeError):
+                shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            for name in os.listdir(entry.path):
+                if name.endswith(".tmp"):
+                    os.remove(os.path.join(entry.path, name))
+            found.append((meta.get("used", 0), entry.name, meta))
+
+        for _, vid, meta in sorted(found):
+            self.videos[vid] = meta
+            self.total_bytes += self._held_bytes(meta)
+        self._evict()
+
+    # ---------- Paths ----------
+    def _dir(self, vid):
+        return os.path.join(self.root, vid)
+
+    def data_path(self, bucket_name, filename):
+        return os.path.join(self._dir(_video_id(bucket_name, filename)), "data.bin")
+
+    def _held_bytes(self, meta):
+        return len(meta["segments"]) * meta["segment_size"]
+
+    # ---------- Lookup ----------
+    def total_for(self, bucket_name, filename):
+        with self.lock:
+            meta = self.videos.get(_video_id(bucket_name, filename))
+            return meta["total"] if meta else None
+
+    def segment_count(self, total):
+        return (total + self.segment_size - 1) // self.segment_size
+
+    def has_segment(self, bucket_name, filename, index):
+        with self.lock:
+            meta = self.videos.get(_video_id(bucket_name, filename))
+            return bool(meta) and index in meta["segments"]
+
+    def missing_run_end(self, bucket_name, filename, index, last):
+        """Last index of the run of missing segments starting at index (up to last)."""
+        with self.lock:
+            meta = self.videos.get(_video_id(bucket_name, filename))
+            held = meta["segments"] if meta else {}
+            end = index
+            while end < last and end + 1 not in held:
+                end += 1
+            return end
+
+    def is_complete(self, bucket_name, filename):
+        with self.lock:
+            meta = self.videos.get(_video_id(bucket_name, filename))
+            return bool(meta) and len(meta["segments"]) == self.segment_count(meta["total"])
+
+    def read_segment(self, bucket_name, filename, index):
+        """Return one verified segment, or None if missing or damaged."""
+        vid = _video_id(bucket_name, filename)
+        with self.lock:
+            meta = self.videos.get(vid)
+            if not meta or index not in meta["segments"]:
+                return None
+            expected = meta["segments"][index]
+            length = min(self.segment_size, meta["total"] - index * self.segment_size)
+            self.videos.move_to_end(vid)
+            meta["used"] = time.time()
+
+        try:
+            with open(self.data_path(bucket_name, filename), "rb") as f:
+                f.seek(index * self.segment_size)
+                data = f.read(length)
+        except OSError:
+            data = b""
+
+        if len(data) != length or _digest(data) != expected:
+            print(f"❌ Cached segment {index} of '{filename}' is damaged, dropping it")
+            with self.lock:
+                if meta["segments"].pop(index, None) is not None:
+                    self.total_bytes -= self.segment_size
+                    meta["verified"] = False
+                    self.dirty.add(vid)
+            return None
+        return data
+
+    # ---------- Store ----------
+    def begin(self, bucket_name, filename, total):
+        """Register a video's size; cached bytes of a different size are discarded."""
+        vid = _video_id(bucket_name, filename)
+        with self.lock:
+            meta = self.videos.get(vid)
+            if meta and meta["total"] == total:
+                return
+            if meta:
+                self._drop(vid)
+            os.makedirs(self._dir(vid), exist_ok=True)
+            open(os.path.join(self._dir(vid), "data.bin"), "ab").close()
+            self.videos[vid] = {
+                "bucket": bucket_name, "file": filename, "total": total,
+                "segment_size": self.segment_size, "segments": {}, "used": time.time(),
+            }
+            self.dirty.add(vid)
+
+    def expect(self, bucket_name, filename, sums):
+        """
+        Take the server's checksums for a video (Server.get_checksums): from
+        now on only segments matching them are stored. Segments already held
+        that don't match, e.g. from an older version of the file, are dropped.
+        False if they were made for another segment size.
+        """
+        if sums["segment_size"] != self.segment_size:
+            return False
+        self.begin(bucket_name, filename, sums["size"])
+        vid = _video_id(bucket_name, filename)
+        with self.lock:
+            meta = self.videos.get(vid)
+            if meta is None:
+                return False
+            expected = sums["segments"]
+            for index, digest in list(meta["segments"].items()):
+                if index >= len(expected) or expected[index] != digest:
+                    del meta["segments"][index]
+                    self.total_bytes -= self.segment_size
+            if meta.get("sha256") != sums["sha256"]:
+                meta["verified"] = False
+            meta["version"] = sums["version"]
+            meta["sha256"] = sums["sha256"]
+            meta["expected"] = expected
+            self.dirty.add(vid)
+        return True
+
+    def forget_checksums(self, bucket_name, filename):
+        """
+        Drop the checksums taken for a video, which may be of an older
+        version, until expect() is given new ones. Held segments stay.
+        """
+        vid = _video_id(bucket_name, filename)
+        with self.lock:
+            meta = self.videos.get(vid)
+            if meta is None:
+                return
+            for field in ("expected", "sha256", "verified", "version"):
+                meta.pop(field, None)
+            self.dirty.add(vid)
+
+    def write_segment(self, bucket_name, filename, index, data):
+        """Store one received segment; False if it isn't the one the server said it would be."""
+        vid = _video_id(bucket_name, filename)
+        with self.lock:
+            meta = self.videos.get(vid)
+            if not meta:
+                return False
+            if index in meta["segments"]:
+                return True
+            expected = min(self.segment_size, meta["total"] - index * self.segment_size)
+            if len(data) != expected:
+                return False
+            digest = _digest(data)
+            if "expected" in meta and meta["expected"][index] != digest:
+                print(f"❌ Segment {index} of '{filename}' doesn't match the server's checksum")
+                return False
+            with open(self.data_path(bucket_name, filename), "r+b") as f:
+                f.seek(index * self.segment_size)
+                f.write(data)
+            meta["segments"][index] = digest
+            meta["used"] = time.time()
+            self.videos.move_to_end(vid)
+            self.total_bytes += self.segment_size
+            self.dirty.add(vid)
+            self._evict(keep=vid)
+
+            # meta.json is rewritten at most once a second while streaming
+            if time.monotonic() - self.last_save > 1.0:
+                self.flush()
+        return True
+
+    def verify_file(self, bucket_name, filename):
+        """
+        True if every segment of the video is held and, when the server sent
+        checksums, the whole file hashes to its SHA-256. A complete video
+        that doesn't is dropped. Hashed once; replays trust the result.
+        """
+        vid = _video_id(bucket_name, filename)
+        with self.lock:
+            meta = self.videos.get(vid)
+            if not meta or len(meta["segments"]) != self.segment_count(meta["total"]):
+                return False
+            if meta.get("verified") or "sha256" not in meta:
+                return True
+            expected, total = meta["sha256"], meta["total"]
+
+        digest = hashlib.sha256()
+        try:
+            with open(self.data_path(bucket_name, filename), "rb") as f:
+                left = total
+                while left:
+                    data = f.read(min(left, 1024 * 1024))
+                    if not data:
+                        break
+                    digest.update(data)
+                    left -= len(data)
+        except OSError:
+            pass
+
+        with self.lock:
+            if self.videos.get(vid) is not meta:
+                return False  # dropped or replaced meanwhile
+            if digest.hexdigest() != expected:
+                print(f"❌ '{filename}' doesn't match the server's checksum, dropping it")
+                self._drop(vid)
+                return False
+            meta["verified"] = True
+            self.dirty.add(vid)
+            self.flush()
+        return True
+
+    def flush(self):
+        """Write meta.json for every video changed since the last save."""
+        with self.lock:
+            for vid in list(self.dirty):
+                meta = self.videos.get(vid)
+                if meta is None:
+                    continue
+                path = os.path.join(self._dir(vid), "meta.json")
+                with open(path + ".tmp", "w") as f:
+                    json.dump(meta, f)
+                os.replace(path + ".tmp", path)
+            self.dirty.clear()
+            self.last_save = time.monotonic()
+
+    # ---------- Eviction ----------
+    def _drop(self, vid):
+        meta = self.videos.pop(vid, None)
+        if meta:
+            self.total_bytes -= self._held_bytes(meta)
+        self.dirty.discard(vid)
+        shutil.rmtree(self._dir(vid), ignore_errors=True)
+
+    def _evict(self, keep=None):
+        for vid in list(self.videos):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if vid != keep:
+                self._drop(vid)
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Cache shared by everything in this client process."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = SegmentCache()
+        return _default_cache
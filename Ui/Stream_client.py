@@ -0,0 +1,529 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+import Config
+from Protocol import recv_exact
+from Ui.Connection_pool import get_pool, set_session_token
+from Ui.Segment_cache import get_default_cache
+
+
+# ---------- Video Receiving ----------
+def receive_video(filename, bucket_name, host="127.0.0.1", port=9999, cache=None,
+                  progress=None, retries=Config.CLIENT_DOWNLOAD_RETRIES):
+    """
+    Download a whole video into the client cache and return its file path,
+    or None if it couldn't be fetched and verified. Segments already cached
+    (by a replay, or by a download cut off earlier, even in another run) are
+    not fetched again; a dropped connection is retried from the first
+    missing segment. Each segment is checked against the server's checksum
+    as it arrives and the finished file against its SHA-256. Checksums the
+    server is still working out are waited for alongside the download, and
+    segments that turn out not to match them are fetched again.
+    progress(received, total, bytes per second) is called after every segment.
+    """
+    cache = cache or get_default_cache()
+    try:
+        sums = get_checksums(filename, bucket_name, cache.segment_size, host, port)
+        waiting = None
+        if sums is not None and sums.get("status") == "pending":
+            # The server reads the video to hash it; download meanwhile and check at the end
+            cache.forget_checksums(bucket_name, filename)
+            found = []
+            waiting = threading.Thread(
+                target=lambda: found.append(wait_for_checksums(
+                    filename, bucket_name, cache.segment_size, host, port
+                )),
+                name="checksums", daemon=True,
+            )
+            waiting.start()
+        elif sums is None or not cache.expect(bucket_name, filename, sums):
+            print(f"⚠️ No checksums for '{filename}', downloading it unverified")
+
+        if not _fetch_missing(cache, filename, bucket_name, host, port, progress, retries):
+            return None
+
+        if waiting is not None:
+            waiting.join()
+            sums = found[0] if found else None
+            if sums is None or not cache.expect(bucket_name, filename, sums):
+                print(f"⚠️ No checksums for '{filename}', keeping it unverified")
+            elif not cache.is_complete(bucket_name, filename):
+                # Segments that didn't match were dropped
+                if not _fetch_missing(cache, filename, bucket_name, host, port, progress, retries):
+                    return None
+
+        cache.flush()
+        if not cache.verify_file(bucket_name, filename):
+            return None
+        return cache.data_path(bucket_name, filename)
+
+    except Exception as e:
+        print(f"❌ Error receiving video: {e}")
+        return None
+
+
+def _fetch_missing(cache, filename, bucket_name, host, port, progress, retries):
+    """Fetch every segment of the video the cache doesn't hold; False if that failed."""
+    total = cache.total_for(bucket_name, filename)
+    if total is None:
+        for _ in fetch_segments(cache, filename, bucket_name, 0, 0, host, port):
+            pass
+        total = cache.total_for(bucket_name, filename)
+        if total is None:
+            print(f"❌ Invalid file size received for '{filename}'")
+            return False
+
+    size = cache.segment_size
+    last = cache.segment_count(total) - 1
+    received = sum(
+        min(size, total - i * size) for i in range(last + 1)
+        if cache.has_segment(bucket_name, filename, i)
+    )
+    # Throughput over the last few seconds, counting only bytes off the network
+    fetched = 0
+    recent = deque([(time.monotonic(), 0)])
+    if progress:
+        progress(received, total, 0.0)
+
+    index, failures = 0, 0
+    while index <= last:
+        if cache.has_segment(bucket_name, filename, index):
+            index += 1
+            continue
+        run_end = cache.missing_run_end(bucket_name, filename, index, last)
+        got = index
+        for got_index, data in fetch_segments(cache, filename, bucket_name, index, run_end, host, port):
+            got = got_index + 1
+            received += len(data)
+            fetched += len(data)
+            now = time.monotonic()
+            recent.append((now, fetched))
+            while len(recent) > 2 and now - recent[0][0] > 3:
+                recent.popleft()
+            if progress:
+                progress(received, total, (fetched - recent[0][1]) / max(now - recent[0][0], 1e-6))
+        if got > index:
+            index, failures = got, 0
+            continue
+
+        failures += 1
+        if failures > retries:
+            print(f"❌ Download of '{filename}' stopped at segment {index}")
+            return False
+        pause = min(0.5 * 2 ** (failures - 1), 8)
+        print(f"🔁 Download of '{filename}' cut off at byte {index * size}, resuming in {pause:.1f}s")
+        time.sleep(pause)
+    return True
+
+
+def get_checksums(filename, bucket_name, segment_size, host="127.0.0.1", port=9999):
+    """
+    The server's {"size", "version", "segment_size", "sha256", "segments"}
+    for a video: its SHA-256 and a BLAKE2b-128 of every segment_size piece.
+    {"status": "pending"} while the server is still working them out (the
+    first ask for a video version starts that), None on error.
+    """
+    reply, error = _json_request(f"CHECKSUMS {bucket_name} {segment_size} {filename}", host, port)
+    if error:
+        print(f"❌ No checksums for '{filename}': {error}")
+    return reply
+
+
+def wait_for_checksums(filename, bucket_name, segment_size, host="127.0.0.1", port=9999,
+                       wait=Config.CLIENT_CHECKSUM_WAIT):
+    """get_checksums, asked again while they are pending, for up to wait seconds; None if they never came."""
+    deadline = time.monotonic() + wait
+    pause = 0.25
+    while True:
+        sums = get_checksums(filename, bucket_name, segment_size, host, port)
+        if sums is None or sums.get("status") != "pending":
+            return sums
+        if time.monotonic() + pause > deadline:
+            print(f"⚠️ Gave up waiting for the checksums of '{filename}'")
+            return None
+        time.sleep(pause)
+        pause = min(pause * 2, 2.0)
+
+
+# ---------- Range Requests ----------
+def request_range(filename, bucket_name, offset, length=0, host="127.0.0.1", port=9999):
+    """
+    Ask the server for length bytes of a video starting at offset (0 = to the end).
+    Returns (offset, length, total, body) where body has socket-style
+    recv()/close(), or None on error. The caller closes the body, which hands
+    the pooled connection back once the range has been read.
+    """
+    try:
+        header, body = get_pool(host, port).request(
+            f"RANGE {bucket_name} {offset} {length} {filename}"
+        )
+    except Exception as e:
+        print(f"❌ Error requesting range of '{filename}': {e}")
+        return None
+
+    text = header.decode(errors="replace")
+    try:
+        fields = [int(text[i:i + 16].strip()) for i in (0, 16, 32)]
+    except ValueError:
+        fields = None
+    if body is None or fields is None:
+        print(f"❌ Range request for '{filename}' failed: {text.strip()}")
+        if body:
+            body.close()
+        return None
+
+    body.expected = fields[1]
+    return fields[0], fields[1], fields[2], body
+
+
+def receive_video_range(filename, bucket_name, offset, length, host="127.0.0.1", port=9999):
+    """Return (total, bytes) for one range of a video, or None on error."""
+    reply = request_range(filename, bucket_name, offset, length, host, port)
+    if not reply:
+        return None
+    _, length, total, body = reply
+    try:
+        data = recv_exact(body, length)
+    except OSError:
+        data = b""
+    finally:
+        body.close()
+    if len(data) < length:
+        print(f"❌ Range of '{filename}' cut short ({len(data)}/{length} bytes)")
+        return None
+    return total, data
+
+
+def fetch_segments(cache, filename, bucket_name, first, last, host="127.0.0.1", port=9999):
+    """
+    Fetch segments first..last with one RANGE request, storing each in the
+    cache as it arrives. Yields (index, bytes); stops early if the connection
+    drops or a segment fails the server's checksum.
+    """
+    size = cache.segment_size
+    reply = request_range(
+        filename, bucket_name, first * size, (last - first + 1) * size, host, port
+    )
+    if not reply:
+        return
+    _, length, total, body = reply
+    cache.begin(bucket_name, filename, total)
+    try:
+        index, received = first, 0
+        while received < length:
+            want = min(size, length - received)
+            try:
+                data = recv_exact(body, want)
+            except OSError:
+                return  # connection dropped; the caller sees a short run
+            if len(data) < want:
+                return
+            if not cache.write_segment(bucket_name, filename, index, data):
+                return  # not what the server's checksums promised: fetch it again
+            yield index, data
+            index += 1
+            received += want
+    finally:
+        body.close()
+
+
+# ---------- Listing ----------
+def list_videos(bucket_name, cursor=None, limit=100, host="127.0.0.1", port=9999):
+    """
+    Return one page of a bucket's listing as (items, next_cursor, total), or
+    None on error. Pass next_cursor back in to get the following page.
+    """
+    try:
+        header, body = get_pool(host, port).request(f"LIST {bucket_name} {cursor or '-'} {limit}")
+    except Exception as e:
+        print(f"❌ Error listing bucket '{bucket_name}': {e}")
+        return None
+    if body is None:
+        print(f"❌ Listing '{bucket_name}' failed: {header.decode(errors='replace')}")
+        return None
+
+    page = json.loads(body.read_all())
+    return page["items"], page["next"], page["total"]
+
+
+# ---------- Catalog ----------
+def catalog_page(bucket_name, cursor=None, limit=Config.CATALOG_PAGE_SIZE, host="127.0.0.1", port=9999):
+    """
+    Return one page of a bucket's titles from the server catalog as
+    (version, [(title, name)], next_cursor), or None on error. version is
+    what to pass to catalog_changes later on.
+    """
+    page, error = _json_request(f"CATALOG {bucket_name} {cursor or '-'} {limit}", host, port)
+    if error:
+        print(f"❌ Error loading catalog of '{bucket_name}': {error}")
+        return None
+    return page["version"], [tuple(row) for row in page["items"]], page["next"]
+
+
+def catalog_changes(bucket_name, since, host="127.0.0.1", port=9999):
+    """
+    Return (version, [(version, op, title, name)]) for what changed in a
+    bucket after version since; op is "add" or "remove". The list is None
+    when the server no longer remembers that far back and the bucket must be
+    reloaded. Returns None on error.
+    """
+    changes = []
+    while True:
+        reply, error = _json_request(f"CATALOG {bucket_name} SINCE {since}", host, port)
+        if error:
+            print(f"❌ Error checking catalog of '{bucket_name}': {error}")
+            return None
+        if reply["changes"] is None:
+            return reply["version"], None
+        changes.extend(tuple(change) for change in reply["changes"])
+        if not reply["more"]:
+            return max([reply["version"], since] + [c[0] for c in changes]), changes
+        since = changes[-1][0]  # a long list comes a batch at a time
+
+
+def search_catalog(query, limit=50, host="127.0.0.1", port=9999):
+    """Titles matching query across every bucket, best first, as [(title, bucket, name)]; None on error."""
+    reply, error = _json_request(f"SEARCH {limit} {query}", host, port)
+    if error:
+        print(f"❌ Error searching for '{query}': {error}")
+        return None
+    return [tuple(row) for row in reply["results"]]
+
+
+def resolve_title(bucket_name, title, host="127.0.0.1", port=9999):
+    """Stored file name of a title in a bucket, or None."""
+    reply, error = _json_request(f"RESOLVE {bucket_name} {title}", host, port)
+    return reply["name"] if reply else None
+
+
+def get_previews(titles, host="127.0.0.1", port=9999):
+    """
+    Previews of [(bucket, file)] as {(bucket, file): (info, poster JPEG or
+    None)}; see Media.Previews for info. Everything is asked for at once on
+    one connection: every PREVIEW, then the POSTER of each that has one.
+    Titles the server doesn't know are left out; None on error.
+    """
+    if not titles:
+        return {}
+    pool = get_pool(host, port)
+    try:
+        conn = pool.acquire()
+    except OSError as e:
+        print(f"❌ Error fetching previews: {e}")
+        return None
+    try:
+        replies = conn.pipeline([f"PREVIEW {bucket_name} {name}" for bucket_name, name in titles])
+        found = {}
+        for title, (_, body) in zip(titles, replies):
+            if body is not None:
+                found[title] = (json.loads(body), None)
+        with_poster = [title for title, (info, _) in found.items() if info.get("poster")]
+        posters = conn.pipeline([f"POSTER {bucket_name} {name}" for bucket_name, name in with_poster])
+    except (OSError, ConnectionError) as e:
+        conn.close()
+        print(f"❌ Error fetching previews: {e}")
+        return None
+    conn.release()
+    for title, (_, poster) in zip(with_poster, posters):
+        found[title] = (found[title][0], poster)
+    return found
+
+
+# ---------- Prefetch ----------
+def request_prefetch(titles, host="127.0.0.1", port=9999):
+    """
+    Ask the server to warm its cache with the start of each (bucket, file)
+    in titles, most likely first. All requests go out at once on one
+    connection; the server does the work in the background.
+    """
+    if not titles:
+        return True
+    pool = get_pool(host, port)
+    try:
+        conn = pool.acquire()
+    except OSError as e:
+        print(f"❌ Error requesting prefetch: {e}")
+        return False
+    try:
+        conn.pipeline([f"PREFETCH {bucket_name} {filename}" for bucket_name, filename in titles])
+    except (OSError, ConnectionError) as e:
+        conn.close()
+        print(f"❌ Error requesting prefetch: {e}")
+        return False
+    conn.release()
+    return True
+
+
+# ---------- Adaptive bitrate ----------
+def get_manifest(filename, bucket_name, host="127.0.0.1", port=9999):
+    """
+    Return the server's rendition manifest for a video (see Media.Packager),
+    or None on error. Asking starts packaging if the video has none yet.
+    """
+    try:
+        header, body = get_pool(host, port).request(f"MANIFEST {bucket_name} {filename}")
+    except Exception as e:
+        print(f"❌ Error fetching manifest of '{filename}': {e}")
+        return None
+    if body is None:
+        print(f"❌ Manifest of '{filename}' failed: {header.decode(errors='replace')}")
+        return None
+    return json.loads(body.read_all())
+
+
+def request_packaging(filename, bucket_name, host="127.0.0.1", port=9999):
+    """Ask the server to cut renditions of a newly added video ahead of its first play."""
+    try:
+        header, body = get_pool(host, port).request(f"PACKAGE {bucket_name} {filename}")
+    except Exception as e:
+        print(f"❌ Error requesting packaging of '{filename}': {e}")
+        return False
+    if body is None:
+        return False
+    body.read_all()
+    return True
+
+
+def request_segment(filename, bucket_name, rendition, index, host="127.0.0.1", port=9999):
+    """
+    Ask for one HLS segment of a rendition. Returns (length, body) like
+    request_range, or None on error; the caller closes the body.
+    """
+    try:
+        header, body = get_pool(host, port).request(
+            f"SEGMENT {bucket_name} {rendition} {index} {filename}"
+        )
+    except Exception as e:
+        print(f"❌ Error requesting segment {index} of '{filename}': {e}")
+        return None
+    try:
+        length = int(header[:16].decode(errors="replace").strip())
+    except ValueError:
+        length = None
+    if body is None or length is None:
+        print(f"❌ Segment {index} of '{filename}' failed: {header.decode(errors='replace').strip()}")
+        if body:
+            body.close()
+        return None
+    body.expected = length
+    return length, body
+
+
+# ---------- Uploading ----------
+def _json_request(command, host, port, data=None):
+    """Send a command whose reply is a JSON body. Returns (reply, None) or (None, error text)."""
+    try:
+        header, body = get_pool(host, port).request(command, data)
+        if body is None:
+            return None, header.decode(errors="replace")
+        # A dropped connection or a cut-off body is an error reply like any other
+        return json.loads(body.read_all()), None
+    except Exception as e:
+        return None, str(e)
+
+
+def upload_video(path, bucket_name, filename, host="127.0.0.1", port=9999,
+                 parallel=Config.UPLOAD_PARALLEL, progress=None, retries=3, title=None):
+    """
+    Upload a local file as bucket_name/filename. Parts go out on several
+    pooled connections at once; each is checked against the server's hash
+    of what it received and resent if they differ or the connection drops.
+    Parts the server already has from an interrupted run are skipped. The
+    file is read once, in order, and hashed as it goes, so at most a few
+    parts are ever in memory. progress(sent, total) is called from the
+    sending threads. Once stored, the server lists the video in its catalog
+    under title (by default the file name without extension). Returns the
+    stored object's {"name", "size", "sha256", "title", "added"}, or None on
+    failure; added is False when the catalog already had the file.
+    """
+    stat = os.stat(path)
+    # Same file, same fingerprint: a later run resumes this upload
+    fingerprint = f"{stat.st_mtime_ns:x}"
+    started, error = _json_request(
+        f"PUT {bucket_name} {stat.st_size} {fingerprint} {filename}", host, port
+    )
+    if error:
+        print(f"❌ Couldn't start upload of '{filename}': {error}")
+        return None
+    upload, part_size = started["upload"], started["part_size"]
+    have = set(started["parts"])
+    total = stat.st_size
+    done = [sum(min(part_size, total - i * part_size) for i in have)]
+    lock = threading.Lock()
+    failures = []
+    work = queue.Queue(maxsize=parallel)
+
+    def send_parts():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            index, data = item
+            expected = hashlib.sha256(data).hexdigest()
+            for attempt in range(retries):
+                reply, error = _json_request(f"PART {upload} {index}", host, port, data)
+                if reply and reply["sha256"] == expected:
+                    break
+            else:
+                with lock:
+                    failures.append(f"part {index}: {error or 'checksum mismatch'}")
+                continue
+            with lock:
+                done[0] += len(data)
+                sent = done[0]
+            if progress:
+                progress(sent, total)
+
+    senders = [threading.Thread(target=send_parts, daemon=True) for _ in range(max(1, parallel))]
+    for sender in senders:
+        sender.start()
+
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            index = 0
+            while True:
+                data = f.read(part_size)
+                if not data and index:
+                    break
+                digest.update(data)
+                if index not in have:
+                    work.put((index, data))
+                index += 1
+                if len(data) < part_size:
+                    break
+    finally:
+        for _ in senders:
+            work.put(None)
+        for sender in senders:
+            sender.join()
+
+    if failures:
+        print(f"❌ Upload of '{filename}' incomplete: {failures[0]}")
+        return None
+    command = f"COMMIT {upload} {digest.hexdigest()}" + (f" {title}" if title else "")
+    stored, error = _json_request(command, host, port)
+    if error:
+        print(f"❌ Couldn't finish upload of '{filename}': {error}")
+        return None
+    return stored
+
+
+# ---------- Accounts ----------
+def login(email, password, register=False, host="127.0.0.1", port=9999):
+    """
+    Log in (or sign up) with the server. On success every connection opened
+    from now on carries the session; returns (email, None), else (None, error
+    text). Blocks while the server hashes the password, so call it off the GUI thread.
+    """
+    command = "REGISTER" if register else "LOGIN"
+    reply, error = _json_request(f"{command} {email} {password}", host, port)
+    if reply is None:
+        return None, error.replace("ERROR: ", "", 1)
+    set_session_token(reply["token"])
+    return reply["email"], None
+
@@ -0,0 +1,42 @@
+import os
+from PyQt5.QtCore import QThread, pyqtSignal
+from Ui.Stream_client import upload_video
+
+
+# ---------- Upload Worker ----------
+class UploadWorker(QThread):
+    """
+    Uploads one file off the GUI thread. The server adds it to the shared
+    catalog only once it has stored the whole, verified file, so the list
+    never shows a video that can't be played.
+    """
+
+    progress = pyqtSignal(object, object)  # bytes sent, total bytes
+    done = pyqtSignal(str, str)            # bucket, title
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, bucket_name, host="127.0.0.1", port=9999, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.bucket_name = bucket_name
+        self.host = host
+        self.port = port
+
+    def run(self):
+        filename = os.path.basename(self.path)
+        title = os.path.splitext(filename)[0]
+        try:
+            stored = upload_video(
+                self.path, self.bucket_name, filename, self.host, self.port,
+                progress=self.progress.emit, title=title,
+            )
+            if stored is None:
+                self.failed.emit(f"Could not upload '{filename}'.")
+                return
+            if not stored["added"]:
+                self.failed.emit(f"'{filename}' was uploaded but is already in the catalog.")
+                return
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.done.emit(self.bucket_name, title)
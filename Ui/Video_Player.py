@@ -0,0 +1,337 @@
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+from PyQt5.QtCore import QThread, pyqtSignal
+import Config
+from Throttle import TokenBucket
+from Ui.Abr import AbrController
+from Ui.Segment_cache import get_default_cache
+from Ui.Stream_client import fetch_segments, get_manifest, request_segment
+
+RANGE_HEADER = re.compile(r"bytes=(\d+)-(\d*)")
+ABR_SEGMENT = re.compile(r"seg_(\d+)\.ts")
+
+
+# ---------- Loopback Proxy ----------
+class _ProxyHandler(BaseHTTPRequestHandler):
+    """
+    Turns VLC's HTTP range requests into RANGE requests to the video server.
+    Segments already in the client cache are answered locally.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.startswith("/abr/"):
+            self._serve_abr()
+            return
+        parts = self.path.lstrip("/").split("/", 1)
+        if len(parts) != 2:
+            self.send_error(404)
+            return
+        bucket_name, filename = unquote(parts[0]), unquote(parts[1])
+
+        start, length = 0, 0
+        match = RANGE_HEADER.match(self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            if match.group(2):
+                length = int(match.group(2)) - start + 1
+
+        try:
+            self._serve(bucket_name, filename, start, length, match)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # VLC seeked elsewhere and dropped this request
+
+    def _serve(self, bucket_name, filename, start, length, match):
+        proxy = self.server.proxy
+        cache = proxy.cache
+        size = cache.segment_size
+
+        total = cache.total_for(bucket_name, filename)
+        if total is None:
+            # First touch of this video: the segment holding start tells us its size
+            index = start // size
+            for _ in proxy.fetch(filename, bucket_name, index, index):
+                pass
+            total = cache.total_for(bucket_name, filename)
+            if total is None:
+                self.send_error(404)
+                return
+        if match and start >= total:
+            self.send_error(416)
+            return
+
+        end = total if length == 0 else min(total, start + length)
+        self._send_headers(start, end - start, total, match)
+
+        index, last = start // size, (end - 1) // size
+        while index <= last:
+            data = cache.read_segment(bucket_name, filename, index)
+            if data is not None:
+                self._write_slice(index * size, data, start, end)
+                index += 1
+                continue
+
+            run_end = cache.missing_run_end(bucket_name, filename, index, last)
+            got = index
+            for got_index, data in proxy.fetch(filename, bucket_name, index, run_end):
+                self._write_slice(got_index * size, data, start, end)
+                got = got_index + 1
+            if got == index:
+                return  # server unreachable; the response simply ends short
+            index = got
+
+    # ---------- Adaptive bitrate ----------
+    def _serve_abr(self):
+        """
+        /abr/<bucket>/<file>/index.m3u8 is one HLS playlist over every
+        rendition; each seg_<n>.ts is fetched from whichever rendition the
+        ABR controller picks at that moment.
+        """
+        parts = self.path.split("/")
+        if len(parts) != 5:
+            self.send_error(404)
+            return
+        bucket_name, filename, leaf = unquote(parts[2]), unquote(parts[3]), parts[4]
+        abr = self.server.proxy.abr.get((bucket_name, filename))
+        if abr is None:
+            self.send_error(404)
+            return
+
+        if leaf == "index.m3u8":
+            body = _playlist(abr.segment_durations()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/vnd.apple.mpegurl")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        match = ABR_SEGMENT.fullmatch(leaf)
+        if not match:
+            self.send_error(404)
+            return
+        rendition = abr.choose()
+        proxy = self.server.proxy
+        started = time.monotonic()
+        reply = request_segment(
+            filename, bucket_name, rendition["name"], int(match.group(1)), proxy.host, proxy.port
+        )
+        if not reply:
+            self.send_error(502)
+            return
+        length, body = reply
+        proxy.rendition_changed(bucket_name, filename, rendition)
+
+        sent = 0
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "video/mp2t")
+            self.send_header("Content-Length", str(length))
+            self.end_headers()
+            while sent < length:
+                data = body.recv(min(256 * 1024, length - sent))
+                if not data:
+                    break
+                self.wfile.write(data)
+                sent += len(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            body.close()
+        if sent == length:
+            abr.record(length, time.monotonic() - started)
+
+    def _write_slice(self, base, data, start, end):
+        lo = max(start - base, 0)
+        hi = min(end - base, len(data))
+        if lo < hi:
+            self.wfile.write(data[lo:hi])
+
+    def _send_headers(self, offset, length, total, match):
+        self.send_response(206 if match else 200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(length))
+        if match:
+            self.send_header("Content-Range", f"bytes {offset}-{offset + length - 1}/{total}")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _playlist(durations):
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{math.ceil(max(durations, default=1))}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+    ]
+    for index, duration in enumerate(durations):
+        lines.append(f"#EXTINF:{duration:.3f},")
+        lines.append(f"seg_{index:05d}.ts")
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+class VideoProxy:
+    """
+    Local HTTP endpoint VLC can play from. Every seek becomes a ranged request,
+    so only the bytes actually watched are fetched, and only once.
+    """
+
+    def __init__(self, host="127.0.0.1", port=9999, cache=None, on_rendition=None):
+        self.host = host
+        self.port = port
+        self.cache = cache or get_default_cache()
+        self.abr = {}  # (bucket, file) -> AbrController for videos played from renditions
+        self.on_rendition = on_rendition  # called with the rendition name when it changes
+        self.current_rendition = {}
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _ProxyHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.proxy = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def fetch(self, filename, bucket_name, first, last):
+        return fetch_segments(self.cache, filename, bucket_name, first, last, self.host, self.port)
+
+    def url_for(self, bucket_name, filename):
+        port = self.httpd.server_address[1]
+        return f"http://127.0.0.1:{port}/{quote(bucket_name, safe='')}/{quote(filename, safe='')}"
+
+    def abr_url_for(self, bucket_name, filename, manifest):
+        """URL of an HLS playlist that switches renditions as throughput changes."""
+        self.abr[(bucket_name, filename)] = AbrController(manifest)
+        port = self.httpd.server_address[1]
+        return (f"http://127.0.0.1:{port}/abr/{quote(bucket_name, safe='')}/"
+                f"{quote(filename, safe='')}/index.m3u8")
+
+    def rendition_changed(self, bucket_name, filename, rendition):
+        key = (bucket_name, filename)
+        if self.current_rendition.get(key) != rendition["name"]:
+            self.current_rendition[key] = rendition["name"]
+            if self.on_rendition:
+                self.on_rendition(rendition["name"])
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.cache.flush()
+
+
+# ---------- Prebuffer Worker ----------
+class PrebufferWorker(QThread):
+    """
+    Makes sure the first few seconds of a video are in the client cache,
+    off the GUI thread. A replay finds them there and is ready at once.
+    """
+
+    progress = pyqtSignal(object, object)  # buffered segments, target segments
+    ready = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, filename, bucket_name, host="127.0.0.1", port=9999,
+                 target=Config.PREBUFFER_BYTES, cache=None, parent=None):
+        super().__init__(parent)
+        self.filename = filename
+        self.bucket_name = bucket_name
+        self.host = host
+        self.port = port
+        self.target = target
+        self.cache = cache or get_default_cache()
+        self.manifest = None  # set when the server has renditions of this video
+
+    def run(self):
+        # Packaged videos play from renditions, starting on the lowest: nothing to prebuffer
+        manifest = get_manifest(self.filename, self.bucket_name, self.host, self.port)
+        if manifest and manifest.get("status") == "ready":
+            self.manifest = manifest
+            self.ready.emit()
+            return
+
+        cache = self.cache
+        count = max(1, cache.segment_count(self.target))
+        total = cache.total_for(self.bucket_name, self.filename)
+        if total is not None:
+            count = min(count, cache.segment_count(total))
+
+        index = 0
+        while index < count:
+            if self.isInterruptionRequested():
+                return
+            if cache.has_segment(self.bucket_name, self.filename, index):
+                index += 1
+                self.progress.emit(index, count)
+                continue
+
+            run_end = cache.missing_run_end(self.bucket_name, self.filename, index, count - 1)
+            got = index
+            for got_index, _ in fetch_segments(
+                cache, self.filename, self.bucket_name, index, run_end, self.host, self.port
+            ):
+                got = got_index + 1
+                self.progress.emit(got, count)
+                if self.isInterruptionRequested():
+                    return
+            if got == index:
+                self.failed.emit(f"Could not fetch '{self.filename}' from server.")
+                return
+            index = got
+
+            # The first reply tells us the real size; short videos need fewer segments
+            total = cache.total_for(self.bucket_name, self.filename)
+            count = min(count, cache.segment_count(total))
+
+        self.ready.emit()
+
+
+# ---------- Prefetch Worker ----------
+class PrefetchWorker(QThread):
+    """
+    Speculatively caches the first seconds of videos the user may pick next
+    (the neighbours of the one playing). Runs at the lowest thread priority
+    and at most CLIENT_PREFETCH_RATE, and is interrupted as soon as the user
+    picks something, so it never holds up a real stream.
+    """
+
+    def __init__(self, titles, host="127.0.0.1", port=9999, target=Config.PREBUFFER_BYTES,
+                 rate=Config.CLIENT_PREFETCH_RATE, cache=None, parent=None):
+        super().__init__(parent)
+        self.titles = titles  # [(bucket_name, filename)], most likely first
+        self.host = host
+        self.port = port
+        self.target = target
+        self.limiter = TokenBucket(rate)
+        self.cache = cache or get_default_cache()
+
+    def run(self):
+        cache = self.cache
+        count = max(1, cache.segment_count(self.target))
+        for bucket_name, filename in self.titles:
+            index = 0
+            while index < count:
+                if self.isInterruptionRequested():
+                    return
+                total = cache.total_for(bucket_name, filename)
+                if total is not None and index >= cache.segment_count(total):
+                    break  # shorter than the target
+                if cache.has_segment(bucket_name, filename, index):
+                    index += 1
+                    continue
+                # One segment per request, so the cap and interruptions act between them
+                self.limiter.take(cache.segment_size)
+                if self.isInterruptionRequested():
+                    return
+                fetched = list(fetch_segments(
+                    cache, filename, bucket_name, index, index, self.host, self.port
+                ))
+                if not fetched:
+                    break  # unreachable or missing; try the next title
+                index += 1
@@ -0,0 +1,373 @@
+import bisect
+from collections import OrderedDict
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QThread, pyqtSignal
+from PyQt5.QtGui import QIcon, QPixmap
+import Config
+from Ui.Stream_client import catalog_changes, catalog_page, get_previews
+
+EMPTY_TEXT = "No videos found 😢"
+
+
+# ---------- Page loader ----------
+class CatalogPageWorker(QThread):
+    """Asks the server for one page of a bucket's catalog off the GUI thread."""
+
+    loaded = pyqtSignal(int, object)  # generation, (version, [(user_name, name)], next cursor)
+    failed = pyqtSignal(int, str)
+
+    def __init__(self, generation, bucket_name, cursor, limit, host, port, parent=None):
+        super().__init__(parent)
+        self.generation = generation
+        self.bucket_name = bucket_name
+        self.cursor = cursor
+        self.limit = limit
+        self.host = host
+        self.port = port
+
+    def run(self):
+        page = catalog_page(self.bucket_name, self.cursor, self.limit, self.host, self.port)
+        if page is None:
+            self.failed.emit(self.generation, f"Could not load '{self.bucket_name}' from the server.")
+            return
+        self.loaded.emit(self.generation, page)
+
+
+class CatalogChangesWorker(QThread):
+    """Asks the server what changed in a bucket since the version on screen."""
+
+    loaded = pyqtSignal(int, object)  # generation, (version, [(version, op, user_name, name)] or None)
+
+    def __init__(self, generation, bucket_name, since, host, port, parent=None):
+        super().__init__(parent)
+        self.generation = generation
+        self.bucket_name = bucket_name
+        self.since = since
+        self.host = host
+        self.port = port
+
+    def run(self):
+        found = catalog_changes(self.bucket_name, self.since, self.host, self.port)
+        if found is not None:
+            self.loaded.emit(self.generation, found)
+
+
+class PreviewWorker(QThread):
+    """Fetches previews (details and poster) of a few rows off the GUI thread."""
+
+    loaded = pyqtSignal(object, object)  # titles asked for, {(bucket, file): (info, poster JPEG or None)}
+    failed = pyqtSignal(object)  # the titles, when the server couldn't be asked
+
+    def __init__(self, titles, host, port, parent=None):
+        super().__init__(parent)
+        self.titles = titles
+        self.host = host
+        self.port = port
+
+    def run(self):
+        found = get_previews(self.titles, self.host, self.port)
+        if found is None:
+            self.failed.emit(self.titles)
+            return
+        self.loaded.emit(self.titles, found)
+
+
+def describe(info):
+    """"1:23 · 720p" from a preview, or "" while there is none."""
+    if not info or info.get("status") != "ready":
+        return ""
+    parts = []
+    if info.get("duration"):
+        minutes, seconds = divmod(int(info["duration"]), 60)
+        hours, minutes = divmod(minutes, 60)
+        parts.append(f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}")
+    if info.get("height"):
+        parts.append(f"{info['height']}p")
+    return "  ·  ".join(parts)
+
+
+# ---------- Model ----------
+class VideoListModel(QAbstractListModel):
+    """
+    Video titles for a QListView. A bucket is read a page at a time as the
+    view scrolls towards the end (canFetchMore/fetchMore), each page on a
+    worker thread, so opening a large bucket never blocks the window and
+    only rows that have been scrolled to are held in memory.
+
+    The catalog lives on the server. refresh() applies only what changed
+    there since the bucket was loaded, so titles added or removed by other
+    clients show up without reloading the list. Each row's details and
+    poster come from the server's previews as the rows arrive; refresh()
+    asks again only for those still being made or whose request failed.
+
+    Qt.UserRole holds (bucket_name, file name) for every real row and None
+    for the "no videos" placeholder.
+    """
+
+    load_failed = pyqtSignal(str)
+    # The first rows of a bucket or search, [(bucket_name, name)], as soon as they are known
+    top_rows = pyqtSignal(object)
+
+    def __init__(self, host="127.0.0.1", port=9999, page_size=Config.CATALOG_PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self.host = host
+        self.port = port
+        self.page_size = page_size
+        self.rows = []            # (label, bucket_name, name)
+        self.bucket_name = None
+        self.cursor = None        # server cursor after the last row loaded
+        self.version = None       # catalog version the rows are up to date with
+        self.exhausted = True
+        self.worker = None
+        self.changes_worker = None
+        self.generation = 0       # bumped on every reset; stale pages are dropped
+        self.empty = False
+        # (bucket, file) -> (info, QIcon or None), kept across resets, least recently shown first
+        self.previews = OrderedDict()
+        self.preview_limit = Config.LIST_PREVIEWS
+        self.requested = set()    # titles a PreviewWorker is fetching
+        self.recheck = set()      # titles to ask for again on refresh: pending or failed
+        self.unknown = set()      # titles the server has no preview for; not asked again
+
+    def _reset(self, bucket_name, rows, exhausted):
+        self.beginResetModel()
+        self.generation += 1
+        self.worker = None
+        self.changes_worker = None
+        self.bucket_name = bucket_name
+        self.rows = rows
+        self.cursor = None
+        self.version = None
+        self.exhausted = exhausted
+        self.empty = exhausted and not rows
+        self.recheck.clear()
+        self.unknown.clear()
+        self.endResetModel()
+
+    def load_bucket(self, bucket_name):
+        """Show a bucket's videos, starting with its first page."""
+        self._reset(bucket_name, [], bucket_name is None)
+        self.fetchMore()
+
+    def set_results(self, results):
+        """Show search results, [(user_name, bucket_name, name)], in the given order."""
+        rows = [(f"{user_name}  ·  {bucket_name}", bucket_name, name)
+                for user_name, bucket_name, name in results]
+        self._reset(None, rows, True)
+        self.top_rows.emit([(bucket_name, name) for _, bucket_name, name in rows])
+        self._fetch_previews(rows)
+
+    # ---------- Qt model interface ----------
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows) or int(self.empty)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if not self.rows:
+            return EMPTY_TEXT if role == Qt.DisplayRole else None
+        label, bucket_name, name = self.rows[index.row()]
+        info, icon = self._preview((bucket_name, name))
+        if role == Qt.DisplayRole:
+            details = describe(info)
+            return f"{label}  ·  {details}" if details else label
+        if role == Qt.DecorationRole:
+            return icon
+        if role == Qt.UserRole:
+            return bucket_name, name
+        return None
+
+    def neighbours(self, row, count):
+        """(bucket_name, name) of up to count rows on each side of row, nearest first."""
+        found = []
+        for distance in range(1, count + 1):
+            for other in (row + distance, row - distance):
+                if 0 <= other < len(self.rows):
+                    _, bucket_name, name = self.rows[other]
+                    found.append((bucket_name, name))
+        return found
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted and self.worker is None
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        worker = CatalogPageWorker(
+            self.generation, self.bucket_name, self.cursor, self.page_size,
+            self.host, self.port, parent=self
+        )
+        worker.loaded.connect(self._page_loaded)
+        worker.failed.connect(self._page_failed)
+        worker.finished.connect(worker.deleteLater)
+        self.worker = worker
+        worker.start()
+
+    def _page_loaded(self, generation, loaded):
+        if generation != self.generation:
+            return  # another bucket or search was shown meanwhile
+        self.worker = None
+        version, page, self.cursor = loaded
+        if self.version is None:
+            self.version = version  # later pages are caught up by refresh()
+        if self.cursor is None:
+            self.exhausted = True
+
+        if not page:
+            if not self.rows:
+                self.beginInsertRows(QModelIndex(), 0, 0)
+                self.empty = True
+                self.endInsertRows()
+            return
+
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+        self.rows.extend((user_name, self.bucket_name, name) for user_name, name in page)
+        self.endInsertRows()
+        if first == 0:
+            self.top_rows.emit([(self.bucket_name, name) for _, name in page])
+        self._fetch_previews(self.rows[first:])
+
+    def _page_failed(self, generation, message):
+        if generation != self.generation:
+            return
+        self.worker = None
+        self.exhausted = True
+        self.load_failed.emit(message)
+
+    # ---------- Previews ----------
+    def _preview(self, title):
+        """(info, icon) of a title, or (None, None); marks it as recently shown."""
+        found = self.previews.get(title)
+        if found is None:
+            return None, None
+        self.previews.move_to_end(title)
+        return found
+
+    def _fetch_previews(self, rows, only=None):
+        """
+        Ask for the previews of rows not known yet, or still being made on the
+        server; with only, just for those of the rows in it. Titles already
+        asked for, or that the server doesn't know, are skipped.
+        """
+        titles = []
+        for _, bucket_name, name in rows:
+            title = (bucket_name, name)
+            if title in self.requested or title in self.unknown:
+                continue
+            if only is not None and title not in only:
+                continue
+            info, _ = self.previews.get(title, (None, None))
+            if info is None or info.get("status") == "pending":
+                titles.append(title)
+        if not titles:
+            return
+        self.requested.update(titles)
+        self.recheck.difference_update(titles)
+        worker = PreviewWorker(titles, self.host, self.port, parent=self)
+        worker.loaded.connect(self._previews_loaded)
+        worker.failed.connect(self._previews_failed)
+        worker.finished.connect(worker.deleteLater)
+        worker.start()
+
+    def _previews_failed(self, titles):
+        self.requested.difference_update(titles)
+        self.recheck.update(titles)
+
+    def _previews_loaded(self, titles, found):
+        self.requested.difference_update(titles)
+        for title in titles:
+            if title not in found:
+                self.unknown.add(title)
+        for title, (info, poster) in found.items():
+            icon = None
+            if poster:
+                pixmap = QPixmap()
+                if pixmap.loadFromData(poster, "JPEG"):
+                    icon = QIcon(pixmap)
+            self.previews[title] = (info, icon)
+            self.previews.move_to_end(title)
+            if info.get("status") == "pending":
+                self.recheck.add(title)
+        while len(self.previews) > self.preview_limit:
+            self.previews.popitem(last=False)
+        if self.rows:
+            self.dataChanged.emit(
+                self.index(0), self.index(len(self.rows) - 1),
+                [Qt.DisplayRole, Qt.DecorationRole],
+            )
+
+    # ---------- Catalog changes ----------
+    def refresh(self):
+        """
+        Bring the loaded rows up to date with the server catalog, and pick up
+        previews finished since, in the background.
+        """
+        if self.recheck:
+            self._fetch_previews(self.rows, only=self.recheck)
+        if self.bucket_name is None or self.version is None \
+                or self.worker is not None or self.changes_worker is not None:
+            return
+        worker = CatalogChangesWorker(
+            self.generation, self.bucket_name, self.version, self.host, self.port, parent=self
+        )
+        worker.loaded.connect(self._changes_loaded)
+        worker.finished.connect(lambda: self._changes_finished(worker))
+        worker.finished.connect(worker.deleteLater)
+        self.changes_worker = worker
+        worker.start()
+
+    def _changes_finished(self, worker):
+        if worker is self.changes_worker:
+            self.changes_worker = None
+
+    def _changes_loaded(self, generation, found):
+        if generation != self.generation:
+            return
+        version, changes = found
+        if changes is None:
+            self.load_bucket(self.bucket_name)  # too far behind for a delta
+            return
+        added = set()
+        for _, op, user_name, name in changes:
+            title = (self.bucket_name, name)
+            if op == "add":
+                # New, or uploaded again: either way the server has a new preview coming
+                self.unknown.discard(title)
+                self.previews.pop(title, None)
+                added.add(title)
+                self._insert_row(user_name, name)
+            else:
+                added.discard(title)
+                self.recheck.discard(title)
+                self._remove_row(name)
+        self.version = version
+        if added:
+            self._fetch_previews(self.rows, only=added)
+
+    def _insert_row(self, user_name, name):
+        if any(row[2] == name for row in self.rows):
+            return
+        keys = [(label, row_name) for label, _, row_name in self.rows]
+        at = bisect.bisect_left(keys, (user_name, name))
+        if at == len(self.rows) and not self.exhausted:
+            return  # sorts after the loaded rows; it arrives with a later page
+        if self.empty:
+            self._reset(self.bucket_name, [(user_name, self.bucket_name, name)], self.exhausted)
+            return
+        self.beginInsertRows(QModelIndex(), at, at)
+        self.rows.insert(at, (user_name, self.bucket_name, name))
+        self.endInsertRows()
+
+    def _remove_row(self, name):
+        for at, row in enumerate(self.rows):
+            if row[2] == name:
+                self.beginRemoveRows(QModelIndex(), at, at)
+                del self.rows[at]
+                self.endRemoveRows()
+                if not self.rows and self.exhausted:
+                    self.beginInsertRows(QModelIndex(), 0, 0)
+                    self.empty = True
+                    self.endInsertRows()
+                return